@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Admission control для Age-bot API
+
+Ограничивает число одновременно выполняемых запросов процесса (всего и
+по маршрутам), держит ограниченную очередь ожидания с дедлайнами и сразу
+отвечает 503 + Retry-After, если очередь заполнена. Дешёвые оценки возраста
+имеют приоритет над коллажами: при полной очереди запрос с более высоким
+приоритетом вытесняет из неё самый низкоприоритетный.
+
+Переменные окружения:
+    ADMISSION_MAX_ACTIVE=4                  - одновременных запросов на процесс
+    ADMISSION_LIMITS=estimate=4,collage=1   - одновременных запросов по маршрутам
+    ADMISSION_QUEUE_SIZE=8                  - мест в очереди ожидания
+    ADMISSION_MAX_WAIT=estimate=5,collage=20 - сколько секунд можно ждать в очереди
+    ADMISSION_RETRY_AFTER=2                 - Retry-After в ответе 503, секунд
+"""
+
+import os
+import heapq
+import itertools
+import threading
+import time
+from functools import wraps
+
+from flask import jsonify
+
+# Меньше - важнее
+ROUTE_PRIORITIES = {'estimate': 0, 'collage': 1}
+
+
+def parse_route_values(value, cast=int):
+    """"estimate=4,collage=1" -> {'estimate': 4, 'collage': 1}"""
+    result = {}
+    for item in value.split(','):
+        if '=' in item:
+            route, number = item.split('=', 1)
+            result[route.strip()] = cast(number)
+    return result
+
+
+class _Waiter:
+    __slots__ = ('route', 'priority', 'seq', 'admitted', 'shed')
+
+    def __init__(self, route, priority, seq):
+        self.route = route
+        self.priority = priority
+        self.seq = seq
+        self.admitted = False
+        self.shed = False
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class AdmissionController:
+    """Лимиты одновременных запросов, приоритетная очередь и сброс нагрузки"""
+
+    def __init__(self, max_active, route_limits, queue_size, max_wait, retry_after,
+                 priorities=None):
+        self.max_active = max_active
+        self.route_limits = route_limits
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.retry_after = retry_after
+        self.priorities = priorities or ROUTE_PRIORITIES
+
+        self._cond = threading.Condition()
+        self._queue = []  # heap _Waiter
+        self._seq = itertools.count()
+        self._active = 0
+        self._route_active = {}
+        self._stats = {}
+        self._max_queue_depth = 0
+
+    def _route_stats(self, route):
+        stats = self._stats.get(route)
+        if stats is None:
+            stats = self._stats[route] = {
+                'admitted': 0, 'queued': 0, 'shed_queue_full': 0, 'shed_timeout': 0, 'shed_evicted': 0,
+            }
+        return stats
+
+    def _can_run(self, route):
+        limit = self.route_limits.get(route)
+        return (self._active < self.max_active
+                and (limit is None or self._route_active.get(route, 0) < limit))
+
+    def _start(self, route):
+        self._active += 1
+        self._route_active[route] = self._route_active.get(route, 0) + 1
+        self._route_stats(route)['admitted'] += 1
+
+    def _dispatch(self):
+        """Запуск ожидающих по приоритету, пока есть свободные слоты"""
+        for waiter in sorted(self._queue):
+            if self._can_run(waiter.route):
+                waiter.admitted = True
+                self._queue.remove(waiter)
+                self._start(waiter.route)
+        heapq.heapify(self._queue)
+        self._cond.notify_all()
+
+    def acquire(self, route):
+        """True - запрос допущен (обязателен release), False - сброшен"""
+        priority = self.priorities.get(route, max(self.priorities.values(), default=0) + 1)
+        with self._cond:
+            stats = self._route_stats(route)
+            better_waiting = any(w.priority <= priority and self._can_run(w.route) for w in self._queue)
+            if not better_waiting and self._can_run(route):
+                self._start(route)
+                return True
+
+            if len(self._queue) >= self.queue_size:
+                worst = max(self._queue, default=None)
+                if worst is None or worst.priority <= priority:
+                    stats['shed_queue_full'] += 1
+                    return False
+                # Вытесняем менее важный запрос (коллаж) ради оценки возраста
+                worst.shed = True
+                self._queue.remove(worst)
+                heapq.heapify(self._queue)
+                self._route_stats(worst.route)['shed_evicted'] += 1
+                self._cond.notify_all()
+
+            waiter = _Waiter(route, priority, next(self._seq))
+            heapq.heappush(self._queue, waiter)
+            stats['queued'] += 1
+            self._max_queue_depth = max(self._max_queue_depth, len(self._queue))
+
+            deadline = time.monotonic() + self.max_wait.get(route, 10)
+            while not waiter.admitted and not waiter.shed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._queue.remove(waiter)
+                    heapq.heapify(self._queue)
+                    stats['shed_timeout'] += 1
+                    return False
+                self._cond.wait(remaining)
+            return waiter.admitted
+
+    def release(self, route):
+        with self._cond:
+            self._active -= 1
+            self._route_active[route] -= 1
+            self._dispatch()
+
+    def limit(self, route):
+        """Декоратор Flask endpoint: 503 + Retry-After, если запрос не допущен"""
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.acquire(route):
+                    response = jsonify({
+                        'success': False,
+                        'error': 'Service overloaded, retry later',
+                        'retryAfter': self.retry_after,
+                    })
+                    response.headers['Retry-After'] = str(self.retry_after)
+                    return response, 503
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.release(route)
+            return wrapper
+        return decorator
+
+    def get_metrics(self):
+        with self._cond:
+            routes = {}
+            for route, stats in self._stats.items():
+                routes[route] = dict(
+                    stats,
+                    active=self._route_active.get(route, 0),
+                    waiting=sum(1 for w in self._queue if w.route == route),
+                    limit=self.route_limits.get(route),
+                )
+            return {
+                'active': self._active,
+                'max_active': self.max_active,
+                'queue_depth': len(self._queue),
+                'max_queue_depth': self._max_queue_depth,
+                'queue_size': self.queue_size,
+                'routes': routes,
+            }
+
+
+def create_admission_controller():
+    """AdmissionController из переменных окружения"""
+    return AdmissionController(
+        max_active=int(os.environ.get('ADMISSION_MAX_ACTIVE', '4')),
+        route_limits=parse_route_values(os.environ.get('ADMISSION_LIMITS', 'estimate=4,collage=1')),
+        queue_size=int(os.environ.get('ADMISSION_QUEUE_SIZE', '8')),
+        max_wait=parse_route_values(os.environ.get('ADMISSION_MAX_WAIT', 'estimate=5,collage=20'), float),
+        retry_after=int(os.environ.get('ADMISSION_RETRY_AFTER', '2')),
+    )
@@ -6,15 +6,32 @@ Flask API для определения возраста по фотографи
 """
 
 import os
+import time
+
+# Момент старта импорта воркера - для замера времени запуска
+_startup_started = time.perf_counter()
+
+# Бюджет ядер воркера: лимиты потоков BLAS/OpenMP должны попасть
+# в окружение до импорта numpy (см. cpu_budget.py)
+import cpu_budget
+from tuning import profile as tuned
+
 import base64
+import hashlib
 import io
+import threading
 import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import requests
 from datetime import datetime
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from PIL import Image, ImageDraw, ImageFont
-from insightface.app import FaceAnalysis
+
+from admission import create_admission_controller
+from rate_limit import create_rate_limiter
+from shadow import create_shadow_runner
 
 app = Flask(__name__)
 CORS(app)  # Разрешаем CORS для фронтенда
@@ -24,37 +41,165 @@ FACEPP_API_KEY = os.environ.get('FACEPP_API_KEY', '')
 FACEPP_API_SECRET = os.environ.get('FACEPP_API_SECRET', '')
 FACEPP_API_URL = 'https://api-us.faceplusplus.com/facepp/v3/detect'
 
-# InsightFace app (fallback)
-face_app = None
-model_loaded = False
-use_facepp = bool(FACEPP_API_KEY and FACEPP_API_SECRET)
+# InsightFace загружается лениво: при настроенном Face++ только при первом
+# fallback. PRELOAD_INSIGHTFACE=1 загружает и прогревает его сразу при старте.
+PRELOAD_INSIGHTFACE = os.environ.get('PRELOAD_INSIGHTFACE', '0') == '1'
+WARMUP_ENABLED = os.environ.get('WARMUP', '1') == '1'
 
-def load_insightface_model():
-    """Загрузка InsightFace модели для определения возраста (fallback если Face++ недоступен)"""
-    global face_app, model_loaded, use_facepp
+# Сколько потоков воркера одновременно выполняют локальный inference
+# (в gthread режиме остальные ждут, а не делят ядра CPU между собой)
+INFERENCE_CONCURRENCY = tuned['inference_concurrency']
+inference_semaphore = threading.BoundedSemaphore(INFERENCE_CONCURRENCY)
+
+# Кэш оценок по sha256 байтов фото: фото "До" переиспользуется во многих сравнениях
+AGE_CACHE_SIZE = int(os.environ.get('AGE_CACHE_SIZE', '512'))
+age_cache = OrderedDict()
+age_cache_lock = threading.Lock()
+age_cache_stats = {'hits': 0, 'misses': 0}
+
+# Пул для параллельной обработки пары фото (Face++ HTTP и ONNX Runtime отпускают GIL)
+pair_executor = ThreadPoolExecutor(max_workers=tuned['pair_workers'], thread_name_prefix='age-pair')
+
+# Лимиты одновременных запросов и сброс нагрузки (оценка возраста важнее коллажа)
+admission = create_admission_controller()
+
+# Token bucket на клиента (реальный IP из-за Cloudflare/nginx или user id), общий для воркеров
+rate_limiter = create_rate_limiter()
+
+# Shadow-режим: выборка запросов копируется во вторичный бэкенд (SHADOW_SAMPLE_RATE)
+# в отдельном процессе, занимая свободный слот inference_semaphore
+shadow = create_shadow_runner(gate=inference_semaphore)
+
+# Время старта воркера и первого запроса (отдаётся в /health)
+startup_stats = {
+    'startup_ms': None,
+    'model_load_ms': None,
+    'warmup_ms': None,
+    'first_request_ms': None,
+}
+
+def load_face_app():
+    """Импорт InsightFace и загрузка buffalo_l (только когда провайдер реально нужен)"""
+    try:
+        t0 = time.perf_counter()
+        print('🔄 Loading InsightFace buffalo_l model...')
+        # Тяжёлый импорт (onnxruntime, skimage, ...) - только здесь.
+        # Загружаются только detection + genderage, размер входа детектора
+        # подбирается адаптивно (см. insightface_provider)
+        from insightface_provider import create_adaptive_face_app
+        # (все размеры прогреваются в warmup_face_app)
+        app_instance = create_adaptive_face_app(
+            det_sizes=tuned['det_sizes'], warmup=False,
+            intra_op_threads=cpu_budget.layout['ort_intra_op_threads'])
+        cpu_budget.configure_opencv(cpu_budget.layout['opencv_threads'])
+        load_ms = (time.perf_counter() - t0) * 1000
+        startup_stats['model_load_ms'] = round(load_ms, 1)
+        print(f'✅ InsightFace buffalo_l model loaded in {load_ms:.0f} ms')
+        return app_instance
+    except Exception as e:
+        print(f'❌ Failed to load InsightFace model: {e}')
+        import traceback
+        traceback.print_exc()
+        return None
+
+def warmup_face_app(app_instance):
+    """
+    Прогрев InsightFace: dummy inference каждой загруженной модели
+    
+    Первый run в ONNX Runtime платит за ленивую инициализацию и выбор
+    ядер - пусть это произойдёт до того, как воркер начнёт принимать запросы.
+    """
+    t0 = time.perf_counter()
+    for taskname, model in app_instance.models.items():
+        try:
+            if taskname == 'detection':
+                # Все размеры входа детектора
+                app_instance.prepare_shapes()
+                continue
+            model_input = model.session.get_inputs()[0]
+            shape = [dim if isinstance(dim, int) else 1 for dim in model_input.shape]
+            model.session.run(None, {model_input.name: np.zeros(shape, dtype=np.float32)})
+        except Exception as e:
+            print(f'⚠️ Warmup of {taskname} failed: {e}')
+    warmup_ms = (time.perf_counter() - t0) * 1000
+    startup_stats['warmup_ms'] = round(warmup_ms, 1)
+    print(f'🔥 InsightFace warmup done in {warmup_ms:.0f} ms')
+
+class ProviderState:
+    """
+    Состояние провайдеров воркера, общее для всех его потоков (gthread)
+    
+    Face++ отключается сразу для всех потоков, а InsightFace загружается
+    и прогревается ровно один раз, даже если первые запросы пришли одновременно.
+    Модель одна на процесс: ONNX Runtime сессии потокобезопасны для run.
+    """
+    
+    def __init__(self, use_facepp):
+        self._lock = threading.Lock()
+        self._use_facepp = use_facepp
+        self._model_loaded = False
+        self._face_app = None
+        self._face_app_load_failed = False
+        self._face_app_warmed = False
+    
+    @property
+    def use_facepp(self):
+        return self._use_facepp
+    
+    @property
+    def model_loaded(self):
+        return self._model_loaded
+    
+    @property
+    def face_app(self):
+        return self._face_app
     
+    def disable_facepp(self):
+        """Переключение на InsightFace fallback (до перезапуска воркера)"""
+        with self._lock:
+            self._use_facepp = False
+    
+    def set_ready(self, use_facepp):
+        with self._lock:
+            self._use_facepp = use_facepp
+            self._model_loaded = True
+    
+    def get_face_app(self):
+        """InsightFace для fallback: загружается и прогревается при первом обращении"""
+        if self._face_app_warmed or self._face_app_load_failed:
+            return self._face_app
+        with self._lock:
+            if self._face_app is None and not self._face_app_load_failed:
+                self._face_app = load_face_app()
+                self._face_app_load_failed = self._face_app is None
+            if self._face_app is not None and not self._face_app_warmed:
+                if WARMUP_ENABLED:
+                    warmup_face_app(self._face_app)
+                self._face_app_warmed = True
+            return self._face_app
+
+state = ProviderState(use_facepp=bool(FACEPP_API_KEY and FACEPP_API_SECRET))
+
+def load_insightface_model():
+    """Инициализация провайдеров определения возраста (Face++ primary, InsightFace fallback)"""
     # Проверяем Face++ credentials
     if FACEPP_API_KEY and FACEPP_API_SECRET:
         print('✅ Face++ API configured (primary method)')
         print(f'   API Key: {FACEPP_API_KEY[:8]}...')
-        model_loaded = True
-        use_facepp = True
+        state.set_ready(use_facepp=True)
+        if PRELOAD_INSIGHTFACE:
+            state.get_face_app()
+        else:
+            print('⏭️ InsightFace fallback will be loaded on first use')
         return True
     
     # Fallback на InsightFace если Face++ недоступен
-    try:
-        print('⚠️ Face++ not configured, loading InsightFace as fallback...')
-        face_app = FaceAnalysis(name='buffalo_l', providers=['CPUExecutionProvider'])
-        face_app.prepare(ctx_id=-1, det_size=(640, 640))
-        model_loaded = True
-        use_facepp = False
-        print('✅ InsightFace buffalo_l model loaded successfully (fallback method)')
-        return True
-    except Exception as e:
-        print(f'❌ Failed to load InsightFace model: {e}')
-        import traceback
-        traceback.print_exc()
+    print('⚠️ Face++ not configured, loading InsightFace as fallback...')
+    if state.get_face_app() is None:
         return False
+    state.set_ready(use_facepp=False)
+    print('✅ InsightFace buffalo_l model ready (fallback method)')
+    return True
 
 def estimate_age(image):
     """
@@ -63,10 +208,8 @@ def estimate_age(image):
     
     Возвращает: возраст (int) или None при ошибке
     """
-    global use_facepp
-    
     # Метод 1: Face++ API (предпочтительный)
-    if use_facepp:
+    if state.use_facepp:
         try:
             print('🔍 Using Face++ API for age estimation...')
             
@@ -75,11 +218,11 @@ def estimate_age(image):
             if isinstance(image, Image.Image):
                 if image.mode != 'RGB':
                     image = image.convert('RGB')
-                image.save(img_buffer, format='JPEG', quality=95)
+                image.save(img_buffer, format='JPEG', quality=tuned['facepp_jpeg_quality'])
             else:
                 # Если numpy array, конвертируем через PIL
                 img_pil = Image.fromarray(image)
-                img_pil.save(img_buffer, format='JPEG', quality=95)
+                img_pil.save(img_buffer, format='JPEG', quality=tuned['facepp_jpeg_quality'])
             
             img_buffer.seek(0)
             image_bytes = img_buffer.read()
@@ -98,14 +241,14 @@ def estimate_age(image):
             
             if response.status_code != 200:
                 print(f'⚠️ Face++ API error: {response.status_code}, falling back to InsightFace')
-                use_facepp = False  # Временно переключаемся на fallback
+                state.disable_facepp()  # Временно переключаемся на fallback
                 return estimate_age(image)  # Retry with InsightFace
             
             result = response.json()
             
             if 'error_message' in result:
                 print(f'⚠️ Face++ error: {result["error_message"]}, falling back')
-                use_facepp = False
+                state.disable_facepp()
                 return estimate_age(image)
             
             if 'faces' not in result or len(result['faces']) == 0:
@@ -121,10 +264,11 @@ def estimate_age(image):
             
         except Exception as e:
             print(f'❌ Face++ error: {e}, falling back to InsightFace')
-            use_facepp = False
+            state.disable_facepp()
             # Продолжаем с InsightFace fallback
     
-    # Метод 2: InsightFace (fallback)
+    # Метод 2: InsightFace (fallback), загружается при первом обращении
+    face_app = state.get_face_app()
     if face_app is None:
         print('❌ No age estimation method available')
         return None
@@ -143,7 +287,8 @@ def estimate_age(image):
         img_bgr = img_array[:, :, ::-1]
         print(f'📸 Input shape: {img_bgr.shape}')
         
-        faces = face_app.get(img_bgr)
+        with inference_semaphore:
+            faces = face_app.get(img_bgr)
         
         if len(faces) == 0:
             print('⚠️ No face detected by InsightFace')
@@ -161,17 +306,107 @@ def estimate_age(image):
         traceback.print_exc()
         return None
 
+def decode_base64_image(image_data):
+    """Байты изображения из base64 (с data:image prefix или без)"""
+    if ',' in image_data:
+        image_data = image_data.split(',')[1]
+    return base64.b64decode(image_data)
+
+def open_rgb_image(image_bytes, draft_size=None):
+    """
+    PIL RGB изображение из байтов
+    
+    draft_size: JPEG декодируется сразу в уменьшенном масштабе (1/2, 1/4, 1/8),
+    но так, чтобы обе стороны остались не меньше draft_size
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    if draft_size:
+        image.draft('RGB', (draft_size, draft_size))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image
+
+def get_cached_age(key):
+    with age_cache_lock:
+        age = age_cache.get(key)
+        if age is None:
+            age_cache_stats['misses'] += 1
+            return None
+        age_cache.move_to_end(key)
+        age_cache_stats['hits'] += 1
+        return age
+
+def put_cached_age(key, age):
+    if AGE_CACHE_SIZE <= 0:
+        return
+    with age_cache_lock:
+        age_cache[key] = age
+        age_cache.move_to_end(key)
+        while len(age_cache) > AGE_CACHE_SIZE:
+            age_cache.popitem(last=False)
+
+def estimate_age_from_bytes(image_bytes):
+    """
+    Определение возраста по байтам фото с кэшем по sha256
+    
+    При попадании в кэш фото даже не декодируется.
+    Возвращает: (возраст или None, взят ли результат из кэша)
+    """
+    key = hashlib.sha256(image_bytes).hexdigest()
+    age = get_cached_age(key)
+    if age is not None:
+        print(f'♻️ Cached age: {age}')
+        return age, True
+    
+    image = open_rgb_image(image_bytes, draft_size=tuned['inference_decode_size'])
+    t0 = time.perf_counter()
+    age = estimate_age(image)
+    primary_ms = (time.perf_counter() - t0) * 1000
+    # Копия во вторичный бэкенд уходит в фоновый пул - ответ её не ждёт
+    shadow.submit(image, key, 'facepp' if state.use_facepp else 'insightface', age, primary_ms)
+    # Неудачные оценки не кэшируем - следующий запрос попробует снова
+    if age is not None:
+        put_cached_age(key, age)
+    return age, False
+
+def log_first_request(request_started):
+    """Логируем задержку первого запроса воркера (после прогрева должна быть обычной)"""
+    if startup_stats['first_request_ms'] is None:
+        first_ms = (time.perf_counter() - request_started) * 1000
+        startup_stats['first_request_ms'] = round(first_ms, 1)
+        print(f'⏱️ First request latency: {first_ms:.0f} ms')
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Проверка здоровья сервиса"""
-    provider = 'Face++ API' if use_facepp else 'InsightFace (fallback)'
+    provider = 'Face++ API' if state.use_facepp else 'InsightFace (fallback)'
+    face_app = state.face_app
     return jsonify({
         'status': 'ok',
-        'model_loaded': model_loaded,
-        'provider': provider
+        'model_loaded': state.model_loaded,
+        'provider': provider,
+        'insightface_loaded': face_app is not None,
+        'inference_concurrency': INFERENCE_CONCURRENCY,
+        'cpu_layout': cpu_budget.layout,
+        'tuning': tuned,
+        'det_size_stats': face_app.get_stats() if face_app is not None else None,
+        'age_cache': dict(age_cache_stats, size=len(age_cache)),
+        'startup': startup_stats
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Метрики воркера: очередь admission control, сброшенные и ограниченные запросы, кэш"""
+    return jsonify({
+        'admission': admission.get_metrics(),
+        'rate_limit': rate_limiter.get_metrics(),
+        'shadow': shadow.get_metrics(),
+        'age_cache': dict(age_cache_stats, size=len(age_cache)),
     })
 
 @app.route('/api/estimate-age', methods=['POST'])
+@rate_limiter.limit('estimate')
+@admission.limit('estimate')
 def estimate_age_endpoint():
     """
     Endpoint для определения возраста
@@ -187,6 +422,7 @@ def estimate_age_endpoint():
         "confidence": 0.95
     }
     """
+    request_started = time.perf_counter()
     try:
         # Получаем данные
         data = request.get_json()
@@ -194,23 +430,12 @@ def estimate_age_endpoint():
         if not data or 'image' not in data:
             return jsonify({'error': 'No image provided'}), 400
         
-        # Декодируем base64 изображение
-        image_data = data['image']
+        # Декодируем base64 изображение (data:image prefix убирается)
+        image_bytes = decode_base64_image(data['image'])
         
-        # Убираем data:image prefix если есть
-        if ',' in image_data:
-            image_data = image_data.split(',')[1]
-        
-        # Декодируем
-        image_bytes = base64.b64decode(image_data)
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        # Конвертируем в RGB если нужно
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Определяем возраст
-        age = estimate_age(image)
+        # Определяем возраст (повторное фото берётся из кэша)
+        age, _ = estimate_age_from_bytes(image_bytes)
+        log_first_request(request_started)
         
         if age is None:
             return jsonify({
@@ -231,7 +456,74 @@ def estimate_age_endpoint():
         print(f'❌ Error processing request: {e}')
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/estimate-age/pair', methods=['POST'])
+@rate_limiter.limit('estimate')
+@admission.limit('estimate')
+def estimate_age_pair_endpoint():
+    """
+    Возраст по паре фото "До" / "После" за один запрос
+    
+    Фото декодируются и оцениваются параллельно, одинаковые фото -
+    один раз; результаты кэшируются по содержимому фото.
+    
+    Request JSON:
+    {
+        "before": "base64_encoded_image_data",
+        "after": "base64_encoded_image_data"
+    }
+    
+    Response JSON:
+    {
+        "ageBefore": 38,
+        "ageAfter": 35,
+        "delta": -3
+    }
+    """
+    request_started = time.perf_counter()
+    try:
+        data = request.get_json()
+        
+        if not data or not data.get('before') or not data.get('after'):
+            return jsonify({'error': 'Both before and after images are required'}), 400
+        
+        before_bytes = decode_base64_image(data['before'])
+        after_bytes = decode_base64_image(data['after'])
+        
+        if before_bytes == after_bytes:
+            age_before, cached_before = estimate_age_from_bytes(before_bytes)
+            age_after, cached_after = age_before, cached_before
+        else:
+            after_future = pair_executor.submit(estimate_age_from_bytes, after_bytes)
+            age_before, cached_before = estimate_age_from_bytes(before_bytes)
+            age_after, cached_after = after_future.result()
+        log_first_request(request_started)
+        
+        if age_before is None or age_after is None:
+            return jsonify({
+                'success': False,
+                'message': 'Failed to estimate age',
+                'ageBefore': age_before,
+                'ageAfter': age_after,
+                'delta': None
+            }), 500
+        
+        return jsonify({
+            'success': True,
+            'ageBefore': age_before,
+            'ageAfter': age_after,
+            'delta': age_after - age_before,
+            'cached': {'before': cached_before, 'after': cached_after},
+            'confidence': 0.95,
+            'status': 'success'
+        })
+        
+    except Exception as e:
+        print(f'❌ Error processing pair request: {e}')
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/create-collage', methods=['POST'])
+@rate_limiter.limit('collage')
+@admission.limit('collage')
 def create_collage():
     """
     Создание коллажа из загруженных фотографий
@@ -269,7 +561,10 @@ def create_collage():
         
         print(f'📸 Processing {len(rows)} photo rows for collage...')
         
-        # Декодируем изображения из rows
+        # Декодируем изображения из rows (JPEG можно декодировать сразу
+        # в уменьшенном масштабе - в коллаже фото всё равно photo_size)
+        photo_size = tuned['collage_photo_size']
+        decode_draft_size = photo_size if tuned['collage_decode_draft'] else None
         before_images = []
         after_images = []
         
@@ -278,12 +573,7 @@ def create_collage():
             before_base64 = row.get('beforePhoto')
             if before_base64:
                 try:
-                    if ',' in before_base64:
-                        before_base64 = before_base64.split(',')[1]
-                    img_bytes = base64.b64decode(before_base64)
-                    img = Image.open(io.BytesIO(img_bytes))
-                    if img.mode != 'RGB':
-                        img = img.convert('RGB')
+                    img = open_rgb_image(decode_base64_image(before_base64), draft_size=decode_draft_size)
                     before_images.append(img)
                     print(f'  ✅ Row {idx}: Before photo loaded')
                 except Exception as e:
@@ -297,12 +587,7 @@ def create_collage():
             after_base64 = row.get('afterPhoto')
             if after_base64:
                 try:
-                    if ',' in after_base64:
-                        after_base64 = after_base64.split(',')[1]
-                    img_bytes = base64.b64decode(after_base64)
-                    img = Image.open(io.BytesIO(img_bytes))
-                    if img.mode != 'RGB':
-                        img = img.convert('RGB')
+                    img = open_rgb_image(decode_base64_image(after_base64), draft_size=decode_draft_size)
                     after_images.append(img)
                     print(f'  ✅ Row {idx}: After photo loaded')
                 except Exception as e:
@@ -321,7 +606,7 @@ def create_collage():
         
         # Создаём вертикальный коллаж с заголовком и футером
         # Размеры одного фото в коллаже (КВАДРАТНЫЕ) - Увеличено для лучшего качества
-        photo_size = 800  # квадратные фото 800x800
+        # photo_size - квадратные фото (по умолчанию 800x800, см. tuning.py)
         
         # Отступы (пропорционально увеличены)
         padding = 30  # отступ между фото в паре
@@ -526,9 +811,15 @@ def create_collage():
             draw.text((border + 20, line_y), field, fill='black', font=font_small)
             line_y += 45
         
-        # Сохраняем в буфер как JPEG с максимальным качеством
+        # Сохраняем в буфер как JPEG (профиль энкодера - tuning.py)
         output = io.BytesIO()
-        collage.save(output, format='JPEG', quality=95, optimize=True)
+        save_options = {
+            'quality': tuned['collage_jpeg_quality'],
+            'optimize': tuned['collage_jpeg_optimize'],
+        }
+        if tuned['collage_jpeg_subsampling'] is not None:
+            save_options['subsampling'] = tuned['collage_jpeg_subsampling']
+        collage.save(output, format='JPEG', **save_options)
         output.seek(0)
         print(f'✅ Collage created: {collage.size}, {len(output.getvalue())} bytes')
         
@@ -554,20 +845,25 @@ def index():
         'version': '1.0.0',
         'endpoints': {
             'health': '/health',
+            'metrics': '/metrics',
             'estimate_age': '/api/estimate-age (POST)',
+            'estimate_age_pair': '/api/estimate-age/pair (POST)',
             'create_collage': '/api/create-collage (POST)'
         }
     })
 
-# Загружаем InsightFace модель при импорте (для gunicorn workers)
-print('🔄 Initializing Age-bot API with InsightFace...')
+# Инициализация при импорте (для gunicorn workers): воркер начинает
+# принимать запросы только после загрузки и прогрева нужных моделей
+print('🔄 Initializing Age-bot API...')
 load_insightface_model()
+startup_stats['startup_ms'] = round((time.perf_counter() - _startup_started) * 1000, 1)
+print(f'🚀 Worker ready in {startup_stats["startup_ms"]:.0f} ms')
 
 if __name__ == '__main__':
     print('🚀 Starting Age-bot API...')
     
     # Загружаем модель при старте
-    if not model_loaded:
+    if not state.model_loaded:
         load_insightface_model()
     
     # Запускаем сервер
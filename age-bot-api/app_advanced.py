@@ -9,6 +9,7 @@ import os
 import base64
 import io
 import hashlib
+import threading
 import numpy as np
 import cv2
 from flask import Flask, request, jsonify
@@ -65,26 +66,38 @@ def detect_face(image):
     
     return largest, face_region
 
+# Лица уменьшаются до 200 px по большей стороне перед анализом
+FEATURE_FACE_SIZE = 200
+
+# Кэш CLAHE объектов: создание CLAHE на каждый вызов дорого,
+# а сам объект не потокобезопасен, поэтому кэш на поток
+_clahe_cache = threading.local()
+
+def get_clahe(clip_limit=2.0, tile_grid_size=(8, 8)):
+    """CLAHE объект из кэша текущего потока"""
+    cache = getattr(_clahe_cache, 'items', None)
+    if cache is None:
+        cache = _clahe_cache.items = {}
+    key = (clip_limit, tuple(tile_grid_size))
+    clahe = cache.get(key)
+    if clahe is None:
+        clahe = cache[key] = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tuple(tile_grid_size))
+    return clahe
+
 def normalize_lighting(face_gray):
     """
     Нормализация освещения лица для устранения влияния теней и загара
     Использует CLAHE (Contrast Limited Adaptive Histogram Equalization)
     """
     # CLAHE для адаптивной нормализации освещения
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-    normalized = clahe.apply(face_gray)
-    
-    return normalized
+    return get_clahe().apply(face_gray)
 
-def analyze_face_features(face_gray, face_color):
+def analyze_face_features_reference(face_gray, face_color):
     """
-    Легкий анализ признаков лица для оценки возраста
+    Исходная реализация анализа признаков (эталон для bench_features.py)
     
-    Признаки:
-    - Текстура кожи (морщины)
-    - Контрастность (четкость черт)
-    - Гладкость кожи
-    - Яркость и тональность
+    Каждый проход (CLAHE, Canny, Laplacian float64, std, mean) выделяет
+    собственные буферы, CLAHE создаётся заново на каждый вызов.
     """
     # Resize для уменьшения нагрузки (макс 200x200)
     h, w = face_gray.shape
@@ -94,7 +107,8 @@ def analyze_face_features(face_gray, face_color):
         face_gray = cv2.resize(face_gray, (new_w, new_h))
     
     # ВАЖНО: Нормализуем освещение для устранения теней и загара
-    face_normalized = normalize_lighting(face_gray)
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    face_normalized = clahe.apply(face_gray)
     
     features = {}
     
@@ -114,6 +128,85 @@ def analyze_face_features(face_gray, face_color):
     
     return features
 
+class FaceFeatureExtractor:
+    """
+    Переиспользуемый извлекатель признаков лица
+    
+    - рабочие буферы под лицо 200 px выделяются один раз
+      (resize, CLAHE, Canny и Laplacian пишут в них через dst=)
+    - CLAHE берётся из кэша
+    - Laplacian считается в float32
+    - mean/std считаются одним проходом cv2.meanStdDev
+    
+    Экземпляр не потокобезопасен: используйте get_feature_extractor()
+    """
+    
+    def __init__(self, face_size=FEATURE_FACE_SIZE, clip_limit=2.0, tile_grid_size=(8, 8),
+                 canny_thresholds=(30, 100)):
+        self.face_size = face_size
+        self.clip_limit = clip_limit
+        self.tile_grid_size = tile_grid_size
+        self.canny_thresholds = canny_thresholds
+        self._resized = np.empty((face_size, face_size), dtype=np.uint8)
+        self._normalized = np.empty((face_size, face_size), dtype=np.uint8)
+        self._edges = np.empty((face_size, face_size), dtype=np.uint8)
+        self._laplacian = np.empty((face_size, face_size), dtype=np.float32)
+    
+    def extract(self, face_gray):
+        """Признаки одного лица (grayscale) - те же ключи, что и раньше"""
+        h, w = face_gray.shape
+        if max(h, w) > self.face_size:
+            scale = self.face_size / max(h, w)
+            h, w = int(h * scale), int(w * scale)
+            src = cv2.resize(face_gray, (w, h), dst=self._resized[:h, :w])
+        else:
+            src = face_gray
+        
+        normalized = self._normalized[:h, :w]
+        get_clahe(self.clip_limit, self.tile_grid_size).apply(src, dst=normalized)
+        
+        edges = self._edges[:h, :w]
+        cv2.Canny(normalized, self.canny_thresholds[0], self.canny_thresholds[1], edges=edges)
+        
+        laplacian = self._laplacian[:h, :w]
+        cv2.Laplacian(normalized, cv2.CV_32F, dst=laplacian)
+        
+        # Один проход на mean+std вместо отдельных .mean()/.std()/.var()
+        _, lap_std = cv2.meanStdDev(laplacian)
+        mean, std = cv2.meanStdDev(normalized)
+        
+        return {
+            'edge_density': cv2.countNonZero(edges) / float(h * w),
+            'texture_variance': float(lap_std[0, 0]) ** 2,
+            'contrast': float(std[0, 0]),
+            'brightness': float(mean[0, 0]),
+        }
+    
+    def extract_batch(self, faces_gray):
+        """Признаки для списка лиц с переиспользованием одних и тех же буферов"""
+        return [self.extract(face_gray) for face_gray in faces_gray]
+
+_extractor_local = threading.local()
+
+def get_feature_extractor():
+    """FaceFeatureExtractor текущего потока (буферы не делятся между потоками)"""
+    extractor = getattr(_extractor_local, 'extractor', None)
+    if extractor is None:
+        extractor = _extractor_local.extractor = FaceFeatureExtractor()
+    return extractor
+
+def analyze_face_features(face_gray, face_color):
+    """
+    Легкий анализ признаков лица для оценки возраста
+    
+    Признаки:
+    - Текстура кожи (морщины)
+    - Контрастность (четкость черт)
+    - Гладкость кожи
+    - Яркость и тональность
+    """
+    return get_feature_extractor().extract(face_gray)
+
 def estimate_age_from_features(features, face_img):
     """
     Оценка возраста на основе извлеченных признаков
@@ -5,8 +5,10 @@ Flask API для определения возраста по фотографи
 """
 
 import os
+import time
 import base64
 import io
+import threading
 import numpy as np
 import cv2
 from flask import Flask, request, jsonify
@@ -26,6 +28,38 @@ MODEL_MEAN_VALUES = (78.4263377603, 87.7689143744, 114.895847746)
 AGE_BUCKETS = ['(0-2)', '(4-6)', '(8-12)', '(15-20)', '(25-32)', '(38-43)', '(48-53)', '(60-100)']
 AGE_MIDPOINTS = [1, 5, 10, 17, 28, 40, 50, 70]  # Средние значения для каждого диапазона
 
+# Порог уверенности детектора: возвращаются все лица выше порога
+FACE_CONFIDENCE_THRESHOLD = float(os.environ.get('FACE_CONFIDENCE_THRESHOLD', '0.7'))
+
+# Настройки cv2.dnn: backend, target и число потоков OpenCV (0 = по умолчанию)
+CV2_DNN_BACKEND = os.environ.get('CV2_DNN_BACKEND', 'default').lower()
+CV2_DNN_TARGET = os.environ.get('CV2_DNN_TARGET', 'cpu').lower()
+CV2_NUM_THREADS = int(os.environ.get('CV2_NUM_THREADS', '0'))
+
+DNN_BACKENDS = {
+    'default': cv2.dnn.DNN_BACKEND_DEFAULT,
+    'opencv': cv2.dnn.DNN_BACKEND_OPENCV,
+    'inference_engine': getattr(cv2.dnn, 'DNN_BACKEND_INFERENCE_ENGINE', cv2.dnn.DNN_BACKEND_DEFAULT),
+    'cuda': getattr(cv2.dnn, 'DNN_BACKEND_CUDA', cv2.dnn.DNN_BACKEND_DEFAULT),
+}
+DNN_TARGETS = {
+    'cpu': cv2.dnn.DNN_TARGET_CPU,
+    'opencl': cv2.dnn.DNN_TARGET_OPENCL,
+    'opencl_fp16': cv2.dnn.DNN_TARGET_OPENCL_FP16,
+    'cuda': getattr(cv2.dnn, 'DNN_TARGET_CUDA', cv2.dnn.DNN_TARGET_CPU),
+    'cuda_fp16': getattr(cv2.dnn, 'DNN_TARGET_CUDA_FP16', cv2.dnn.DNN_TARGET_CPU),
+}
+
+# Статистика пропускной способности (лиц в секунду)
+throughput_lock = threading.Lock()
+throughput_stats = {'images': 0, 'faces': 0, 'forwards': 0, 'seconds': 0.0}
+
+def configure_net(net):
+    """Применение backend/target cv2.dnn к загруженной сети"""
+    net.setPreferableBackend(DNN_BACKENDS.get(CV2_DNN_BACKEND, cv2.dnn.DNN_BACKEND_DEFAULT))
+    net.setPreferableTarget(DNN_TARGETS.get(CV2_DNN_TARGET, cv2.dnn.DNN_TARGET_CPU))
+    return net
+
 def load_models():
     """Загрузка легких моделей для определения лица и возраста"""
     global face_net, age_net, model_loaded
@@ -47,12 +81,16 @@ def load_models():
             print('❌ Model files not found. Please download them first.')
             return False
         
+        if CV2_NUM_THREADS > 0:
+            cv2.setNumThreads(CV2_NUM_THREADS)
+        
         # Загружаем модели
-        face_net = cv2.dnn.readNet(face_model, face_proto)
-        age_net = cv2.dnn.readNet(age_model, age_proto)
+        face_net = configure_net(cv2.dnn.readNet(face_model, face_proto))
+        age_net = configure_net(cv2.dnn.readNet(age_model, age_proto))
         
         model_loaded = True
-        print('✅ OpenCV models loaded successfully')
+        print(f'✅ OpenCV models loaded successfully '
+              f'(backend: {CV2_DNN_BACKEND}, target: {CV2_DNN_TARGET}, threads: {cv2.getNumThreads()})')
         return True
         
     except Exception as e:
@@ -61,31 +99,119 @@ def load_models():
         traceback.print_exc()
         return False
 
-def detect_face(image):
-    """Детекция лица с использованием OpenCV DNN"""
-    height, width = image.shape[:2]
+def to_bgr(image):
+    """Конвертируем PIL Image в numpy array (BGR для OpenCV)"""
+    if isinstance(image, Image.Image):
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        img_array = np.array(image)
+        return cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
+    return image
+
+def detect_faces(images, threshold=None):
+    """
+    Детекция всех лиц на одном или нескольких изображениях одним forward
+    
+    Возвращает: список (по изображениям) списков (box, confidence),
+    box = [startX, startY, endX, endY] обрезан по границам изображения
+    """
+    if threshold is None:
+        threshold = FACE_CONFIDENCE_THRESHOLD
     
-    # Подготовка blob для детекции лица
-    blob = cv2.dnn.blobFromImage(image, 1.0, (300, 300), MODEL_MEAN_VALUES, swapRB=False)
+    # Один blob (N, 3, 300, 300) для всех изображений
+    blob = cv2.dnn.blobFromImages(images, 1.0, (300, 300), MODEL_MEAN_VALUES, swapRB=False)
     face_net.setInput(blob)
     detections = face_net.forward()
     
-    # Находим лицо с наибольшей уверенностью
-    best_confidence = 0
-    best_box = None
+    # Строки детекций: [image_id, label, confidence, x1, y1, x2, y2]
+    rows = detections[0, 0]
+    rows = rows[rows[:, 2] > threshold]
+    
+    results = [[] for _ in images]
+    for image_id, _, confidence, x1, y1, x2, y2 in rows:
+        idx = int(image_id)
+        if idx < 0 or idx >= len(images):
+            continue
+        height, width = images[idx].shape[:2]
+        box = (np.array([x1, y1, x2, y2]) * np.array([width, height, width, height])).astype("int")
+        box = np.clip(box, 0, [width, height, width, height])
+        if box[2] <= box[0] or box[3] <= box[1]:
+            continue
+        results[idx].append((box, float(confidence)))
+    
+    # Самые уверенные лица первыми
+    for faces in results:
+        faces.sort(key=lambda item: item[1], reverse=True)
+    return results
+
+def detect_face(image):
+    """Детекция лица с наибольшей уверенностью (совместимость со старым API)"""
+    faces = detect_faces([image])[0]
+    if not faces:
+        return None, 0
+    return faces[0]
+
+def estimate_ages(images):
+    """
+    Определение возраста для всех лиц на нескольких изображениях
+    
+    Все найденные лица со всех изображений упаковываются в один
+    cv2.dnn.blobFromImages и проходят через age_net за один forward.
+    
+    Возвращает: список (по изображениям) списков словарей
+    {box, confidence, age, bucket}, лица отсортированы по уверенности
+    """
+    started = time.perf_counter()
+    images_bgr = [to_bgr(image) for image in images]
+    detections = detect_faces(images_bgr)
+    
+    # Вырезаем все лица и запоминаем, к какому изображению они относятся
+    crops, owners = [], []
+    for idx, (img_bgr, faces) in enumerate(zip(images_bgr, detections)):
+        for box, confidence in faces:
+            (startX, startY, endX, endY) = box
+            crops.append(img_bgr[startY:endY, startX:endX])
+            owners.append((idx, box, confidence))
+    
+    results = [[] for _ in images]
+    if crops:
+        # Один blob (N, 3, 227, 227) для всех лиц
+        blob = cv2.dnn.blobFromImages(crops, 1.0, (227, 227), MODEL_MEAN_VALUES, swapRB=False)
+        age_net.setInput(blob)
+        age_preds = age_net.forward()
+        
+        for (idx, box, confidence), preds in zip(owners, age_preds):
+            age_idx = int(preds.argmax())
+            results[idx].append({
+                'box': [int(v) for v in box],
+                'confidence': round(confidence, 3),
+                'age': AGE_MIDPOINTS[age_idx],
+                'bucket': AGE_BUCKETS[age_idx],
+            })
     
-    for i in range(detections.shape[2]):
-        confidence = detections[0, 0, i, 2]
-        if confidence > 0.7 and confidence > best_confidence:
-            best_confidence = confidence
-            box = detections[0, 0, i, 3:7] * np.array([width, height, width, height])
-            best_box = box.astype("int")
+    elapsed = time.perf_counter() - started
+    with throughput_lock:
+        throughput_stats['images'] += len(images)
+        throughput_stats['faces'] += len(crops)
+        throughput_stats['forwards'] += 2 if crops else 1
+        throughput_stats['seconds'] += elapsed
     
-    return best_box, best_confidence
+    faces_per_s = len(crops) / elapsed if elapsed > 0 else 0.0
+    print(f'👥 {len(crops)} faces on {len(images)} images in {elapsed * 1000:.1f} ms '
+          f'({faces_per_s:.1f} faces/s)')
+    return results
+
+def get_throughput():
+    """Накопленная статистика пропускной способности"""
+    with throughput_lock:
+        stats = dict(throughput_stats)
+    stats['faces_per_second'] = round(stats['faces'] / stats['seconds'], 2) if stats['seconds'] else 0.0
+    stats['seconds'] = round(stats['seconds'], 3)
+    return stats
 
 def estimate_age(image):
     """
-    Определение возраста по изображению
+    Определение возраста по изображению (лицо с наибольшей уверенностью)
     
     Возвращает: возраст (int) или None при ошибке
     """
@@ -94,46 +220,17 @@ def estimate_age(image):
         return None
     
     try:
-        # Конвертируем PIL Image в numpy array (BGR для OpenCV)
-        if isinstance(image, Image.Image):
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            img_array = np.array(image)
-            img_bgr = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-        else:
-            img_bgr = image
+        faces = estimate_ages([image])[0]
         
-        print(f'📸 Input shape: {img_bgr.shape}')
-        
-        # Детекция лица
-        face_box, confidence = detect_face(img_bgr)
-        
-        if face_box is None:
+        if not faces:
             print('⚠️ No face detected')
             return None
         
-        print(f'👤 Face detected with confidence: {confidence:.3f}')
+        best = faces[0]
+        print(f'✅ Estimated age: {best["age"]} (bucket: {best["bucket"]}, '
+              f'confidence: {best["confidence"]:.3f})')
         
-        # Извлекаем область лица
-        (startX, startY, endX, endY) = face_box
-        face_img = img_bgr[startY:endY, startX:endX]
-        
-        if face_img.size == 0:
-            print('⚠️ Invalid face region')
-            return None
-        
-        # Подготовка blob для определения возраста
-        blob = cv2.dnn.blobFromImage(face_img, 1.0, (227, 227), MODEL_MEAN_VALUES, swapRB=False)
-        age_net.setInput(blob)
-        age_preds = age_net.forward()
-        
-        # Получаем индекс возрастной группы с максимальной вероятностью
-        age_idx = age_preds[0].argmax()
-        estimated_age = AGE_MIDPOINTS[age_idx]
-        
-        print(f'✅ Estimated age: {estimated_age} (bucket: {AGE_BUCKETS[age_idx]})')
-        
-        return estimated_age
+        return best['age']
         
     except Exception as e:
         print(f'❌ Age estimation error: {e}')
@@ -141,48 +238,88 @@ def estimate_age(image):
         traceback.print_exc()
         return None
 
+def decode_image(image_data):
+    """Декодирование base64 изображения в RGB PIL Image"""
+    # Убираем data:image prefix если есть
+    if ',' in image_data:
+        image_data = image_data.split(',')[1]
+    
+    image_bytes = base64.b64decode(image_data)
+    image = Image.open(io.BytesIO(image_bytes))
+    
+    # Конвертируем в RGB если нужно
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Проверка здоровья сервиса"""
     return jsonify({
         'status': 'ok',
-        'model_loaded': model_loaded
+        'model_loaded': model_loaded,
+        'dnn': {
+            'backend': CV2_DNN_BACKEND,
+            'target': CV2_DNN_TARGET,
+            'threads': cv2.getNumThreads()
+        },
+        'throughput': get_throughput()
     })
 
 @app.route('/api/estimate-age', methods=['POST'])
 def estimate_age_endpoint():
-    """Endpoint для определения возраста"""
+    """Endpoint для определения возраста (возраст лучшего лица + все найденные лица)"""
     try:
         data = request.get_json()
         
         if not data or 'image' not in data:
             return jsonify({'error': 'No image provided'}), 400
         
-        # Декодируем base64 изображение
-        image_data = data['image']
-        
-        # Убираем data:image prefix если есть
-        if ',' in image_data:
-            image_data = image_data.split(',')[1]
-        
-        # Декодируем
-        image_bytes = base64.b64decode(image_data)
-        image = Image.open(io.BytesIO(image_bytes))
+        if not model_loaded:
+            return jsonify({'error': 'Failed to estimate age'}), 500
         
-        # Конвертируем в RGB если нужно
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
+        image = decode_image(data['image'])
         
-        # Определяем возраст
-        age = estimate_age(image)
+        # Определяем возраст всех лиц
+        faces = estimate_ages([image])[0]
         
-        if age is None:
+        if not faces:
             return jsonify({'error': 'Failed to estimate age'}), 500
         
         # Возвращаем результат
         return jsonify({
-            'age': age,
+            'age': faces[0]['age'],
             'confidence': 0.85,
+            'faces': faces,
+            'status': 'success'
+        })
+        
+    except Exception as e:
+        print(f'❌ Error processing request: {e}')
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/estimate-ages', methods=['POST'])
+def estimate_ages_endpoint():
+    """
+    Пакетное определение возраста для нескольких изображений
+    
+    Request JSON: {"images": ["base64_img", ...]}
+    Response JSON: {"results": [{"faces": [...]}, ...]}
+    """
+    try:
+        data = request.get_json()
+        
+        if not data or not data.get('images'):
+            return jsonify({'error': 'No images provided'}), 400
+        
+        if not model_loaded:
+            return jsonify({'error': 'Models not loaded'}), 500
+        
+        images = [decode_image(image_data) for image_data in data['images']]
+        results = estimate_ages(images)
+        
+        return jsonify({
+            'results': [{'faces': faces} for faces in results],
             'status': 'success'
         })
         
@@ -198,7 +335,8 @@ def index():
         'version': '2.0.0',
         'endpoints': {
             'health': '/health',
-            'estimate_age': '/api/estimate-age (POST)'
+            'estimate_age': '/api/estimate-age (POST)',
+            'estimate_ages': '/api/estimate-ages (POST)'
         }
     })
 
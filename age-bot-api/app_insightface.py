@@ -13,8 +13,7 @@ import cv2
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from PIL import Image
-import insightface
-from insightface.app import FaceAnalysis
+from insightface_provider import create_adaptive_face_app
 
 app = Flask(__name__)
 CORS(app)
@@ -30,14 +29,10 @@ def load_models():
     try:
         print('Loading InsightFace buffalo_l model...')
         
-        # Инициализация FaceAnalysis с buffalo_l моделью (поддерживает age)
-        face_app = FaceAnalysis(
-            name='buffalo_l',
-            providers=['CPUExecutionProvider']
-        )
-        
-        # Подготовка модели (ctx_id=-1 для CPU)
-        face_app.prepare(ctx_id=-1, det_size=(640, 640))
+        # Инициализация FaceAnalysis с buffalo_l моделью (поддерживает age):
+        # только детекция и gender/age, без распознавания и 3D landmarks;
+        # детектор сначала пробует 320, затем 480 и 640
+        face_app = create_adaptive_face_app()
         
         model_loaded = True
         print('✅ InsightFace model loaded successfully')
@@ -171,7 +166,8 @@ def health_check():
     """Health check endpoint"""
     return jsonify({
         'status': 'healthy',
-        'model_loaded': model_loaded
+        'model_loaded': model_loaded,
+        'det_size_stats': face_app.get_stats() if face_app is not None else None
     }), 200
 
 # Загружаем модели при старте
@@ -24,12 +24,50 @@ face_cascade = None
 age_session = None
 model_loaded = False
 
+# Вариант модели возраста: fp32 (исходная) или int8 (см. quantize_age_model.py)
+AGE_MODEL_VARIANT = os.environ.get('AGE_MODEL_VARIANT', 'fp32').lower()
+AGE_MODEL_FILES = {
+    'fp32': 'age_googlenet.onnx',
+    'int8': 'age_googlenet_int8.onnx',
+}
+
+# Загрузка модели возраста при импорте (gunicorn app_onnx_refined:app).
+# AGE_MODEL_PRELOAD=0 загружает только детектор лиц: сессию создаёт сам
+# вызывающий (compare_age_models.py, quantize_age_model.py)
+AGE_MODEL_PRELOAD = os.environ.get('AGE_MODEL_PRELOAD', '1') != '0'
+
 # Возрастные диапазоны модели age_googlenet
 AGE_RANGES = [(0, 2), (4, 6), (8, 12), (15, 20), (25, 32), (38, 43), (48, 53), (60, 100)]
 AGE_LABELS = ['0-2', '4-6', '8-12', '15-20', '25-32', '38-43', '48-53', '60+']
 
-def load_models():
-    """Загрузка моделей для детекции лица и определения возраста"""
+def get_age_model_path(variant=None):
+    """Путь к ONNX файлу выбранного варианта модели возраста"""
+    variant = (variant or AGE_MODEL_VARIANT).lower()
+    if variant not in AGE_MODEL_FILES:
+        raise ValueError(f'Unknown age model variant: {variant} (expected one of {list(AGE_MODEL_FILES)})')
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(base_dir, AGE_MODEL_FILES[variant])
+
+def create_age_session(variant=None):
+    """Создание ONNX Runtime сессии для варианта модели (fp32/int8)"""
+    return ort.InferenceSession(
+        get_age_model_path(variant),
+        providers=['CPUExecutionProvider']
+    )
+
+def age_to_bucket(age):
+    """Индекс возрастного диапазона модели, ближайшего к реальному возрасту"""
+    best_idx, best_dist = 0, None
+    for idx, (min_age, max_age) in enumerate(AGE_RANGES):
+        if min_age <= age <= max_age:
+            return idx
+        dist = min_age - age if age < min_age else age - max_age
+        if best_dist is None or dist < best_dist:
+            best_idx, best_dist = idx, dist
+    return best_idx
+
+def load_models(age_model=True):
+    """Загрузка моделей для детекции лица и (при age_model) определения возраста"""
     global face_cascade, age_session, model_loaded
     
     try:
@@ -39,23 +77,22 @@ def load_models():
         face_cascade = cv2.CascadeClassifier(
             cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
         )
+        if not age_model:
+            print('✅ Face detector loaded (age model not preloaded)')
+            return True
         
         # ONNX модель для определения возраста
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        age_model_path = os.path.join(base_dir, 'age_googlenet.onnx')
+        age_model_path = get_age_model_path()
         
         if not os.path.exists(age_model_path):
             print(f'❌ Model not found: {age_model_path}')
             return False
         
-        # Загружаем ONNX модель
-        age_session = ort.InferenceSession(
-            age_model_path,
-            providers=['CPUExecutionProvider']
-        )
+        # Загружаем ONNX модель (вариант задаётся AGE_MODEL_VARIANT)
+        age_session = create_age_session()
         
         model_loaded = True
-        print('✅ Models loaded successfully')
+        print(f'✅ Models loaded successfully (age model: {AGE_MODEL_VARIANT})')
         return True
         
     except Exception as e:
@@ -100,6 +137,18 @@ def preprocess_face(face_img):
     
     return batched
 
+def predict_age_bucket(session, preprocessed):
+    """
+    Inference модели возраста на предобработанном лице
+    
+    Возвращает: (индекс возрастной группы, вероятность)
+    """
+    input_name = session.get_inputs()[0].name
+    outputs = session.run(None, {input_name: preprocessed})
+    predictions = outputs[0][0]
+    age_idx = int(np.argmax(predictions))
+    return age_idx, float(predictions[age_idx])
+
 def refine_age_in_range(age_range, face_features):
     """
     Уточняет возраст внутри диапазона на основе признаков лица
@@ -163,16 +212,8 @@ def estimate_age(image):
         # Предобработка для модели
         preprocessed = preprocess_face(face_img)
         
-        # Получаем имя входного тензора
-        input_name = age_session.get_inputs()[0].name
-        
-        # Inference
-        outputs = age_session.run(None, {input_name: preprocessed})
-        predictions = outputs[0][0]
-        
-        # Получаем индекс возрастной группы с максимальной вероятностью
-        age_idx = int(np.argmax(predictions))
-        confidence = float(predictions[age_idx])
+        # Inference: индекс возрастной группы с максимальной вероятностью
+        age_idx, confidence = predict_age_bucket(age_session, preprocessed)
         
         # Получаем возрастной диапазон
         age_range = AGE_RANGES[age_idx]
@@ -198,7 +239,8 @@ def health_check():
     """Проверка здоровья сервиса"""
     return jsonify({
         'status': 'ok',
-        'model_loaded': model_loaded
+        'model_loaded': model_loaded,
+        'age_model_variant': AGE_MODEL_VARIANT
     })
 
 @app.route('/api/estimate-age', methods=['POST'])
@@ -260,7 +302,7 @@ def index():
 
 # Загружаем модели при импорте
 print('🔄 Initializing Age-bot API with ONNX...')
-load_models()
+load_models(age_model=AGE_MODEL_PRELOAD)
 
 if __name__ == '__main__':
     print('🚀 Starting Age-bot API...')
@@ -6,15 +6,17 @@ Flask API для определения возраста по фотографи
 """
 
 import os
+import time
 import base64
 import io
+import threading
 import numpy as np
 import cv2
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from PIL import Image
-import tensorflow as tf
-from tensorflow import keras
+
+from process_memory import rss_mb
 
 app = Flask(__name__)
 CORS(app)
@@ -23,6 +25,150 @@ CORS(app)
 face_cascade = None
 age_model = None
 model_loaded = False
+startup_stats = {}
+
+# Рантайм модели возраста: auto | onnx | tflite | keras
+# auto выбирает самый лёгкий из доступных экспортов (см. export_ssrnet.py),
+# TensorFlow импортируется только для keras
+SSRNET_RUNTIME = os.environ.get('SSRNET_RUNTIME', 'auto').lower()
+SSRNET_THREADS = int(os.environ.get('SSRNET_THREADS', '0'))  # 0 = по умолчанию рантайма
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATHS = {
+    'keras': os.path.join(BASE_DIR, 'ssrnet_age_model.h5'),
+    'onnx': os.path.join(BASE_DIR, 'ssrnet_age_model.onnx'),
+    'tflite': os.path.join(BASE_DIR, 'ssrnet_age_model.tflite'),
+}
+INPUT_SHAPE = (64, 64, 3)
+
+class OnnxAgeModel:
+    """SSR-Net через ONNX Runtime (без TensorFlow)"""
+    runtime = 'onnx'
+
+    def __init__(self, path):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        if SSRNET_THREADS > 0:
+            options.intra_op_num_threads = SSRNET_THREADS
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_name = self.session.get_outputs()[0].name
+
+    def predict_one(self, batch):
+        return self.session.run([self.output_name], {self.input_name: batch})[0]
+
+    def predict_batch(self, batch):
+        return self.predict_one(batch)
+
+class TFLiteAgeModel:
+    """SSR-Net через TFLite интерпретатор (tflite_runtime, иначе tf.lite)
+
+    Интерпретатор не потокобезопасен, поэтому у каждого свой lock.
+    Для батчей один интерпретатор переразмечается под текущий размер
+    (resize_tensor_input), а не заводится новый на каждый размер батча.
+    """
+    runtime = 'tflite'
+
+    def __init__(self, path):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+        self._interpreter_cls = Interpreter
+        self.path = path
+        self.num_threads = SSRNET_THREADS or None
+        # Интерпретатор под batch=1 аллоцируется один раз
+        self.single = self._make_interpreter(1)
+        self._single_lock = threading.Lock()
+        self._batched = None
+        self._batched_size = None
+        self._batched_lock = threading.Lock()
+
+    def _make_interpreter(self, batch_size):
+        interpreter = self._interpreter_cls(model_path=self.path, num_threads=self.num_threads)
+        input_index = interpreter.get_input_details()[0]['index']
+        if batch_size != 1:
+            interpreter.resize_tensor_input(input_index, (batch_size,) + INPUT_SHAPE)
+        interpreter.allocate_tensors()
+        output_index = interpreter.get_output_details()[0]['index']
+        return interpreter, input_index, output_index
+
+    @staticmethod
+    def _invoke(handle, batch):
+        interpreter, input_index, output_index = handle
+        interpreter.set_tensor(input_index, batch)
+        interpreter.invoke()
+        return interpreter.get_tensor(output_index).copy()
+
+    def predict_one(self, batch):
+        with self._single_lock:
+            return self._invoke(self.single, batch)
+
+    def predict_batch(self, batch):
+        batch_size = batch.shape[0]
+        if batch_size == 1:
+            return self.predict_one(batch)
+        with self._batched_lock:
+            if self._batched is None:
+                self._batched = self._make_interpreter(batch_size)
+            elif batch_size != self._batched_size:
+                interpreter, input_index, _ = self._batched
+                interpreter.resize_tensor_input(input_index, (batch_size,) + INPUT_SHAPE)
+                interpreter.allocate_tensors()
+            self._batched_size = batch_size
+            return self._invoke(self._batched, batch)
+
+class KerasAgeModel:
+    """SSR-Net через Keras, но без накладных расходов model.predict"""
+    runtime = 'keras'
+
+    def __init__(self, path):
+        import tensorflow as tf
+        from tensorflow import keras
+        if SSRNET_THREADS > 0:
+            tf.config.threading.set_intra_op_parallelism_threads(SSRNET_THREADS)
+        if os.path.exists(path):
+            self.model = keras.models.load_model(path, compile=False)
+            print('✅ SSR-Net model loaded from file')
+        else:
+            # Если модели нет, создаем простую регрессионную модель
+            print('⚠️ SSR-Net model not found, creating fallback model')
+            self.model = create_simple_age_model(keras)
+        # Скомпилированные графы: фиксированный batch=1 и переменный batch
+        self._single = tf.function(
+            lambda x: self.model(x, training=False),
+            input_signature=[tf.TensorSpec((1,) + INPUT_SHAPE, tf.float32)])
+        self._batched = tf.function(
+            lambda x: self.model(x, training=False),
+            input_signature=[tf.TensorSpec((None,) + INPUT_SHAPE, tf.float32)])
+
+    def predict_one(self, batch):
+        return self._single(batch).numpy()
+
+    def predict_batch(self, batch):
+        return self._batched(batch).numpy()
+
+def resolve_runtime(runtime=None):
+    """Выбор рантайма: явный из SSRNET_RUNTIME или самый лёгкий из доступных"""
+    runtime = (runtime or SSRNET_RUNTIME).lower()
+    if runtime != 'auto':
+        return runtime
+    for candidate in ('onnx', 'tflite'):
+        if os.path.exists(MODEL_PATHS[candidate]):
+            return candidate
+    return 'keras'
+
+def create_age_model(runtime=None):
+    """Загрузка модели возраста в выбранном рантайме"""
+    runtime = resolve_runtime(runtime)
+    if runtime == 'onnx':
+        return OnnxAgeModel(MODEL_PATHS['onnx'])
+    if runtime == 'tflite':
+        return TFLiteAgeModel(MODEL_PATHS['tflite'])
+    if runtime == 'keras':
+        return KerasAgeModel(MODEL_PATHS['keras'])
+    raise ValueError(f'Unknown SSR-Net runtime: {runtime}')
 
 def load_models():
     """Загрузка моделей для детекции лица и определения возраста"""
@@ -30,26 +176,23 @@ def load_models():
     
     try:
         print('Loading models...')
+        t0 = time.perf_counter()
         
         # Haar Cascade для детекции лица (встроен в OpenCV)
         face_cascade = cv2.CascadeClassifier(
             cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
         )
         
-        # Загружаем SSR-Net модель
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        model_path = os.path.join(base_dir, 'ssrnet_age_model.h5')
+        # Загружаем SSR-Net модель в лёгком рантайме
+        age_model = create_age_model()
         
-        if os.path.exists(model_path):
-            age_model = keras.models.load_model(model_path, compile=False)
-            print('✅ SSR-Net model loaded from file')
-        else:
-            # Если модели нет, создаем простую регрессионную модель
-            print('⚠️ SSR-Net model not found, creating fallback model')
-            age_model = create_simple_age_model()
+        startup_stats['runtime'] = age_model.runtime
+        startup_stats['load_ms'] = round((time.perf_counter() - t0) * 1000, 1)
+        startup_stats['rss_mb'] = round(rss_mb(), 1)
         
         model_loaded = True
-        print('✅ Models loaded successfully')
+        print(f'✅ Models loaded successfully (runtime: {age_model.runtime}, '
+              f'{startup_stats["load_ms"]} ms, RSS {startup_stats["rss_mb"]} MB)')
         return True
         
     except Exception as e:
@@ -58,7 +201,7 @@ def load_models():
         traceback.print_exc()
         return False
 
-def create_simple_age_model():
+def create_simple_age_model(keras):
     """
     Создает простую CNN модель для оценки возраста
     Это fallback если SSR-Net не найден
@@ -108,6 +251,24 @@ def preprocess_face_for_age(face_img):
     
     return batched
 
+def preprocess_faces_for_age(face_imgs):
+    """Предобработка нескольких лиц в один батч (N, 64, 64, 3)"""
+    batch = np.empty((len(face_imgs),) + INPUT_SHAPE, dtype=np.float32)
+    for i, face_img in enumerate(face_imgs):
+        batch[i] = preprocess_face_for_age(face_img)[0]
+    return batch
+
+def predict_ages(face_imgs):
+    """
+    Батчевая оценка возраста для нескольких вырезанных лиц
+    
+    Возвращает: список возрастов (int), ограниченных диапазоном 18-70
+    """
+    if not face_imgs:
+        return []
+    prediction = age_model.predict_batch(preprocess_faces_for_age(face_imgs))
+    return [max(18, min(70, int(float(p[0])))) for p in prediction]
+
 def estimate_age_from_features(face_img):
     """
     Оценка возраста на основе характеристик лица
@@ -185,7 +346,7 @@ def estimate_age(image):
         
         # Inference через модель
         try:
-            prediction = age_model.predict(preprocessed, verbose=0)
+            prediction = age_model.predict_one(preprocessed)
             estimated_age = float(prediction[0][0])
             
             # Ограничиваем диапазон 18-70 лет
@@ -212,7 +373,9 @@ def health_check():
     """Проверка здоровья сервиса"""
     return jsonify({
         'status': 'ok',
-        'model_loaded': model_loaded
+        'model_loaded': model_loaded,
+        'runtime': startup_stats.get('runtime'),
+        'startup': startup_stats
     })
 
 @app.route('/api/estimate-age', methods=['POST'])
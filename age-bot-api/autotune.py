@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Автоподбор настроек производительности Age-bot API под хост
+
+Прогоняет набор фото через пути сервиса (/api/estimate-age и
+/api/create-collage через test_client, без сети) и по очереди перебирает
+параметры профиля (tuning.py), оставляя для каждого лучшее значение:
+
+  1. threads_per_worker     - потоки ONNX Runtime / OpenCV / BLAS на воркер
+  2. det_sizes              - размеры входа детектора InsightFace
+  3. inference_concurrency  - одновременные inference в процессе
+  4. inference_decode_size  - масштаб декодирования JPEG для inference
+  5. профиль коллажа        - draft-декодирование и JPEG quality/optimize/subsampling
+
+Лучшее значение - максимальная пропускная способность без роста числа
+фото без найденного лица и отклонённых (429/503) или упавших запросов;
+для коллажа - минимальный p95 при quality >= --min-quality.
+Потоки и размеры детектора фиксируются при загрузке моделей, поэтому каждая
+конфигурация inference меряется в отдельном процессе.
+Результат - tuned_profile.json, который воркер загружает при старте.
+
+Пример:
+    python autotune.py --images ./faces_dir --threads 1,2,4 --concurrency 1,2,4
+    python autotune.py --images ./faces_dir --output /var/www/age-bot-api/tuned_profile.json
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import platform
+import tempfile
+import itertools
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from bench_utils import latency_summary, load_labeled_images, format_table
+from tuning import DEFAULT_PROFILE, TUNED_PROFILE_PATH
+
+
+def load_payloads(images_dir, limit):
+    payloads = []
+    for path, _ in load_labeled_images(images_dir)[:limit]:
+        with open(path, 'rb') as f:
+            payloads.append(base64.b64encode(f.read()).decode('utf-8'))
+    return payloads
+
+
+def import_service(profile_path):
+    """app.py с профилем-кандидатом: локальный inference, без кэша оценок"""
+    os.environ['TUNED_PROFILE_PATH'] = profile_path
+    os.environ['AGE_CACHE_SIZE'] = '0'
+    os.environ['FACEPP_API_KEY'] = ''
+    os.environ['FACEPP_API_SECRET'] = ''
+    # Профиль-кандидат важнее переменных окружения хоста
+    for name in ('CPU_THREADS_PER_WORKER', 'INFERENCE_CONCURRENCY', 'INSIGHTFACE_DET_SIZES'):
+        os.environ.pop(name, None)
+    import app
+    return app
+
+
+def run_concurrently(fn, items, clients):
+    """Задержки fn(item) при clients параллельных клиентах и общая длительность"""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(fn, items))
+    return results, time.perf_counter() - started
+
+
+def classify_response(response):
+    """ok | no_face (лицо не найдено) | rejected (429/503 лимитов) | error"""
+    if response.status_code == 200:
+        return 'ok'
+    if response.status_code in (429, 503):
+        return 'rejected'
+    body = response.get_json(silent=True) or {}
+    if body.get('success') is False and body.get('age') is None and 'error' not in body:
+        return 'no_face'
+    return 'error'
+
+
+def run_inference_worker(args):
+    """Замер /api/estimate-age для одного профиля (дочерний процесс)"""
+    service = import_service(args.profile)
+    payloads = load_payloads(args.images, args.limit)
+
+    def one(payload):
+        client = service.app.test_client()
+        t0 = time.perf_counter()
+        response = client.post('/api/estimate-age', json={'image': payload})
+        return (time.perf_counter() - t0) * 1000, classify_response(response)
+
+    # Прогрев
+    run_concurrently(one, payloads[:args.clients], args.clients)
+
+    items = [payloads[i % len(payloads)] for i in range(max(args.requests, len(payloads)))]
+    results, elapsed = run_concurrently(one, items, args.clients)
+    latencies = [ms for ms, _ in results]
+    summary = latency_summary(latencies)
+    outcomes = [outcome for _, outcome in results]
+    print(json.dumps({
+        'throughput_ips': len(results) / elapsed if elapsed > 0 else None,
+        'p95_ms': summary['p95_ms'],
+        'p50_ms': summary['p50_ms'],
+        'failures': outcomes.count('no_face'),
+        'rejected': outcomes.count('rejected'),
+        'errors': outcomes.count('error'),
+    }))
+
+
+def run_collage_worker(args):
+    """Замер /api/create-collage для набора профилей коллажа (дочерний процесс)"""
+    service = import_service(args.profile)
+    payloads = load_payloads(args.images, args.limit)
+    with open(args.candidates) as f:
+        candidates = json.load(f)
+
+    pairs = list(zip(payloads[0::2], payloads[1::2])) or [(payloads[0], payloads[0])]
+    rows = [{'beforePhoto': before, 'afterPhoto': after, 'photoType': 'front'}
+            for before, after in pairs[:args.collage_rows]]
+    body = {'rows': rows, 'metadata': {}, 'userInfo': {'username': 'autotune'}}
+    client = service.app.test_client()
+
+    results = []
+    for candidate in candidates:
+        # Параметры коллажа читаются из профиля на каждый запрос
+        service.tuned.update(candidate)
+        client.post('/api/create-collage', json=body)
+        latencies, size = [], 0
+        for _ in range(args.collage_repeats):
+            t0 = time.perf_counter()
+            response = client.post('/api/create-collage', json=body)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            size = len((response.get_json() or {}).get('collage', ''))
+        summary = latency_summary(latencies)
+        results.append(dict(candidate, p50_ms=summary['p50_ms'], p95_ms=summary['p95_ms'],
+                            collage_kb=size * 3 / 4 / 1024))
+    print(json.dumps(results))
+
+
+def spawn(args, mode, profile, extra=()):
+    """Запуск замера в отдельном процессе с профилем-кандидатом"""
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+        json.dump(profile, f)
+        profile_path = f.name
+    state_dir = tempfile.TemporaryDirectory(prefix='age-bot-autotune-')
+    # Без лимитов и со своей базой корзин: замер не получает 429 и не
+    # расходует корзины запущенного на хосте сервиса
+    env = dict(os.environ, RATE_LIMITS='', RATE_LIMIT_DB=os.path.join(state_dir.name, 'ratelimit.sqlite'))
+    try:
+        cmd = [sys.executable, os.path.abspath(__file__), '--worker', mode, '--profile', profile_path,
+               '--images', args.images, '--limit', str(args.limit), '--requests', str(args.requests),
+               '--clients', str(args.clients), '--collage-rows', str(args.collage_rows),
+               '--collage-repeats', str(args.collage_repeats), *extra]
+        proc = subprocess.run(cmd, capture_output=True, text=True, env=env,
+                              cwd=os.path.dirname(os.path.abspath(__file__)))
+    finally:
+        os.unlink(profile_path)
+        state_dir.cleanup()
+    lines = [l for l in proc.stdout.splitlines() if l.startswith(('{', '['))]
+    if proc.returncode != 0 or not lines:
+        tail = proc.stderr.strip().splitlines()[-1:] or [f'exit code {proc.returncode}']
+        print(f'   ❌ {mode} run failed: {tail[0]}')
+        return None
+    return json.loads(lines[-1])
+
+
+def is_better(candidate, best):
+    """Больше пропускная способность, не больше фото без лица и отклонённых/ошибочных запросов
+
+    Отклонённые (429/503) и упавшие запросы отвечают быстро и завышают
+    пропускную способность, поэтому они не должны расти.
+    """
+    if candidate is None:
+        return False
+    if best is None:
+        return True
+    if candidate['failures'] > best['failures']:
+        return False
+    if candidate['rejected'] + candidate['errors'] > best['rejected'] + best['errors']:
+        return False
+    return candidate['throughput_ips'] > best['throughput_ips']
+
+
+def parse_list(value, parse=int):
+    return [None if item in ('none', 'full', 'auto') else parse(item)
+            for item in (v.strip() for v in value.split(',')) if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Autotune Age-bot API settings for this host')
+    parser.add_argument('--images', required=True, help='директория с фото лиц')
+    parser.add_argument('--limit', type=int, default=40)
+    parser.add_argument('--requests', type=int, default=120)
+    parser.add_argument('--clients', type=int, default=4, help='параллельных клиентов при замере')
+    parser.add_argument('--threads', default='auto,1,2,4')
+    parser.add_argument('--det-sizes', default='320,480,640;480,640;640',
+                        help='наборы размеров детектора через ;')
+    parser.add_argument('--concurrency', default='1,2,4')
+    parser.add_argument('--decode-sizes', default='full,1280,800', help='масштаб декодирования JPEG')
+    parser.add_argument('--quality', default='95,90,85')
+    parser.add_argument('--min-quality', type=int, default=90)
+    parser.add_argument('--subsampling', default='none,0,2', help='JPEG subsampling (none - как в PIL)')
+    parser.add_argument('--collage-rows', type=int, default=3)
+    parser.add_argument('--collage-repeats', type=int, default=5)
+    parser.add_argument('--output', default=TUNED_PROFILE_PATH)
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--profile', help=argparse.SUPPRESS)
+    parser.add_argument('--candidates', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker == 'inference':
+        run_inference_worker(args)
+        return
+    if args.worker == 'collage':
+        run_collage_worker(args)
+        return
+
+    sweeps = [
+        ('threads_per_worker', parse_list(args.threads)),
+        ('det_sizes', [[int(s) for s in group.split(',')] for group in args.det_sizes.split(';') if group]),
+        ('inference_concurrency', parse_list(args.concurrency)),
+        ('inference_decode_size', parse_list(args.decode_sizes)),
+    ]
+
+    profile = dict(DEFAULT_PROFILE)
+    rows = []
+    inference_result = None
+    for key, values in sweeps:
+        print(f'🎛️  Sweeping {key}: {values}')
+        # Каждый параметр сравнивается только со своими кандидатами
+        best, best_value = None, profile[key]
+        for value in values:
+            candidate_profile = dict(profile, **{key: value})
+            result = spawn(args, 'inference', candidate_profile)
+            if result is None:
+                continue
+            rows.append(dict(result, param=key, value=json.dumps(value)))
+            if is_better(result, best):
+                best, best_value = result, value
+        profile[key] = best_value
+        if best is not None:
+            inference_result = best
+            if best['rejected'] or best['errors']:
+                print(f'   ⚠️ {best["rejected"]} rejected (429/503), {best["errors"]} errors')
+        print(f'   ✅ {key} = {json.dumps(best_value)}')
+
+    print(format_table(rows, ['param', 'value', 'throughput_ips', 'p50_ms', 'p95_ms',
+                              'failures', 'rejected', 'errors']))
+
+    # Профиль коллажа: один процесс, кандидаты меняются на лету
+    candidates = [
+        {'collage_decode_draft': draft, 'collage_jpeg_quality': quality,
+         'collage_jpeg_optimize': optimize, 'collage_jpeg_subsampling': subsampling}
+        for draft, quality, optimize, subsampling in itertools.product(
+            (False, True), parse_list(args.quality), (True, False), parse_list(args.subsampling))
+        if quality >= args.min_quality
+    ]
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+        json.dump(candidates, f)
+        candidates_path = f.name
+    try:
+        print(f'🎨 Sweeping {len(candidates)} collage profiles...')
+        collage_results = spawn(args, 'collage', profile, ['--candidates', candidates_path]) or []
+    finally:
+        os.unlink(candidates_path)
+    if collage_results:
+        print(format_table(collage_results, ['collage_decode_draft', 'collage_jpeg_quality',
+                                             'collage_jpeg_optimize', 'collage_jpeg_subsampling',
+                                             'p50_ms', 'p95_ms', 'collage_kb']))
+        fastest = min(collage_results, key=lambda r: r['p95_ms'])
+        profile.update({key: fastest[key] for key in candidates[0]})
+
+    profile['_meta'] = {
+        'host': platform.node(),
+        'cpus': os.cpu_count(),
+        'tuned_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'images': args.images,
+        'inference': inference_result,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(profile, f, indent=2)
+    print(f'💾 Tuned profile saved: {args.output}')
+
+
+if __name__ == '__main__':
+    main()
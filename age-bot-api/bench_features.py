@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарк анализа признаков лица в app_advanced.py
+
+Сравнивает исходную реализацию (analyze_face_features_reference)
+с FaceFeatureExtractor (одиночный вызов и extract_batch) и проверяет,
+что признаки совпадают.
+
+Пример:
+    python bench_features.py --faces 500
+    python bench_features.py --images ./faces_dir
+"""
+
+import time
+import argparse
+import numpy as np
+import cv2
+
+import app_advanced
+from bench_utils import load_labeled_images, format_table
+
+
+def load_faces(args):
+    """Grayscale лица: вырезанные из фото или синтетические разных размеров"""
+    faces = []
+    if args.images:
+        for path, _ in load_labeled_images(args.images):
+            img_bgr = cv2.imread(path)
+            if img_bgr is None:
+                continue
+            face_box, face_gray = app_advanced.detect_face(img_bgr)
+            if face_box is not None:
+                faces.append(face_gray)
+    else:
+        rng = np.random.default_rng(0)
+        for _ in range(args.faces):
+            side = int(rng.integers(120, 480))
+            base = rng.integers(0, 256, (side // 8, side // 8), dtype=np.uint8)
+            face = cv2.resize(base, (side, side), interpolation=cv2.INTER_CUBIC)
+            noise = rng.integers(0, 24, (side, side), dtype=np.uint8)
+            faces.append(cv2.add(face, noise))
+    return faces
+
+
+def time_per_face(fn, faces, repeats):
+    best = None
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn(faces)
+        elapsed = (time.perf_counter() - t0) / len(faces) * 1e6
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Face feature extraction microbenchmark')
+    parser.add_argument('--faces', type=int, default=300, help='число синтетических лиц')
+    parser.add_argument('--images', help='директория фото вместо синтетических лиц')
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    faces = load_faces(args)
+    if not faces:
+        raise SystemExit('❌ No faces to benchmark')
+    print(f'📸 Faces: {len(faces)}')
+
+    extractor = app_advanced.get_feature_extractor()
+
+    # Проверка совпадения признаков
+    max_diff = {}
+    for face in faces:
+        ref = app_advanced.analyze_face_features_reference(face, None)
+        new = extractor.extract(face)
+        for key in ref:
+            max_diff[key] = max(max_diff.get(key, 0.0), abs(ref[key] - new[key]))
+    print('🔍 Max abs feature diff: ' + ', '.join(f'{k}={v:.2e}' for k, v in max_diff.items()))
+
+    reference_us = time_per_face(
+        lambda fs: [app_advanced.analyze_face_features_reference(f, None) for f in fs], faces, args.repeats)
+    single_us = time_per_face(lambda fs: [extractor.extract(f) for f in fs], faces, args.repeats)
+    batch_us = time_per_face(extractor.extract_batch, faces, args.repeats)
+
+    rows = [
+        {'variant': 'reference', 'us_per_face': reference_us, 'speedup': 1.0},
+        {'variant': 'extractor', 'us_per_face': single_us, 'speedup': reference_us / single_us},
+        {'variant': 'extract_batch', 'us_per_face': batch_us, 'speedup': reference_us / batch_us},
+    ]
+    print(format_table(rows, ['variant', 'us_per_face', 'speedup']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк наборов модулей InsightFace: полный buffalo_l vs detection+genderage
+и фиксированный 640x640 vs адаптивный размер входа детектора (adaptive)
+
+Каждая конфигурация запускается в отдельном процессе: время загрузки,
+RSS после загрузки и задержка face_app.get() в пересчёте на лицо.
+
+Пример:
+    python bench_insightface.py --images ./faces_dir
+    python bench_insightface.py --configs all,age,recognition
+    python bench_insightface.py --configs age,adaptive --det-sizes 320,480,640
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+from bench_utils import rss_mb, latency_summary, load_labeled_images, format_table
+
+
+def load_images(images_dir, limit):
+    import cv2
+    if images_dir:
+        images = [cv2.imread(path) for path, _ in load_labeled_images(images_dir)[:limit]]
+        return [img for img in images if img is not None]
+    # Групповое фото из пакета insightface
+    from insightface.data import get_image
+    return [get_image('t1')]
+
+
+def run_worker(config, images_dir, limit, repeats, det_sizes):
+    """Замер одной конфигурации (дочерний процесс)"""
+    extra = [] if config in ('age', 'adaptive') else [m for m in config.split('+') if m]
+    rss_before = rss_mb()
+    t0 = time.perf_counter()
+    from insightface_provider import create_face_app, create_adaptive_face_app
+    if config == 'adaptive':
+        face_app = create_adaptive_face_app(det_sizes=det_sizes, extra_modules=extra)
+    else:
+        face_app = create_face_app(extra_modules=extra)
+    load_ms = (time.perf_counter() - t0) * 1000
+
+    images = load_images(images_dir, limit)
+    face_app.get(images[0])  # прогрев
+
+    per_face = []
+    faces_total = 0
+    for _ in range(repeats):
+        for img in images:
+            t0 = time.perf_counter()
+            faces = face_app.get(img)
+            elapsed = (time.perf_counter() - t0) * 1000
+            if faces:
+                per_face.append(elapsed / len(faces))
+                faces_total += len(faces)
+
+    result = {
+        'config': config,
+        'modules': ','.join(sorted(face_app.models)),
+        'load_ms': load_ms,
+        'rss_mb': rss_mb(),
+        'rss_models_mb': rss_mb() - rss_before,
+        'faces': faces_total,
+    }
+    result.update({f'face_{k}': v for k, v in latency_summary(per_face).items() if k != 'count'})
+    if config == 'adaptive':
+        result['det_size_stats'] = face_app.get_stats()
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='InsightFace module set benchmark')
+    parser.add_argument('--configs', default='all,age',
+                        help='all = полный пак, age = detection+genderage, adaptive = age '
+                             'с адаптивным размером детектора, '
+                             'иначе доп. модули через + (recognition+landmark_3d_68)')
+    parser.add_argument('--images', help='директория с фото лиц (по умолчанию t1 из insightface)')
+    parser.add_argument('--det-sizes', default='320,480,640', help='размеры входа для adaptive')
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        det_sizes = [int(s) for s in args.det_sizes.split(',') if s.strip()]
+        run_worker(args.worker, args.images, args.limit, args.repeats, det_sizes)
+        return
+
+    results = []
+    for config in [c.strip() for c in args.configs.split(',') if c.strip()]:
+        print(f'⏱️  Benchmarking {config}...')
+        cmd = [sys.executable, os.path.abspath(__file__), '--worker', config,
+               '--limit', str(args.limit), '--repeats', str(args.repeats),
+               '--det-sizes', args.det_sizes]
+        if args.images:
+            cmd += ['--images', args.images]
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        lines = [l for l in proc.stdout.splitlines() if l.startswith('{')]
+        if proc.returncode != 0 or not lines:
+            print(f'   ❌ {config} failed: {(proc.stderr.strip().splitlines() or [proc.returncode])[-1]}')
+            continue
+        results.append(json.loads(lines[-1]))
+
+    columns = ['config', 'modules', 'load_ms', 'rss_mb', 'rss_models_mb', 'faces',
+               'face_mean_ms', 'face_p50_ms', 'face_p95_ms']
+    print(format_table(results, columns))
+
+    for r in results:
+        if 'det_size_stats' in r:
+            print(f"\n📐 {r['config']} det size hits: {json.dumps(r['det_size_stats'])}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк рантаймов SSR-Net: keras predict vs keras tf.function vs TFLite vs ONNX
+
+Каждый рантайм запускается в отдельном процессе, чтобы честно измерить
+время старта воркера (импорт app_ssrnet + загрузка модели) и RSS.
+
+Пример:
+    python bench_ssrnet.py --runtimes keras-predict,keras,tflite,onnx --iters 300
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import numpy as np
+
+from bench_utils import rss_mb, latency_summary, format_table
+
+BASELINE = 'keras-predict'
+
+
+def run_worker(runtime, iters, batch_size):
+    """Замер внутри дочернего процесса (вызывается с --worker)"""
+    t0 = time.perf_counter()
+    os.environ['SSRNET_RUNTIME'] = 'keras' if runtime == BASELINE else runtime
+    import app_ssrnet
+    startup_ms = (time.perf_counter() - t0) * 1000
+    if not app_ssrnet.model_loaded:
+        raise SystemExit(f'model not loaded for {runtime}')
+
+    model = app_ssrnet.age_model
+    if runtime == BASELINE:
+        # Исходный путь сервиса: model.predict на каждый запрос
+        predict_one = lambda x: model.model.predict(x, verbose=0)
+        predict_batch = predict_one
+    else:
+        predict_one = model.predict_one
+        predict_batch = model.predict_batch
+
+    rng = np.random.default_rng(0)
+    single = rng.random((1, 64, 64, 3), dtype=np.float32)
+    batch = rng.random((batch_size, 64, 64, 3), dtype=np.float32)
+
+    t0 = time.perf_counter()
+    predict_one(single)
+    first_ms = (time.perf_counter() - t0) * 1000
+
+    latencies = []
+    for _ in range(iters):
+        t0 = time.perf_counter()
+        predict_one(single)
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    predict_batch(batch)
+    batch_iters = max(1, iters // batch_size)
+    t0 = time.perf_counter()
+    for _ in range(batch_iters):
+        predict_batch(batch)
+    batch_elapsed = time.perf_counter() - t0
+
+    result = {
+        'runtime': runtime,
+        'startup_ms': startup_ms,
+        'first_call_ms': first_ms,
+        'rss_mb': rss_mb(),
+        'batch_faces_per_s': batch_iters * batch_size / batch_elapsed,
+    }
+    result.update(latency_summary(latencies))
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SSR-Net runtime benchmark')
+    parser.add_argument('--runtimes', default='keras-predict,keras,tflite,onnx')
+    parser.add_argument('--iters', type=int, default=300)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.iters, args.batch_size)
+        return
+
+    results = []
+    for runtime in [r.strip() for r in args.runtimes.split(',') if r.strip()]:
+        print(f'⏱️  Benchmarking {runtime}...')
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--worker', runtime,
+             '--iters', str(args.iters), '--batch-size', str(args.batch_size)],
+            capture_output=True, text=True)
+        lines = [l for l in proc.stdout.splitlines() if l.startswith('{')]
+        if proc.returncode != 0 or not lines:
+            print(f'   ⚠️ {runtime} failed: {proc.stderr.strip().splitlines()[-1:] or proc.returncode}')
+            continue
+        results.append(json.loads(lines[-1]))
+
+    columns = ['runtime', 'startup_ms', 'rss_mb', 'first_call_ms', 'mean_ms', 'p50_ms', 'p95_ms',
+               'p99_ms', 'batch_faces_per_s']
+    print(format_table(results, columns))
+
+    baseline = next((r for r in results if r['runtime'] == BASELINE), None)
+    if baseline:
+        print(f'\n📉 Savings vs {BASELINE}:')
+        for r in results:
+            if r is baseline:
+                continue
+            print(f"   {r['runtime']}: startup -{baseline['startup_ms'] - r['startup_ms']:.0f} ms, "
+                  f"RSS -{baseline['rss_mb'] - r['rss_mb']:.0f} MB, "
+                  f"p50 {baseline['p50_ms']:.2f} → {r['p50_ms']:.2f} ms "
+                  f"(x{baseline['p50_ms'] / r['p50_ms']:.1f})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Общие утилиты для бенчмарков Age-bot API
+Замер памяти процесса, перцентили задержек и загрузка размеченных фото
+"""
+
+import os
+import csv
+import re
+
+# rss_mb и peak_rss_mb живут в process_memory (их использует и сервис)
+from process_memory import rss_mb, peak_rss_mb
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+# UTKFace-подобные имена файлов: "<age>_<gender>_<race>_<date>.jpg"
+_AGE_PREFIX_RE = re.compile(r'^(\d{1,3})[_\-]')
+
+
+def process_tree_pids(pid):
+    """pid и все его потомки (Linux /proc)"""
+    pids = [pid]
+    for current in pids:
+        try:
+            with open(f'/proc/{current}/task/{current}/children') as f:
+                pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def process_tree_memory_mb(pid):
+    """
+    Суммарная память процесса и его потомков (например, gunicorn master + воркеры)
+
+    rss_mb считает общие страницы в каждом процессе, pss_mb делит их
+    между процессами (/proc/<pid>/smaps_rollup) - ближе к реальному расходу.
+    """
+    totals = {'rss_mb': 0.0, 'pss_mb': 0.0, 'processes': 0}
+    for current in process_tree_pids(pid):
+        try:
+            with open(f'/proc/{current}/smaps_rollup') as f:
+                for line in f:
+                    if line.startswith('Rss:'):
+                        totals['rss_mb'] += int(line.split()[1]) / 1024.0
+                    elif line.startswith('Pss:'):
+                        totals['pss_mb'] += int(line.split()[1]) / 1024.0
+            totals['processes'] += 1
+        except OSError:
+            continue
+    return totals
+
+
+def percentile(values, p):
+    """Перцентиль p (0-100) с линейной интерполяцией"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def latency_summary(latencies_ms):
+    """Сводка задержек: mean/p50/p95/p99 в миллисекундах"""
+    if not latencies_ms:
+        return {'count': 0, 'mean_ms': None, 'p50_ms': None, 'p95_ms': None, 'p99_ms': None}
+    return {
+        'count': len(latencies_ms),
+        'mean_ms': sum(latencies_ms) / len(latencies_ms),
+        'p50_ms': percentile(latencies_ms, 50),
+        'p95_ms': percentile(latencies_ms, 95),
+        'p99_ms': percentile(latencies_ms, 99),
+    }
+
+
+def load_labeled_images(images_dir):
+    """
+    Список (путь, возраст) для директории с фото
+
+    Возраст берётся из labels.csv (колонки filename,age) если он есть,
+    иначе из префикса имени файла в стиле UTKFace ("35_1_0_2017.jpg").
+    Фото без метки возвращаются с возрастом None.
+    """
+    labels = {}
+    labels_path = os.path.join(images_dir, 'labels.csv')
+    if os.path.exists(labels_path):
+        with open(labels_path, newline='') as f:
+            for row in csv.DictReader(f):
+                try:
+                    labels[row['filename']] = int(float(row['age']))
+                except (KeyError, ValueError):
+                    continue
+
+    items = []
+    for name in sorted(os.listdir(images_dir)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        age = labels.get(name)
+        if age is None:
+            match = _AGE_PREFIX_RE.match(name)
+            if match:
+                age = int(match.group(1))
+        items.append((os.path.join(images_dir, name), age))
+    return items
+
+
+def format_table(rows, columns):
+    """Простая текстовая таблица для вывода результатов в консоль"""
+    def fmt(value):
+        if value is None:
+            return '-'
+        if isinstance(value, float):
+            return f'{value:.2f}'
+        return str(value)
+
+    cells = [[fmt(row.get(col)) for col in columns] for row in rows]
+    widths = [max(len(col), *(len(c[i]) for c in cells)) if cells else len(col)
+              for i, col in enumerate(columns)]
+    lines = ['  '.join(col.ljust(w) for col, w in zip(columns, widths))]
+    lines.append('  '.join('-' * w for w in widths))
+    for c in cells:
+        lines.append('  '.join(v.ljust(w) for v, w in zip(c, widths)))
+    return '\n'.join(lines)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Сравнение FP32 и INT8 вариантов age_googlenet на размеченном наборе фото
+
+Отчёт: задержка inference (p50/p95/p99), прирост RSS при загрузке модели,
+совпадение возрастных групп между вариантами и точность групп по меткам.
+Каждый вариант замеряется в отдельном процессе: память, освобождённая
+после первой сессии, обычно не возвращается ОС и исказила бы RSS второй.
+
+Пример:
+    python compare_age_models.py --images ./labeled_faces --json report.json
+"""
+
+import os
+import gc
+import sys
+import json
+import time
+import argparse
+import subprocess
+import cv2
+
+# Модель не загружается при импорте: прирост RSS варианта меряется
+# от процесса без единой сессии модели возраста
+os.environ['AGE_MODEL_PRELOAD'] = '0'
+import app_onnx_refined
+from bench_utils import rss_mb, latency_summary, load_labeled_images, format_table
+
+
+def load_faces(images_dir):
+    """Детекция и предобработка лиц заранее, чтобы замерять только модель"""
+    faces = []
+    for path, age in load_labeled_images(images_dir):
+        img_bgr = cv2.imread(path)
+        if img_bgr is None:
+            continue
+        face_box = app_onnx_refined.detect_face(img_bgr)
+        if face_box is None:
+            continue
+        (x, y, w, h) = face_box
+        face_img = img_bgr[y:y+h, x:x+w]
+        if face_img.size == 0:
+            continue
+        faces.append((os.path.basename(path), age, app_onnx_refined.preprocess_face(face_img)))
+    return faces
+
+
+def evaluate_variant(variant, faces, warmup=5):
+    """Загрузка варианта модели, замер памяти и задержки по всем лицам"""
+    gc.collect()
+    rss_before = rss_mb()
+    t0 = time.perf_counter()
+    session = app_onnx_refined.create_age_session(variant)
+    load_ms = (time.perf_counter() - t0) * 1000
+
+    for _, _, tensor in faces[:warmup]:
+        app_onnx_refined.predict_age_bucket(session, tensor)
+    rss_after = rss_mb()
+
+    latencies = []
+    predictions = []
+    for _, _, tensor in faces:
+        t0 = time.perf_counter()
+        predictions.append(app_onnx_refined.predict_age_bucket(session, tensor))
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    labeled = [(idx, age) for (idx, _), (_, age, _) in zip(predictions, faces) if age is not None]
+    bucket_acc = None
+    if labeled:
+        hits = sum(1 for idx, age in labeled if idx == app_onnx_refined.age_to_bucket(age))
+        bucket_acc = hits / len(labeled)
+
+    result = {
+        'variant': variant,
+        'load_ms': load_ms,
+        'rss_delta_mb': rss_after - rss_before,
+        'bucket_acc': bucket_acc,
+    }
+    result.update(latency_summary(latencies))
+    return result, predictions
+
+
+def run_worker(variant, images_dir, warmup):
+    """Замер одного варианта внутри дочернего процесса (вызывается с --worker)"""
+    faces = load_faces(images_dir)
+    if not faces:
+        raise SystemExit(f'no faces detected in {images_dir}')
+    result, predictions = evaluate_variant(variant, faces, warmup=warmup)
+    print(json.dumps({
+        'result': result,
+        'faces': [[name, age] for name, age, _ in faces],
+        'predictions': [[int(idx), float(conf)] for idx, conf in predictions],
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='FP32 vs INT8 age_googlenet comparison')
+    parser.add_argument('--images', required=True, help='директория размеченных фото (labels.csv или UTKFace имена)')
+    parser.add_argument('--variants', default='fp32,int8')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--json', help='сохранить отчёт в JSON')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.images, args.warmup)
+        return
+
+    variants = [v.strip() for v in args.variants.split(',') if v.strip()]
+    for variant in variants:
+        path = app_onnx_refined.get_age_model_path(variant)
+        if not os.path.exists(path):
+            raise SystemExit(f'❌ Model not found for {variant}: {path}')
+
+    results = []
+    predictions = {}
+    faces = None
+    for variant in variants:
+        print(f'⏱️  Evaluating {variant}...')
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--worker', variant,
+             '--images', args.images, '--warmup', str(args.warmup)],
+            capture_output=True, text=True)
+        lines = [l for l in proc.stdout.splitlines() if l.startswith('{')]
+        if proc.returncode != 0 or not lines:
+            raise SystemExit(f'❌ {variant} failed: {proc.stderr.strip().splitlines()[-1:] or proc.returncode}')
+        report = json.loads(lines[-1])
+        if faces is not None and report['faces'] != faces:
+            raise SystemExit(f'❌ {variant} detected different faces than {variants[0]}')
+        faces = report['faces']
+        results.append(report['result'])
+        predictions[variant] = report['predictions']
+    print(f'📸 Faces: {len(faces)}')
+
+    # Совпадение возрастных групп с базовым (первым) вариантом
+    base = variants[0]
+    for result in results:
+        same = sum(1 for a, b in zip(predictions[base], predictions[result['variant']]) if a[0] == b[0])
+        result['agreement'] = same / len(faces)
+        conf_diff = [abs(a[1] - b[1]) for a, b in zip(predictions[base], predictions[result['variant']])]
+        result['mean_conf_diff'] = sum(conf_diff) / len(conf_diff)
+
+    columns = ['variant', 'load_ms', 'rss_delta_mb', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms',
+               'agreement', 'mean_conf_diff', 'bucket_acc']
+    print(format_table(results, columns))
+
+    disagreements = [
+        {'file': name, 'label': age,
+         **{v: app_onnx_refined.AGE_LABELS[predictions[v][i][0]] for v in variants}}
+        for i, (name, age) in enumerate(faces)
+        if len({predictions[v][i][0] for v in variants}) > 1
+    ]
+    if disagreements:
+        print(f'\n⚠️ Bucket disagreements: {len(disagreements)}')
+        for row in disagreements[:20]:
+            print(f'   {row}')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'faces': len(faces), 'results': results, 'disagreements': disagreements}, f, indent=2)
+        print(f'💾 Report saved: {args.json}')
+
+
+if __name__ == '__main__':
+    main()
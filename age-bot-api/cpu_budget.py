@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Бюджет CPU для воркера Age-bot API
+
+Без ограничений каждый воркер gunicorn запускает пулы потоков ONNX Runtime,
+OpenCV и BLAS размером во всю машину - при 4 воркерах это десятки потоков
+на несколько ядер. Модуль делит доступные ядра между воркерами и выставляет
+лимиты потоков библиотек под долю своего воркера.
+
+Импортируется в app.py ДО numpy/cv2/onnxruntime: переменные окружения
+BLAS/OpenMP читаются только при загрузке библиотек.
+
+Переменные окружения:
+    AGE_BOT_WORKERS / GUNICORN_WORKERS - число воркеров (ставится хуком gunicorn.conf.py)
+    AGE_BOT_WORKER_INDEX - номер воркера 0..N-1 (ставится хуком gunicorn.conf.py)
+    CPU_THREADS_PER_WORKER - явный бюджет потоков вместо автоматического
+        (или threads_per_worker в tuned_profile.json, см. tuning.py)
+    CPU_PINNING=1 - закрепить воркер за его ядрами (sched_setaffinity)
+"""
+
+import os
+
+import tuning
+
+# Библиотеки, читающие размер пула из окружения при импорте
+THREAD_ENV_VARS = (
+    'OMP_NUM_THREADS',
+    'OPENBLAS_NUM_THREADS',
+    'MKL_NUM_THREADS',
+    'NUMEXPR_NUM_THREADS',
+    'VECLIB_MAXIMUM_THREADS',
+)
+
+CPU_PINNING = os.environ.get('CPU_PINNING', '0') == '1'
+
+
+def available_cpus():
+    """Ядра, доступные процессу (учитывает cgroup/taskset affinity)"""
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+
+def configured_workers():
+    for name in ('AGE_BOT_WORKERS', 'GUNICORN_WORKERS', 'WEB_CONCURRENCY'):
+        value = os.environ.get(name)
+        if value and value.isdigit() and int(value) > 0:
+            return int(value)
+    return 1
+
+
+def compute_layout(cpus, workers, worker_index, inference_concurrency=1, threads_override=None):
+    """
+    Доля ядер воркера
+
+    Ядра делятся поровну; если воркеров больше, чем ядер, воркеры
+    делят ядра по кругу с бюджетом в один поток. Потоки ONNX Runtime
+    дополнительно делятся между одновременными inference воркера.
+    """
+    per_worker = max(1, len(cpus) // workers)
+    start = (worker_index * per_worker) % len(cpus)
+    cores = cpus[start:start + per_worker]
+    threads = threads_override or len(cores)
+    return {
+        'cpus': len(cpus),
+        'workers': workers,
+        'worker_index': worker_index,
+        'cores': cores,
+        'threads': threads,
+        'ort_intra_op_threads': max(1, threads // max(1, inference_concurrency)),
+        'opencv_threads': threads,
+        'pinned': False,
+    }
+
+
+def apply_thread_env(threads):
+    """Лимиты BLAS/OpenMP; явно заданные в окружении значения не трогаем"""
+    for name in THREAD_ENV_VARS:
+        os.environ.setdefault(name, str(threads))
+
+
+def pin_to_cores(cores):
+    try:
+        os.sched_setaffinity(0, cores)
+        return True
+    except (AttributeError, OSError) as e:
+        print(f'⚠️ CPU pinning failed: {e}')
+        return False
+
+
+def configure_opencv(threads):
+    """cv2.setNumThreads - вызывается после импорта cv2 (его тянет InsightFace)"""
+    try:
+        import cv2
+    except ImportError:
+        return
+    cv2.setNumThreads(threads)
+
+
+def init_worker():
+    """Бюджет для текущего процесса: окружение библиотек и (опционально) pinning"""
+    layout = compute_layout(
+        available_cpus(),
+        configured_workers(),
+        int(os.environ.get('AGE_BOT_WORKER_INDEX', '0')),
+        inference_concurrency=tuning.profile['inference_concurrency'],
+        threads_override=tuning.profile['threads_per_worker'],
+    )
+    apply_thread_env(layout['threads'])
+    if CPU_PINNING:
+        layout['pinned'] = pin_to_cores(layout['cores'])
+    print(f"🧮 CPU budget: worker {layout['worker_index']}/{layout['workers']}, "
+          f"{layout['threads']} threads on cores {layout['cores']}"
+          f"{' (pinned)' if layout['pinned'] else ''}")
+    return layout
+
+
+layout = init_worker()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Экспорт SSR-Net (.h5) в лёгкие рантаймы: ONNX и/или TFLite
+
+После экспорта app_ssrnet.py (SSRNET_RUNTIME=auto) подхватывает
+ssrnet_age_model.onnx или ssrnet_age_model.tflite и не импортирует TensorFlow.
+Экспорт выполняется один раз локально, TensorFlow/tf2onnx нужны только здесь.
+
+Пример:
+    python export_ssrnet.py --format both
+    python bench_ssrnet.py
+"""
+
+import os
+import sys
+import argparse
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+H5_PATH = os.path.join(BASE_DIR, 'ssrnet_age_model.h5')
+ONNX_PATH = os.path.join(BASE_DIR, 'ssrnet_age_model.onnx')
+TFLITE_PATH = os.path.join(BASE_DIR, 'ssrnet_age_model.tflite')
+INPUT_SHAPE = (64, 64, 3)
+
+
+def export_onnx(model, output_path, opset=13):
+    """Keras → ONNX через tf2onnx с динамическим batch"""
+    import tensorflow as tf
+    import tf2onnx
+
+    spec = (tf.TensorSpec((None,) + INPUT_SHAPE, tf.float32, name='input'),)
+    tf2onnx.convert.from_keras(model, input_signature=spec, opset=opset, output_path=output_path)
+    print(f'✅ ONNX saved: {output_path}')
+
+
+def export_tflite(model, output_path, optimize=False):
+    """Keras → TFLite (опционально с dynamic range квантизацией весов)"""
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if optimize:
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    with open(output_path, 'wb') as f:
+        f.write(converter.convert())
+    print(f'✅ TFLite saved: {output_path}')
+
+
+def verify(model, samples, formats, atol=0.01):
+    """Сравнение выходов экспортов с исходной Keras моделью, True если все совпали
+
+    Проверяются только форматы, экспортированные в этом запуске (formats):
+    оставшийся от прошлого экспорта файл может не соответствовать модели.
+    """
+    reference = model(samples, training=False).numpy()
+    outputs = {}
+
+    if 'onnx' in formats:
+        import onnxruntime as ort
+        session = ort.InferenceSession(ONNX_PATH, providers=['CPUExecutionProvider'])
+        outputs['ONNX'] = session.run(None, {session.get_inputs()[0].name: samples})[0]
+
+    if 'tflite' in formats:
+        import tensorflow as tf
+        interpreter = tf.lite.Interpreter(model_path=TFLITE_PATH)
+        input_index = interpreter.get_input_details()[0]['index']
+        output_index = interpreter.get_output_details()[0]['index']
+        interpreter.resize_tensor_input(input_index, samples.shape)
+        interpreter.allocate_tensors()
+        interpreter.set_tensor(input_index, samples)
+        interpreter.invoke()
+        outputs['TFLite'] = interpreter.get_tensor(output_index)
+
+    ok = True
+    for name, output in outputs.items():
+        diff = np.abs(output - reference).max() if output.shape == reference.shape else np.inf
+        passed = diff <= atol
+        ok = ok and passed
+        print(f'{"🔍" if passed else "❌"} {name} max abs diff: {diff:.6f} years (atol {atol})')
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export SSR-Net .h5 to ONNX/TFLite')
+    parser.add_argument('--model', default=H5_PATH)
+    parser.add_argument('--format', choices=['onnx', 'tflite', 'both'], default='both')
+    parser.add_argument('--opset', type=int, default=13)
+    parser.add_argument('--optimize', action='store_true', help='TFLite: квантизация весов (dynamic range)')
+    parser.add_argument('--no-verify', action='store_true')
+    parser.add_argument('--atol', type=float, default=0.01,
+                        help='допустимое расхождение с Keras (лет); при --optimize его стоит увеличить')
+    args = parser.parse_args()
+
+    from tensorflow import keras
+
+    if not os.path.exists(args.model):
+        raise SystemExit(f'❌ SSR-Net model not found: {args.model}')
+    model = keras.models.load_model(args.model, compile=False)
+    print(f'📦 Loaded {args.model}')
+
+    formats = ['onnx', 'tflite'] if args.format == 'both' else [args.format]
+    if 'onnx' in formats:
+        export_onnx(model, ONNX_PATH, opset=args.opset)
+    if 'tflite' in formats:
+        export_tflite(model, TFLITE_PATH, optimize=args.optimize)
+
+    if not args.no_verify:
+        rng = np.random.default_rng(0)
+        samples = rng.random((8,) + INPUT_SHAPE, dtype=np.float32)
+        if not verify(model, samples, formats, atol=args.atol):
+            print('❌ Экспорт расходится с Keras моделью, не используйте его')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
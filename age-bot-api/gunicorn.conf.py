@@ -0,0 +1,40 @@
+"""
+Конфигурация gunicorn для Age-bot API
+
+По умолчанию - прежняя раскладка сервиса: 4 sync воркера по одному потоку
+(как gunicorn -w 4 --timeout 300). gthread (потоки процесса делят одну
+загруженную модель) включается переменными окружения, но только после
+замера load_test.py на целевом хосте.
+Хуки pre_fork/post_fork передают воркеру его номер для cpu_budget.py.
+
+Запуск:
+    gunicorn -c gunicorn.conf.py app:app
+    GUNICORN_WORKERS=2 GUNICORN_THREADS=8 GUNICORN_WORKER_CLASS=gthread gunicorn -c gunicorn.conf.py app:app
+"""
+
+import os
+
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', '5000')}")
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+workers = int(os.environ.get('GUNICORN_WORKERS', '4'))
+# Для gthread потоков стоит брать больше, чем ADMISSION_MAX_ACTIVE (см.
+# admission.py): лишние потоки ждут в очереди admission control или быстро
+# получают 503, а не висят в nginx
+threads = int(os.environ.get('GUNICORN_THREADS', '1'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '300'))
+
+# Локальный inference внутри процесса дополнительно ограничен
+# INFERENCE_CONCURRENCY (см. app.py): остальные потоки в это время
+# декодируют фото, ждут Face++ или отдают ответы
+
+
+def pre_fork(server, worker):
+    """Номер воркера 0..N-1: перезапущенный воркер занимает освободившийся слот"""
+    used = {getattr(w, 'age_bot_index', None) for w in server.WORKERS.values()}
+    worker.age_bot_index = next(i for i in range(len(used) + 1) if i not in used)
+
+
+def post_fork(server, worker):
+    # Читается cpu_budget при импорте app (бюджет ядер и pinning воркера)
+    os.environ['AGE_BOT_WORKERS'] = str(server.cfg.workers)
+    os.environ['AGE_BOT_WORKER_INDEX'] = str(worker.age_bot_index)
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+InsightFace провайдер для Age-bot API
+Загружает из пака buffalo_l только модули, нужные для возраста
+(детекция + gender/age). Распознавание (ArcFace) и 3D/2D landmarks
+загружаются только если их явно запросили.
+
+AdaptiveFaceAnalysis сначала ищет лица на маленьком входе детектора
+и увеличивает его только если лицо не найдено.
+"""
+
+import os
+import glob
+import threading
+import numpy as np
+
+INSIGHTFACE_MODEL = os.environ.get('INSIGHTFACE_MODEL', 'buffalo_l')
+
+# Модули для определения возраста
+AGE_MODULES = ('detection', 'genderage')
+
+# Дополнительные модули через запятую (recognition, landmark_3d_68, landmark_2d_106)
+# или "all" - полный пак как раньше
+INSIGHTFACE_EXTRA_MODULES = os.environ.get('INSIGHTFACE_EXTRA_MODULES', '')
+
+# Размеры входа детектора от меньшего к большему (селфи обычно находятся на 320)
+INSIGHTFACE_DET_SIZES = [
+    int(size) for size in os.environ.get('INSIGHTFACE_DET_SIZES', '320,480,640').split(',') if size.strip()
+]
+
+# Файлы моделей паков buffalo_* по taskname, чтобы не создавать
+# ONNX сессии для ненужных моделей ради определения их taskname
+MODULE_FILES = {
+    'detection': ('det_10g.onnx', 'det_2.5g.onnx', 'det_500m.onnx'),
+    'genderage': ('genderage.onnx',),
+    'recognition': ('w600k_r50.onnx', 'w600k_mbf.onnx'),
+    'landmark_3d_68': ('1k3d68.onnx',),
+    'landmark_2d_106': ('2d106det.onnx',),
+}
+
+
+def resolve_modules(extra_modules=None):
+    """
+    Список модулей для загрузки: возраст + запрошенные дополнительно
+
+    Возвращает None, если нужен полный пак
+    """
+    if extra_modules is None:
+        extra_modules = [m.strip() for m in INSIGHTFACE_EXTRA_MODULES.split(',') if m.strip()]
+    if 'all' in extra_modules:
+        return None
+    modules = list(AGE_MODULES)
+    for module in extra_modules:
+        if module not in modules:
+            modules.append(module)
+    return modules
+
+
+def _load_selected(name, modules, root, providers, **kwargs):
+    """FaceAnalysis только с выбранными модулями, загружая лишь их файлы"""
+    from insightface.app import FaceAnalysis
+    from insightface.model_zoo import model_zoo
+    from insightface.utils import ensure_available
+
+    model_dir = ensure_available('models', name, root=root)
+    available = {os.path.basename(p): p for p in glob.glob(os.path.join(model_dir, '*.onnx'))}
+
+    models = {}
+    for module in modules:
+        path = next((available[f] for f in MODULE_FILES.get(module, ()) if f in available), None)
+        if path is None:
+            return None
+        model = model_zoo.get_model(path, providers=providers, **kwargs)
+        if model is None or model.taskname != module:
+            return None
+        models[module] = model
+
+    # Тот же объект FaceAnalysis (prepare/get), но без лишних моделей
+    face_app = FaceAnalysis.__new__(FaceAnalysis)
+    face_app.models = models
+    face_app.model_dir = model_dir
+    face_app.det_model = models['detection']
+    return face_app
+
+
+def set_intra_op_threads(face_app, threads, providers):
+    """
+    Пересоздание ONNX сессий моделей с ограниченным числом потоков
+
+    model_zoo.get_model не принимает SessionOptions, а по умолчанию
+    ONNX Runtime берёт пул потоков на все ядра машины.
+    """
+    import onnxruntime
+
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    for model in face_app.models.values():
+        model.session = onnxruntime.InferenceSession(model.model_file, sess_options=options,
+                                                     providers=providers)
+
+
+def create_face_app(det_size=(640, 640), extra_modules=None, name=None,
+                    root='~/.insightface', providers=None, intra_op_threads=None, **kwargs):
+    """
+    Создание и подготовка FaceAnalysis
+
+    По умолчанию загружаются только detection и genderage;
+    extra_modules добавляет модули (например ['recognition']),
+    ['all'] - полный пак. intra_op_threads ограничивает потоки ONNX Runtime.
+    """
+    from insightface.app import FaceAnalysis
+
+    name = name or INSIGHTFACE_MODEL
+    providers = providers or ['CPUExecutionProvider']
+    modules = resolve_modules(extra_modules)
+
+    face_app = None
+    if modules is not None:
+        face_app = _load_selected(name, modules, root, providers, **kwargs)
+        if face_app is None:
+            # Неизвестная раскладка пака - фильтруем штатным allowed_modules
+            face_app = FaceAnalysis(name=name, root=root, allowed_modules=modules,
+                                    providers=providers, **kwargs)
+    else:
+        face_app = FaceAnalysis(name=name, root=root, providers=providers, **kwargs)
+
+    if intra_op_threads:
+        set_intra_op_threads(face_app, intra_op_threads, providers)
+
+    face_app.prepare(ctx_id=-1, det_size=det_size)
+    print(f'✅ InsightFace {name} modules: {", ".join(sorted(face_app.models))}')
+    return face_app
+
+
+class AdaptiveFaceAnalysis:
+    """
+    Обёртка над FaceAnalysis с политикой размера входа детектора
+
+    get() пробует размеры из det_sizes по возрастанию и останавливается
+    на первом, где найдено лицо. Все размеры прогреваются заранее
+    (ONNX Runtime и кэш anchor-центров детектора), поэтому переключение
+    размера не требует повторной инициализации.
+    """
+
+    def __init__(self, face_app, det_sizes=None, warmup=True):
+        self.face_app = face_app
+        self.det_model = face_app.det_model
+        sizes = sorted(set(det_sizes or INSIGHTFACE_DET_SIZES))
+        self.det_sizes = [(size, size) for size in sizes]
+        self._stats_lock = threading.Lock()
+        self._stats = {size: {'attempts': 0, 'hits': 0} for size in sizes}
+        self._misses = 0
+        if warmup:
+            self.prepare_shapes()
+
+    @property
+    def models(self):
+        return self.face_app.models
+
+    def prepare_shapes(self):
+        """Прогрев детектора на каждом размере входа"""
+        for size in self.det_sizes:
+            dummy = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+            self.det_model.detect(dummy, input_size=size, max_num=0, metric='default')
+
+    def detect(self, img, max_num=0):
+        """Детекция с наименьшим размером входа, на котором нашлось лицо"""
+        bboxes, kpss = None, None
+        for size in self.det_sizes:
+            bboxes, kpss = self.det_model.detect(img, input_size=size, max_num=max_num, metric='default')
+            found = bboxes.shape[0] > 0
+            with self._stats_lock:
+                self._stats[size[0]]['attempts'] += 1
+                if found:
+                    self._stats[size[0]]['hits'] += 1
+            if found:
+                return bboxes, kpss
+        with self._stats_lock:
+            self._misses += 1
+        return bboxes, kpss
+
+    def get(self, img, max_num=0):
+        """То же, что FaceAnalysis.get, но с адаптивным размером детектора"""
+        from insightface.app.common import Face
+
+        bboxes, kpss = self.detect(img, max_num=max_num)
+        faces = []
+        for i in range(bboxes.shape[0]):
+            face = Face(bbox=bboxes[i, 0:4], kps=kpss[i] if kpss is not None else None,
+                        det_score=bboxes[i, 4])
+            for taskname, model in self.face_app.models.items():
+                if taskname == 'detection':
+                    continue
+                model.get(img, face)
+            faces.append(face)
+        return faces
+
+    def get_stats(self):
+        """Как часто каждый размер входа находил лицо"""
+        with self._stats_lock:
+            sizes = {}
+            for size, item in self._stats.items():
+                attempts = item['attempts']
+                sizes[str(size)] = {
+                    'attempts': attempts,
+                    'hits': item['hits'],
+                    'success_rate': round(item['hits'] / attempts, 3) if attempts else None,
+                }
+            return {'sizes': sizes, 'no_face': self._misses}
+
+
+def create_adaptive_face_app(det_sizes=None, extra_modules=None, warmup=True, **kwargs):
+    """FaceAnalysis (только нужные модули) + адаптивный размер детектора"""
+    sizes = sorted(set(det_sizes or INSIGHTFACE_DET_SIZES))
+    largest = sizes[-1]
+    face_app = create_face_app(det_size=(largest, largest), extra_modules=extra_modules, **kwargs)
+    return AdaptiveFaceAnalysis(face_app, det_sizes=sizes, warmup=warmup)
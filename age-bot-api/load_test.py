@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест раскладок gunicorn: процессы x потоки
+
+Для каждой раскладки поднимается gunicorn (gunicorn.conf.py), на него
+подаётся поток запросов /api/estimate-age с заданной конкурентностью,
+затем снимается суммарная память master + воркеров (RSS и PSS).
+Раскладка с одним потоком запускается sync воркерами (как раньше),
+остальные - gthread. Кэш оценок в сервисе отключён (AGE_CACHE_SIZE=0).
+
+Пример:
+    python load_test.py --layouts 4x1,2x2,1x4 --images ./faces_dir --requests 400 --concurrency 8
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import base64
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from bench_utils import latency_summary, load_labeled_images, process_tree_memory_mb, format_table
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_payloads(images_dir, limit):
+    """base64 фото для запросов (синтетическое фото, если директория не задана)"""
+    if images_dir:
+        payloads = []
+        for path, _ in load_labeled_images(images_dir)[:limit]:
+            with open(path, 'rb') as f:
+                payloads.append(base64.b64encode(f.read()).decode('utf-8'))
+        return payloads
+
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('RGB', (640, 640), color=(128, 128, 128)).save(buffer, format='JPEG')
+    return [base64.b64encode(buffer.getvalue()).decode('utf-8')]
+
+
+def parse_layout(layout):
+    workers, threads = layout.lower().split('x')
+    return int(workers), int(threads)
+
+
+def start_server(app_spec, workers, threads, port, rate_limit_db):
+    # Без лимитов и со своей базой корзин: тест не получает 429 и не
+    # расходует корзины запущенного на хосте сервиса
+    env = dict(os.environ, AGE_CACHE_SIZE='0', RATE_LIMITS='', RATE_LIMIT_DB=rate_limit_db)
+    worker_class = 'sync' if threads == 1 else 'gthread'
+    cmd = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+           '-w', str(workers), '--threads', str(threads), '-k', worker_class,
+           '-b', f'127.0.0.1:{port}', app_spec]
+    return subprocess.Popen(cmd, cwd=SERVICE_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_ready(base_url, proc, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            return False
+        try:
+            if requests.get(base_url + '/health', timeout=2).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def run_load(base_url, payloads, total, concurrency, timeout):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+    session.mount('http://', adapter)
+    endpoint = base_url + '/api/estimate-age'
+
+    def one(idx):
+        t0 = time.perf_counter()
+        try:
+            response = session.post(endpoint, json={'image': payloads[idx % len(payloads)]}, timeout=timeout)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        return (time.perf_counter() - t0) * 1000, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - started
+    return results, elapsed
+
+
+def test_layout(args, layout, payloads):
+    workers, threads = parse_layout(layout)
+    base_url = f'http://127.0.0.1:{args.port}'
+    state_dir = tempfile.TemporaryDirectory(prefix='age-bot-load-test-')
+    proc = start_server(args.app, workers, threads, args.port,
+                        os.path.join(state_dir.name, 'ratelimit.sqlite'))
+    try:
+        if not wait_ready(base_url, proc, args.startup_timeout):
+            print(f'   ❌ {layout}: server did not start')
+            return None
+
+        # Прогрев: по запросу на каждый поток каждого воркера
+        run_load(base_url, payloads, workers * threads, workers * threads, args.timeout)
+
+        results, elapsed = run_load(base_url, payloads, args.requests, args.concurrency, args.timeout)
+        memory = process_tree_memory_mb(proc.pid)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+        state_dir.cleanup()
+
+    latencies = [ms for ms, ok in results if ok]
+    result = {
+        'layout': layout,
+        'worker_class': 'sync' if threads == 1 else 'gthread',
+        'throughput_rps': len(latencies) / elapsed if elapsed > 0 else None,
+        'errors': len(results) - len(latencies),
+        'rss_total_mb': memory['rss_mb'],
+        'pss_total_mb': memory['pss_mb'],
+        'processes': memory['processes'],
+    }
+    result.update(latency_summary(latencies))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Gunicorn processes x threads load test')
+    parser.add_argument('--layouts', default='4x1,2x2,1x4', help='раскладки WORKERSxTHREADS')
+    parser.add_argument('--app', default='app:app')
+    parser.add_argument('--images', help='директория фото (по умолчанию синтетическое фото)')
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--startup-timeout', type=float, default=180.0)
+    parser.add_argument('--json', help='сохранить отчёт в JSON')
+    args = parser.parse_args()
+
+    payloads = load_payloads(args.images, args.limit)
+    if not payloads:
+        raise SystemExit('❌ No images to send')
+
+    results = []
+    for layout in [l.strip() for l in args.layouts.split(',') if l.strip()]:
+        print(f'▶️  Layout {layout}...')
+        result = test_layout(args, layout, payloads)
+        if result:
+            results.append(result)
+
+    columns = ['layout', 'worker_class', 'throughput_rps', 'errors', 'mean_ms', 'p50_ms', 'p95_ms',
+               'p99_ms', 'rss_total_mb', 'pss_total_mb', 'processes']
+    print(format_table(results, columns))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'💾 Report saved: {args.json}')
+
+
+if __name__ == '__main__':
+    main()
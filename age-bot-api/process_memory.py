@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+"""
+Память текущего процесса для сервисов и бенчмарков Age-bot API
+"""
+
+import resource
+
+
+def rss_mb():
+    """Текущий RSS процесса в мегабайтах (Linux /proc, иначе пиковый RSS)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+
+def peak_rss_mb():
+    """Пиковый RSS процесса в мегабайтах"""
+    # На Linux ru_maxrss в килобайтах
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
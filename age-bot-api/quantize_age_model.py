@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Офлайн квантизация age_googlenet.onnx в INT8 (static quantization)
+
+Калибровка выполняется на реальных лицах: каждое фото проходит ту же
+детекцию (Haar Cascade) и предобработку, что и в app_onnx_refined.py,
+поэтому диапазоны активаций соответствуют боевому трафику.
+
+Пример:
+    python quantize_age_model.py --calib-dir ./calib_faces
+    AGE_MODEL_VARIANT=int8 gunicorn app_onnx_refined:app
+"""
+
+import os
+import argparse
+import tempfile
+import cv2
+import onnxruntime as ort
+from onnxruntime.quantization import (
+    CalibrationDataReader,
+    CalibrationMethod,
+    QuantFormat,
+    QuantType,
+    quantize_static,
+)
+from onnxruntime.quantization.shape_inference import quant_pre_process
+
+# Нужны только детектор и предобработка, FP32 модель при импорте не грузится
+os.environ['AGE_MODEL_PRELOAD'] = '0'
+import app_onnx_refined
+from bench_utils import IMAGE_EXTENSIONS
+
+
+class FaceCalibrationReader(CalibrationDataReader):
+    """Отдаёт предобработанные лица из директории калибровочных фото"""
+
+    def __init__(self, calib_dir, input_name, max_images=200):
+        self.input_name = input_name
+        self.samples = []
+
+        names = sorted(n for n in os.listdir(calib_dir) if n.lower().endswith(IMAGE_EXTENSIONS))
+        for name in names:
+            if len(self.samples) >= max_images:
+                break
+            img_bgr = cv2.imread(os.path.join(calib_dir, name))
+            if img_bgr is None:
+                continue
+            face_box = app_onnx_refined.detect_face(img_bgr)
+            if face_box is None:
+                continue
+            (x, y, w, h) = face_box
+            face_img = img_bgr[y:y+h, x:x+w]
+            if face_img.size == 0:
+                continue
+            self.samples.append(app_onnx_refined.preprocess_face(face_img))
+
+        print(f'📦 Calibration set: {len(self.samples)} faces from {len(names)} images')
+        self._iter = iter(self.samples)
+
+    def get_next(self):
+        sample = next(self._iter, None)
+        if sample is None:
+            return None
+        return {self.input_name: sample}
+
+    def rewind(self):
+        self._iter = iter(self.samples)
+
+
+def quantize(model_path, output_path, calib_dir, max_images=200,
+             per_channel=False, quant_format='QDQ', method='MinMax'):
+    """Static INT8 квантизация модели возраста с калибровкой на лицах"""
+    # Имя входа той модели, которая квантуется (--model)
+    session = ort.InferenceSession(model_path, providers=['CPUExecutionProvider'])
+    input_name = session.get_inputs()[0].name
+    del session
+
+    reader = FaceCalibrationReader(calib_dir, input_name, max_images=max_images)
+    if not reader.samples:
+        raise RuntimeError(f'No faces found in calibration dir: {calib_dir}')
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Shape inference + constant folding перед квантизацией (рекомендация ORT)
+        prepared_path = os.path.join(tmp_dir, 'age_googlenet_prepared.onnx')
+        quant_pre_process(model_path, prepared_path, skip_symbolic_shape=True)
+
+        quantize_static(
+            prepared_path,
+            output_path,
+            reader,
+            quant_format=QuantFormat.QDQ if quant_format == 'QDQ' else QuantFormat.QOperator,
+            per_channel=per_channel,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            calibrate_method=getattr(CalibrationMethod, method),
+        )
+
+    fp32_size = os.path.getsize(model_path) / 1024 / 1024
+    int8_size = os.path.getsize(output_path) / 1024 / 1024
+    print(f'✅ INT8 model saved: {output_path}')
+    print(f'   Size: {fp32_size:.1f} MB → {int8_size:.1f} MB')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Static INT8 quantization of age_googlenet.onnx')
+    parser.add_argument('--calib-dir', required=True, help='директория с фото лиц для калибровки')
+    parser.add_argument('--model', default=app_onnx_refined.get_age_model_path('fp32'))
+    parser.add_argument('--output', default=app_onnx_refined.get_age_model_path('int8'))
+    parser.add_argument('--max-images', type=int, default=200)
+    parser.add_argument('--per-channel', action='store_true', help='per-channel квантизация весов')
+    parser.add_argument('--format', choices=['QDQ', 'QOperator'], default='QDQ')
+    parser.add_argument('--method', choices=['MinMax', 'Entropy', 'Percentile'], default='MinMax')
+    args = parser.parse_args()
+
+    quantize(args.model, args.output, args.calib_dir, max_images=args.max_images,
+             per_channel=args.per_channel, quant_format=args.format, method=args.method)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Ограничение частоты запросов клиента (token bucket) для Age-bot API
+
+Ключ клиента - реальный IP (nginx восстанавливает его из CF-Connecting-IP
+только для адресов Cloudflare и передаёт в X-Real-IP) или user id. Состояние корзин общее для всех
+воркеров gunicorn: SQLite файл в /dev/shm, каждое списание токена -
+одна короткая транзакция BEGIN IMMEDIATE.
+
+Переменные окружения:
+    RATE_LIMITS=estimate=30/60,collage=5/60 - запросов за секунд по маршрутам
+                                              (ёмкость корзины = число запросов),
+                                              пустое значение (RATE_LIMITS=) выключает лимиты
+    RATE_LIMIT_KEY=ip                       - ip или user (X-User-Id от доверенного прокси, иначе IP)
+    RATE_LIMIT_DB=/dev/shm/age-bot-ratelimit.sqlite
+    RATE_LIMIT_TRUSTED_PROXIES=127.0.0.1,::1 - от кого принимать заголовки с IP клиента
+"""
+
+import os
+import math
+import time
+import sqlite3
+import tempfile
+import threading
+from functools import wraps
+
+from flask import jsonify, request
+
+# Заголовок с IP клиента от доверенного прокси. CF-Connecting-IP и
+# X-Forwarded-For клиент может подставить сам, поэтому они не читаются:
+# nginx проверяет их источник (set_real_ip_from) и пишет результат сюда
+CLIENT_IP_HEADER = 'X-Real-IP'
+
+# Раз в сколько списаний удалять давно не использованные корзины
+CLEANUP_EVERY = 1000
+
+
+def parse_limits(value):
+    """"estimate=30/60,collage=5/60" -> {'estimate': (30, 60.0), ...}"""
+    limits = {}
+    for item in value.split(','):
+        if '=' not in item:
+            continue
+        route, spec = item.split('=', 1)
+        requests_count, period = spec.split('/', 1)
+        limits[route.strip()] = (int(requests_count), float(period))
+    return limits
+
+
+def default_db_path():
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(base, 'age-bot-ratelimit.sqlite')
+
+
+class RateLimiter:
+    """Token bucket на клиента и маршрут с общим для воркеров SQLite состоянием"""
+
+    def __init__(self, limits, db_path, key_mode='ip', trusted_proxies=('127.0.0.1', '::1')):
+        self.limits = limits
+        self.db_path = db_path
+        self.key_mode = key_mode
+        self.trusted_proxies = set(trusted_proxies)
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._stats = {}
+        self._calls = 0
+        try:
+            self._init_db()
+        except sqlite3.Error as e:
+            print(f'⚠️ Rate limiter disabled until {db_path} is available: {e}')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=1.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        conn.execute('CREATE TABLE IF NOT EXISTS buckets '
+                     '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)')
+        conn.execute('CREATE TABLE IF NOT EXISTS throttled '
+                     '(route TEXT PRIMARY KEY, count INTEGER NOT NULL)')
+
+    def client_key(self):
+        """user id или реальный IP клиента
+
+        Заголовки X-User-Id и X-Real-IP принимаются только от доверенного
+        прокси: иначе клиент менял бы ключ на каждый запрос
+        """
+        remote = request.remote_addr or ''
+        if self.key_mode == 'user' and remote in self.trusted_proxies:
+            user_id = request.headers.get('X-User-Id', '').strip()
+            if user_id:
+                return f'user:{user_id}'
+        if remote in self.trusted_proxies:
+            value = request.headers.get(CLIENT_IP_HEADER, '').strip()
+            if value:
+                return f'ip:{value}'
+        return f'ip:{remote}'
+
+    def take(self, route, client_key):
+        """
+        Списание токена
+
+        Возвращает (разрешён ли запрос, через сколько секунд появится токен)
+        """
+        capacity, period = self.limits[route]
+        rate = capacity / period
+        key = f'{route}|{client_key}'
+        now = time.time()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            else:
+                conn.execute('INSERT INTO throttled (route, count) VALUES (?, 1) '
+                             'ON CONFLICT(route) DO UPDATE SET count = count + 1', (route,))
+            conn.execute('INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)',
+                         (key, tokens, now))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+    def _cleanup(self):
+        # Полная корзина ничем не отличается от отсутствующей
+        max_period = max(period for _, period in self.limits.values())
+        self._connect().execute('DELETE FROM buckets WHERE updated < ?', (time.time() - max_period,))
+
+    def _count(self, route, name):
+        with self._stats_lock:
+            stats = self._stats.setdefault(route, {'allowed': 0, 'throttled': 0, 'errors': 0})
+            stats[name] += 1
+            self._calls += 1
+            return self._calls % CLEANUP_EVERY == 0
+
+    def limit(self, route):
+        """Декоратор Flask endpoint: 429 + Retry-After при превышении лимита"""
+        def decorator(fn):
+            if route not in self.limits:
+                return fn
+
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                try:
+                    allowed, retry_after = self.take(route, self.client_key())
+                except sqlite3.Error as e:
+                    # Лимитер не должен ронять сервис: пропускаем запрос
+                    print(f'⚠️ Rate limiter error: {e}')
+                    self._count(route, 'errors')
+                    return fn(*args, **kwargs)
+
+                if self._count(route, 'allowed' if allowed else 'throttled'):
+                    try:
+                        self._cleanup()
+                    except sqlite3.Error:
+                        pass
+                if not allowed:
+                    retry_after = max(1, math.ceil(retry_after))
+                    response = jsonify({
+                        'success': False,
+                        'error': 'Too many requests',
+                        'retryAfter': retry_after,
+                    })
+                    response.headers['Retry-After'] = str(retry_after)
+                    return response, 429
+                return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def get_metrics(self):
+        """Счётчики воркера и суммарные throttled по всем воркерам"""
+        with self._stats_lock:
+            worker = {route: dict(stats) for route, stats in self._stats.items()}
+        try:
+            rows = self._connect().execute('SELECT route, count FROM throttled').fetchall()
+            throttled_total = dict(rows)
+        except sqlite3.Error:
+            throttled_total = None
+        return {
+            'limits': {route: f'{count}/{period:g}s' for route, (count, period) in self.limits.items()},
+            'key': self.key_mode,
+            'worker': worker,
+            'throttled_total': throttled_total,
+        }
+
+
+def create_rate_limiter():
+    """RateLimiter из переменных окружения"""
+    return RateLimiter(
+        limits=parse_limits(os.environ.get('RATE_LIMITS', 'estimate=30/60,collage=5/60')),
+        db_path=os.environ.get('RATE_LIMIT_DB', default_db_path()),
+        key_mode=os.environ.get('RATE_LIMIT_KEY', 'ip'),
+        trusted_proxies=[p.strip() for p in
+                         os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', '127.0.0.1,::1').split(',') if p.strip()],
+    )
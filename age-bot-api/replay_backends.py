@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Офлайн прогон размеченных фото через все бэкенды определения возраста
+
+Локальные бэкенды вызываются в процессе через их estimate_age,
+удалённые (Face++, AWS, Google Vision) - только если поднят локальный
+stand-in (экземпляр app_*.py с заглушкой API), адрес передаётся через --remote.
+Каждый бэкенд запускается в отдельном процессе, чтобы пиковый RSS
+относился только к нему.
+
+Источники фото:
+  - директория (labels.csv или имена в стиле UTKFace, см. bench_utils)
+  - .rec файл MXNet RecordIO, как его пишет convert_rec.py (label = [gender, age])
+
+Пример:
+    python replay_backends.py --images ./labeled_faces
+    python replay_backends.py --rec /data/megaage/val.rec --limit 2000 \\
+        --backends cv2,onnx_refined,facepp --remote facepp=http://127.0.0.1:5101
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import struct
+import base64
+import inspect
+import argparse
+import subprocess
+
+from bench_utils import peak_rss_mb, latency_summary, load_labeled_images, format_table
+
+LOCAL_BACKENDS = {
+    'heuristic': 'app_heuristic',
+    'advanced': 'app_advanced',
+    'cv2': 'app_cv2',
+    'onnx_refined': 'app_onnx_refined',
+    'ssrnet': 'app_ssrnet',
+    'insightface': 'app_insightface',
+    'service': 'app',
+}
+REMOTE_BACKENDS = ('facepp', 'aws', 'google_vision')
+DEFAULT_BACKENDS = ['heuristic', 'advanced', 'cv2', 'onnx_refined', 'ssrnet', 'insightface',
+                    'facepp', 'aws', 'google_vision']
+
+RECORDIO_MAGIC = 0xced7230a
+IRHEADER_FORMAT = 'IfQQ'
+IRHEADER_SIZE = struct.calcsize(IRHEADER_FORMAT)
+
+
+def read_recordio(rec_path):
+    """
+    Чтение MXNet RecordIO без зависимости от mxnet
+
+    Возвращает генератор (label, image_bytes), label - список float
+    """
+    magic_bytes = struct.pack('<I', RECORDIO_MAGIC)
+    with open(rec_path, 'rb') as f:
+        parts = []
+        while True:
+            head = f.read(8)
+            if len(head) < 8:
+                break
+            magic, lrec = struct.unpack('<II', head)
+            if magic != RECORDIO_MAGIC:
+                raise ValueError(f'Invalid RecordIO magic in {rec_path}')
+            cflag, length = lrec >> 29, lrec & ((1 << 29) - 1)
+            data = f.read(length)
+            f.read((4 - length % 4) % 4)
+
+            # cflag: 0 - целая запись, 1 - начало, 2 - середина, 3 - конец
+            # (при разбиении записи writer вырезает magic на границе частей)
+            if cflag == 0:
+                record = data
+            elif cflag == 1:
+                parts = [data]
+                continue
+            else:
+                parts.append(magic_bytes + data)
+                if cflag == 2:
+                    continue
+                record = b''.join(parts)
+                parts = []
+
+            flag, label, _, _ = struct.unpack(IRHEADER_FORMAT, record[:IRHEADER_SIZE])
+            payload = record[IRHEADER_SIZE:]
+            if flag > 0:
+                labels = list(struct.unpack(f'{flag}f', payload[:4 * flag]))
+                payload = payload[4 * flag:]
+            else:
+                labels = [label]
+            yield labels, payload
+
+
+def iter_samples(args):
+    """(имя, возраст, байты изображения) из директории или .rec"""
+    count = 0
+    if args.rec:
+        for idx, (labels, payload) in enumerate(read_recordio(args.rec)):
+            if args.limit and count >= args.limit:
+                return
+            age = int(labels[args.rec_age_index]) if len(labels) > args.rec_age_index else None
+            count += 1
+            yield f'rec#{idx}', age, payload
+    else:
+        for path, age in load_labeled_images(args.images):
+            if args.limit and count >= args.limit:
+                return
+            with open(path, 'rb') as f:
+                payload = f.read()
+            count += 1
+            yield os.path.basename(path), age, payload
+
+
+def make_local_caller(module):
+    """Функция image -> age для модуля бэкенда, вызываемая в процессе"""
+    fn = getattr(module, 'estimate_age', None)
+    if fn is not None and len(inspect.signature(fn).parameters) == 1:
+        return fn
+
+    if fn is None and hasattr(module, 'detect_face_and_features'):
+        # app_heuristic: детекция + оценка по признакам
+        def heuristic(image):
+            features = module.detect_face_and_features(image)
+            return module.estimate_age_from_features(features) if features else None
+        return heuristic
+
+    # estimate_age - Flask endpoint: вызываем через test_client без сети
+    client = module.app.test_client()
+
+    def via_endpoint(image):
+        response = client.post('/api/estimate-age', json={'image': encode_image(image)})
+        return (response.get_json() or {}).get('age')
+    return via_endpoint
+
+
+def make_remote_caller(url, timeout):
+    """Функция image -> age через HTTP к локальному stand-in бэкенду"""
+    import requests
+    session = requests.Session()
+    endpoint = url.rstrip('/') + '/api/estimate-age'
+
+    def remote(image):
+        response = session.post(endpoint, json={'image': encode_image(image)}, timeout=timeout)
+        return (response.json() or {}).get('age')
+    return remote
+
+
+def encode_image(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=95)
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+
+def run_backend(args):
+    """Прогон одного бэкенда (дочерний процесс), результат - JSON в stdout"""
+    from PIL import Image
+
+    name = args.worker
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    t0 = time.perf_counter()
+    if name in REMOTE_BACKENDS:
+        caller = make_remote_caller(args.remote_url, args.timeout)
+    else:
+        import importlib
+        caller = make_local_caller(importlib.import_module(LOCAL_BACKENDS[name]))
+    load_ms = (time.perf_counter() - t0) * 1000
+
+    samples = []
+    for sample_name, age, payload in iter_samples(args):
+        image = Image.open(io.BytesIO(payload))
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.load()
+        samples.append((sample_name, age, image))
+
+    for _, _, image in samples[:args.warmup]:
+        caller(image)
+
+    latencies, errors, failures = [], [], 0
+    replay_start = time.perf_counter()
+    for _, age, image in samples:
+        t0 = time.perf_counter()
+        try:
+            predicted = caller(image)
+        except Exception as e:
+            print(f'⚠️ {name}: {e}', file=sys.stderr)
+            predicted = None
+        latencies.append((time.perf_counter() - t0) * 1000)
+        if predicted is None:
+            failures += 1
+        elif age is not None:
+            errors.append(abs(float(predicted) - age))
+    replay_s = time.perf_counter() - replay_start
+
+    result = {
+        'backend': name,
+        'images': len(samples),
+        'load_ms': load_ms,
+        'throughput_ips': len(samples) / replay_s if replay_s > 0 else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'failures': failures,
+        'mae': sum(errors) / len(errors) if errors else None,
+        'labeled': len(errors),
+    }
+    result.update(latency_summary(latencies))
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay labeled faces through age backends')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--images', help='директория размеченных фото')
+    source.add_argument('--rec', help='.rec файл (формат convert_rec.py)')
+    parser.add_argument('--rec-age-index', type=int, default=1,
+                        help='индекс возраста в label записи (convert_rec.py: [gender, age])')
+    parser.add_argument('--backends', default=','.join(DEFAULT_BACKENDS))
+    parser.add_argument('--remote', action='append', default=[],
+                        help='name=URL локального stand-in для удалённого бэкенда')
+    parser.add_argument('--limit', type=int, default=0)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--json', help='сохранить отчёт в JSON')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--remote-url', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_backend(args)
+        return
+
+    remotes = dict(item.split('=', 1) for item in args.remote)
+    results = []
+    for name in [b.strip() for b in args.backends.split(',') if b.strip()]:
+        if name in REMOTE_BACKENDS and name not in remotes:
+            print(f'⏭️  {name}: no local stand-in (--remote {name}=URL), skipped')
+            continue
+        if name not in REMOTE_BACKENDS and name not in LOCAL_BACKENDS:
+            print(f'⚠️ Unknown backend: {name}')
+            continue
+
+        print(f'▶️  Replaying through {name}...')
+        cmd = [sys.executable, os.path.abspath(__file__), '--worker', name,
+               '--rec-age-index', str(args.rec_age_index), '--limit', str(args.limit),
+               '--warmup', str(args.warmup), '--timeout', str(args.timeout)]
+        cmd += ['--rec', args.rec] if args.rec else ['--images', args.images]
+        if name in remotes:
+            cmd += ['--remote-url', remotes[name]]
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        lines = [l for l in proc.stdout.splitlines() if l.startswith('{')]
+        if proc.returncode != 0 or not lines:
+            tail = proc.stderr.strip().splitlines()[-1:] or [f'exit code {proc.returncode}']
+            print(f'   ❌ {name} failed: {tail[0]}')
+            continue
+        results.append(json.loads(lines[-1]))
+
+    columns = ['backend', 'images', 'failures', 'mae', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms',
+               'throughput_ips', 'peak_rss_mb', 'load_ms']
+    print(format_table(results, columns))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'💾 Report saved: {args.json}')
+
+
+if __name__ == '__main__':
+    main()
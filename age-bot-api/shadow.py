@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Shadow-режим: оценка альтернативного бэкенда на живом трафике
+
+Часть запросов (SHADOW_SAMPLE_RATE) после ответа основного провайдера
+копируется во вторичный провайдер. Он работает в отдельном процессе
+(spawn) с пониженным приоритетом (nice) и импортируется там при первом
+shadow-вызове, поэтому его модели не загружаются в процесс сервиса.
+Копия занимает слот inference_semaphore сервиса (INFERENCE_CONCURRENCY) без
+ожидания: если все слоты заняты основными запросами или в очереди уже
+SHADOW_MAX_PENDING задач, копия просто отбрасывается, так что основной
+трафик никогда не ждёт shadow-вызов.
+
+Обе оценки и обе задержки пишутся строкой JSON в SHADOW_LOG:
+    {"ts": ..., "img": "<sha256[:16]>", "p": "insightface", "p_age": 35, "p_ms": 41.2,
+     "s": "app_onnx_refined:estimate_age", "s_age": 33, "s_ms": 18.7}
+
+Переменные окружения:
+    SHADOW_SAMPLE_RATE=0      - доля запросов (0 - выключено, 1 - все)
+    SHADOW_PROVIDER=app_onnx_refined:estimate_age - "модуль:функция(image) -> age"
+    SHADOW_WORKERS=1 (процессов), SHADOW_MAX_PENDING=4, SHADOW_NICE=10
+    SHADOW_LOG=shadow_log.jsonl, SHADOW_LOG_MAX_MB=50
+
+Сводка по логу:
+    python shadow.py shadow_log.jsonl
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import importlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Вторичный провайдер в процессе пула (импортируется при первом вызове)
+_provider = None
+
+
+def _init_worker(nice):
+    """Пониженный приоритет процесса пула"""
+    try:
+        os.nice(nice)
+    except OSError:
+        pass
+
+
+def _call_provider(provider_spec, image):
+    """Оценка вторичным провайдером в процессе пула: (возраст, мс)"""
+    global _provider
+    if _provider is None:
+        module_name, _, function_name = provider_spec.partition(':')
+        module = importlib.import_module(module_name)
+        _provider = getattr(module, function_name or 'estimate_age')
+        print(f'👥 Shadow provider loaded: {provider_spec}')
+    t0 = time.perf_counter()
+    age = _provider(image)
+    return age, (time.perf_counter() - t0) * 1000
+
+
+class ShadowRunner:
+    """Фоновая отправка выборки запросов во вторичный провайдер"""
+
+    def __init__(self, provider_spec, sample_rate, log_path, workers=1, max_pending=4,
+                 nice=10, log_max_mb=50, gate=None):
+        self.provider_spec = provider_spec
+        self.sample_rate = sample_rate
+        self.log_path = log_path
+        self.max_pending = max_pending
+        self.log_max_bytes = int(log_max_mb * 1024 * 1024)
+        # Семафор inference сервиса: копия занимает его слот только если он свободен
+        self.gate = gate
+        self._provider_failed = False
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+        self._stats = {'submitted': 0, 'dropped': 0, 'busy': 0, 'completed': 0, 'errors': 0}
+        self._pending = 0
+        self._executor = None
+        if sample_rate > 0:
+            # Процессы запускаются при первой копии, не при импорте сервиса
+            self._executor = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker, initargs=(nice,))
+
+    def submit(self, image, image_key, primary_provider, primary_age, primary_ms):
+        """
+        Копия запроса во вторичный провайдер (не блокирует)
+
+        Возвращает True, если копия поставлена в очередь
+        """
+        if self._executor is None or random.random() >= self.sample_rate:
+            return False
+        with self._lock:
+            if self._pending >= self.max_pending or self._provider_failed:
+                self._stats['dropped'] += 1
+                return False
+            if self.gate is not None and not self.gate.acquire(blocking=False):
+                self._stats['busy'] += 1
+                return False
+            self._pending += 1
+            self._stats['submitted'] += 1
+        record = {
+            'ts': round(time.time(), 3),
+            'img': image_key[:16],
+            'p': primary_provider,
+            'p_age': primary_age,
+            'p_ms': round(primary_ms, 1),
+        }
+        try:
+            future = self._executor.submit(_call_provider, self.provider_spec, image)
+        except Exception as e:
+            print(f'⚠️ Shadow submit failed: {e}')
+            self._finish('errors')
+            return False
+        future.add_done_callback(lambda f: self._done(f, record))
+        return True
+
+    def _finish(self, name):
+        if self.gate is not None:
+            self.gate.release()
+        with self._lock:
+            self._pending -= 1
+            self._stats[name] += 1
+
+    def _done(self, future, record):
+        try:
+            age, ms = future.result()
+        except (ImportError, AttributeError) as e:
+            print(f'❌ Failed to load shadow provider {self.provider_spec}: {e}')
+            self._provider_failed = True
+            self._finish('errors')
+            return
+        except Exception as e:
+            print(f'⚠️ Shadow call failed: {e}')
+            self._finish('errors')
+            return
+        record.update(s=self.provider_spec, s_age=age, s_ms=round(ms, 1))
+        try:
+            self._write(record)
+        finally:
+            self._finish('completed')
+
+    def _write(self, record):
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self._log_lock:
+            try:
+                if os.path.getsize(self.log_path) > self.log_max_bytes:
+                    os.replace(self.log_path, self.log_path + '.1')
+            except OSError:
+                pass
+            with open(self.log_path, 'a') as f:
+                f.write(line)
+
+    def get_metrics(self):
+        with self._lock:
+            return dict(self._stats, pending=self._pending, sample_rate=self.sample_rate,
+                        provider=self.provider_spec if self._executor else None)
+
+
+def create_shadow_runner(gate=None):
+    """ShadowRunner из переменных окружения (gate - семафор inference сервиса)"""
+    return ShadowRunner(
+        provider_spec=os.environ.get('SHADOW_PROVIDER', 'app_onnx_refined:estimate_age'),
+        sample_rate=float(os.environ.get('SHADOW_SAMPLE_RATE', '0')),
+        log_path=os.environ.get('SHADOW_LOG', os.path.join(SERVICE_DIR, 'shadow_log.jsonl')),
+        workers=int(os.environ.get('SHADOW_WORKERS', '1')),
+        max_pending=int(os.environ.get('SHADOW_MAX_PENDING', '4')),
+        nice=int(os.environ.get('SHADOW_NICE', '10')),
+        log_max_mb=float(os.environ.get('SHADOW_LOG_MAX_MB', '50')),
+        gate=gate,
+    )
+
+
+def summarize(log_paths):
+    """Сводка shadow-лога: расхождение оценок и задержки обоих провайдеров"""
+    from bench_utils import latency_summary, format_table
+
+    records = []
+    for path in log_paths:
+        with open(path) as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+
+    both = [r for r in records if r.get('p_age') is not None and r.get('s_age') is not None]
+    diffs = [r['s_age'] - r['p_age'] for r in both]
+    print(f'📄 Records: {len(records)}, both estimated: {len(both)}')
+    if diffs:
+        print(f"   mean abs diff: {sum(abs(d) for d in diffs) / len(diffs):.2f} years, "
+              f"mean bias (shadow - primary): {sum(diffs) / len(diffs):+.2f}, "
+              f"within 5 years: {sum(1 for d in diffs if abs(d) <= 5) / len(diffs):.1%}")
+    print(f"   primary failures: {sum(1 for r in records if r.get('p_age') is None)}, "
+          f"shadow failures: {sum(1 for r in records if r.get('s_age') is None)}")
+
+    rows = []
+    for side in ('p', 's'):
+        names = {r.get(side) for r in records}
+        for name in sorted(n for n in names if n):
+            latencies = [r[f'{side}_ms'] for r in records if r.get(side) == name and f'{side}_ms' in r]
+            rows.append(dict(latency_summary(latencies), side='primary' if side == 'p' else 'shadow',
+                             provider=name))
+    print(format_table(rows, ['side', 'provider', 'count', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Summarize shadow traffic log')
+    parser.add_argument('logs', nargs='*', default=[os.path.join(SERVICE_DIR, 'shadow_log.jsonl')])
+    args = parser.parse_args()
+    sys.path.insert(0, SERVICE_DIR)
+    summarize(args.logs)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Профиль настроек производительности Age-bot API
+
+Значения по умолчанию - прежние константы app.py. autotune.py подбирает
+их под конкретный хост и пишет tuned_profile.json, который загружается
+при старте воркера (путь - TUNED_PROFILE_PATH). Переменные окружения
+из ENV_OVERRIDES важнее профиля.
+
+Модуль не импортирует numpy и библиотеки inference: его читает cpu_budget
+до их загрузки.
+"""
+
+import os
+import json
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+TUNED_PROFILE_PATH = os.environ.get('TUNED_PROFILE_PATH', os.path.join(SERVICE_DIR, 'tuned_profile.json'))
+
+DEFAULT_PROFILE = {
+    # Потоки на воркер (None - доля ядер из cpu_budget)
+    'threads_per_worker': None,
+    # Одновременных локальных inference в процессе
+    'inference_concurrency': 2,
+    # Размеры входа детектора InsightFace (по возрастанию)
+    'det_sizes': [320, 480, 640],
+    # Потоки пула обработки пары фото /api/estimate-age/pair
+    'pair_workers': 2,
+    # Длинная сторона при декодировании JPEG для inference (None - полный размер)
+    'inference_decode_size': None,
+    # JPEG для Face++
+    'facepp_jpeg_quality': 95,
+    # Коллаж: размер квадратного фото, JPEG декодируется сразу в уменьшенном масштабе
+    'collage_photo_size': 800,
+    'collage_decode_draft': False,
+    # Коллаж: профиль JPEG энкодера (subsampling None - по умолчанию PIL)
+    'collage_jpeg_quality': 95,
+    'collage_jpeg_optimize': True,
+    'collage_jpeg_subsampling': None,
+}
+
+ENV_OVERRIDES = {
+    'threads_per_worker': 'CPU_THREADS_PER_WORKER',
+    'inference_concurrency': 'INFERENCE_CONCURRENCY',
+    'det_sizes': 'INSIGHTFACE_DET_SIZES',
+}
+
+
+def _parse_env(key, value):
+    if key == 'det_sizes':
+        return [int(size) for size in value.split(',') if size.strip()]
+    return int(value)
+
+
+def load_profile(path=None):
+    """Профиль по умолчанию, дополненный файлом и переменными окружения"""
+    path = path or TUNED_PROFILE_PATH
+    profile = dict(DEFAULT_PROFILE)
+    if os.path.exists(path):
+        try:
+            with open(path) as f:
+                tuned = json.load(f)
+            for key, value in tuned.items():
+                if key.startswith('_'):
+                    continue  # метаданные autotune
+                if key not in DEFAULT_PROFILE:
+                    print(f'⚠️ Unknown tuning key ignored: {key}')
+                    continue
+                profile[key] = value
+            print(f'🎛️ Tuned profile loaded: {path}')
+        except (OSError, ValueError) as e:
+            print(f'⚠️ Failed to load tuned profile {path}: {e}')
+
+    for key, env_name in ENV_OVERRIDES.items():
+        value = os.environ.get(env_name)
+        if value:
+            profile[key] = _parse_env(key, value)
+    return profile
+
+
+profile = load_profile()
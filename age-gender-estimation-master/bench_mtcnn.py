@@ -0,0 +1,516 @@
+# coding: utf-8
+"""
+    Benchmarks for the MTCNN detector
+
+    firststage: PNet pyramid latency against the number of first stage
+                workers, on the sample image resized to each size. Boxes of
+                every worker count are checked against the single worker run.
+    pyramid:    packed pyramid (one PNet forward) against the per-scale
+                forwards: latency and how many first stage boxes match.
+    crop:       batched crop_resize_normalize against the pad()/cv2.resize
+                loop on random boxes (partly outside the image): latency and
+                the largest difference in gray levels.
+    batch:      detect_faces over a list of images against a detect_face
+                loop: throughput in images/second and equal results, then
+                the executor cache statistics of every network.
+    nms:        rcnn.processing.nms backends (python reference, numpy,
+                cython) on clustered and sparse boxes: latency and equal picks.
+    selfie:     detect_selfie (only the pyramid levels of the expected face
+                size, early exit) against detect_face on a set of selfies:
+                latency and recall of the largest face found by detect_face.
+    hints:      detect_face_from_hints with the boxes of a previous
+                detect_face (a repeated upload) against detect_face: latency
+                and the share of faces found again.
+    align:      batched similarity_transform/warp_faces against the per-face
+                Umeyama SVD and warpAffine (and skimage when installed) on
+                random landmarks: latency and the largest difference.
+
+    python bench_mtcnn.py firststage --sizes 640,4000 --workers 1,2,4 --pool thread
+    python bench_mtcnn.py pyramid --sizes 640,1280,4000
+    python bench_mtcnn.py crop --boxes 10,100,1000
+    python bench_mtcnn.py batch --images 'faces/*.jpg' --batch 1,8,32
+    python bench_mtcnn.py nms --boxes 100,1000,5000,20000
+    python bench_mtcnn.py selfie --images 'selfies/*.jpg' --face-size 0.3,0.8
+    python bench_mtcnn.py hints --images 'faces/*.jpg'
+    python bench_mtcnn.py align --faces 1,8,64
+
+    The detector commands take --onnx to run mtcnn_detector_onnx (the
+    networks exported by export_onnx.py) instead of mxnet; mxnet is only
+    imported by the detector commands without --onnx.
+"""
+import argparse
+import glob
+import time
+
+import cv2
+import numpy as np
+
+import face_align
+import face_preprocess
+from helper import detect_first_stage_scales, detect_first_stage_packed, crop_resize_normalize, \
+    crop_resize_normalize_loop
+from rcnn.processing import nms as nms_module
+
+
+def load_image(path, size):
+    """
+        sample image resized so that its longer side is size pixels
+    """
+    img = cv2.imread(path)
+    if img is None:
+        raise IOError('cannot read image %s' % path)
+    scale = float(size) / max(img.shape[:2])
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+    return cv2.resize(img, (int(round(img.shape[1] * scale)), int(round(img.shape[0] * scale))),
+                      interpolation=interpolation)
+
+
+def timed(fn, repeats):
+    latencies = []
+    result = None
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        result = fn()
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return result, latencies
+
+
+def make_detector(args, **kwargs):
+    """
+        MtcnnDetector on mxnet (--gpu), or on ONNX Runtime with --onnx
+    """
+    if args.onnx:
+        from mtcnn_detector_onnx import MtcnnDetector
+        return MtcnnDetector(model_folder=args.model_folder, **kwargs)
+    import mxnet as mx
+    from mtcnn_detector import MtcnnDetector
+    ctx = mx.gpu(args.gpu) if args.gpu >= 0 else mx.cpu()
+    return MtcnnDetector(model_folder=args.model_folder, ctx=ctx, **kwargs)
+
+
+def same_boxes(a, b):
+    if len(a) != len(b):
+        return False
+    return all(x.shape == y.shape and np.allclose(x, y) for x, y in zip(a, b))
+
+
+def bench_first_stage(args):
+    images = [(size, load_image(args.image, size)) for size in args.sizes]
+
+    print('%6s %8s %8s %7s %9s %9s %9s %8s %6s' % (
+        'size', 'pool', 'workers', 'scales', 'mean_ms', 'p50_ms', 'p95_ms', 'speedup', 'same'))
+    for pool_type in args.pool:
+        reference = {}
+        for num_worker in args.workers:
+            detector = make_detector(args, num_worker=num_worker, accurate_landmark=True,
+                                     pool_type=pool_type)
+            try:
+                for size, img in images:
+                    scales = detector.pyramid_scales(*img.shape[:2])
+                    run = lambda: detector.detect_first_stage(img, scales)
+                    timed(run, args.warmup)
+                    boxes, latencies = timed(run, args.repeats)
+                    mean = np.mean(latencies)
+                    if size not in reference:
+                        reference[size] = (boxes, mean)
+                    print('%6d %8s %8d %7d %9.1f %9.1f %9.1f %7.2fx %6s' % (
+                        size, pool_type, num_worker, len(scales), mean,
+                        np.percentile(latencies, 50), np.percentile(latencies, 95),
+                        reference[size][1] / mean, same_boxes(boxes, reference[size][0])))
+            finally:
+                detector.close()
+
+
+def compare_boxes(reference, boxes):
+    """
+        (identical levels, reference boxes, boxes matched within 1 px)
+    """
+    identical, total, matched = 0, 0, 0
+    for a, b in zip(reference, boxes):
+        a = np.zeros((0, 9)) if a is None else a
+        b = np.zeros((0, 9)) if b is None else b
+        identical += int(a.shape == b.shape and np.allclose(a, b))
+        total += len(a)
+        for box in a:
+            matched += int(len(b) > 0 and np.abs(b[:, 0:4] - box[0:4]).max(axis=1).min() <= 1)
+    return identical, total, matched
+
+
+def bench_pyramid(args):
+    detector = make_detector(args, accurate_landmark=True)
+    net = detector.PNet
+    threshold = detector.threshold[0]
+
+    print('%6s %7s %12s %12s %8s %10s %12s' % (
+        'size', 'scales', 'scale_ms', 'packed_ms', 'speedup', 'identical', 'boxes_match'))
+    for size in args.sizes:
+        img = load_image(args.image, size)
+        scales = detector.pyramid_scales(*img.shape[:2])
+        per_scale = lambda: detect_first_stage_scales(img, net, scales, threshold)
+        packed = lambda: detect_first_stage_packed(img, net, scales, threshold)
+        timed(per_scale, args.warmup)
+        timed(packed, args.warmup)
+        reference, scale_ms = timed(per_scale, args.repeats)
+        boxes, packed_ms = timed(packed, args.repeats)
+        identical, total, matched = compare_boxes(reference, boxes)
+        print('%6d %7d %12.1f %12.1f %7.2fx %6d/%-3d %7d/%-4d' % (
+            size, len(scales), np.mean(scale_ms), np.mean(packed_ms),
+            np.mean(scale_ms) / np.mean(packed_ms), identical, len(scales), matched, total))
+
+
+def random_boxes(img, count, seed=0):
+    """
+        square boxes of 12 to 1/3 image side, up to half of a box outside the image
+    """
+    rng = np.random.RandomState(seed)
+    height, width = img.shape[:2]
+    side = rng.randint(12, max(13, min(height, width) // 3), count)
+    x1 = rng.randint(-side // 2, width - side // 2)
+    y1 = rng.randint(-side // 2, height - side // 2)
+    return np.stack([x1, y1, x1 + side - 1, y1 + side - 1], axis=1).astype(np.float32)
+
+
+def bench_crop(args):
+    img = load_image(args.image, args.sizes[0])
+    print('%6s %5s %8s %10s %10s %8s %10s %10s' % (
+        'boxes', 'size', 'tmp', 'loop_ms', 'batch_ms', 'speedup', 'max_diff', 'mean_diff'))
+    # RNet crops were uint8, ONet and LNet crops float32
+    for count in args.boxes:
+        boxes = random_boxes(img, count)
+        for size, tmp_dtype in ((24, np.uint8), (24, np.float32), (48, np.float32)):
+            loop = lambda: crop_resize_normalize_loop(img, boxes, size, tmp_dtype)
+            batch = lambda: crop_resize_normalize(img, boxes, size, tmp_dtype=tmp_dtype)
+            timed(loop, args.warmup)
+            timed(batch, args.warmup)
+            reference, loop_ms = timed(loop, args.repeats)
+            result, batch_ms = timed(batch, args.repeats)
+            # gray levels of the uint8 image
+            diff = np.abs(reference - result) / 0.0078125
+            print('%6d %5d %8s %10.2f %10.2f %7.2fx %10.2f %10.3f' % (
+                count, size, np.dtype(tmp_dtype).name, np.mean(loop_ms), np.mean(batch_ms),
+                np.mean(loop_ms) / np.mean(batch_ms), diff.max(), diff.mean()))
+
+
+def same_result(a, b):
+    if a is None or b is None:
+        return a is None and b is None
+    return a[0].shape == b[0].shape and np.allclose(a[0], b[0]) and np.array_equal(a[1], b[1])
+
+
+def bench_batch(args):
+    detector = make_detector(args, minsize=args.minsize, accurate_landmark=True)
+    paths = sorted(glob.glob(args.images))
+    if not paths:
+        raise IOError('no images match %s' % args.images)
+    images = [load_image(path, args.sizes[0]) for path in paths]
+
+    print('%6s %12s %12s %8s %6s' % ('batch', 'loop_ips', 'batch_ips', 'speedup', 'same'))
+    for batch_size in args.batch:
+        batches = [images[i:i + batch_size] for i in range(0, len(images), batch_size)]
+        loop = lambda: [[detector.detect_face(img) for img in batch] for batch in batches]
+        pooled = lambda: [detector.detect_faces(batch) for batch in batches]
+        timed(loop, args.warmup)
+        timed(pooled, args.warmup)
+        reference, loop_ms = timed(loop, args.repeats)
+        result, batch_ms = timed(pooled, args.repeats)
+        same = all(same_result(a, b) for ra, rb in zip(reference, result) for a, b in zip(ra, rb))
+        loop_ips = len(images) / (np.mean(loop_ms) / 1000)
+        batch_ips = len(images) / (np.mean(batch_ms) / 1000)
+        print('%6d %12.1f %12.1f %7.2fx %6s' % (batch_size, loop_ips, batch_ips, batch_ips / loop_ips, same))
+
+    if args.onnx:
+        print('%6s %8s %10s' % ('net', 'runs', 'rows'))
+        for name, stats in sorted(detector.executor_stats().items()):
+            print('%6s %8d %10d' % (name, stats['runs'], stats['rows']))
+        return
+    print('%6s %8s %10s %8s %10s %10s' % ('net', 'binds', 'bind_ms', 'hits', 'executors', 'padded'))
+    for name, stats in sorted(detector.executor_stats().items()):
+        print('%6s %8d %10.1f %8d %10d %9.1f%%' % (
+            name, stats['binds'], stats['bind_ms'], stats['hits'], stats['executors'],
+            100.0 * stats['padded_rows'] / max(1, stats['rows'] + stats['padded_rows'])))
+
+
+def nms_boxes(count, layout, seed=0):
+    """
+        clustered: jittered boxes around a few faces, like PNet candidates
+        sparse: boxes spread over the image, most of them are kept
+    """
+    rng = np.random.RandomState(seed)
+    if layout == 'clustered':
+        centers = rng.rand(max(1, count // 200), 2) * 1000
+        sides = rng.rand(len(centers)) * 150 + 20
+        cluster = rng.randint(0, len(centers), count)
+        side = sides[cluster] * (1 + 0.2 * rng.randn(count))
+        xy = centers[cluster] + rng.randn(count, 2) * side[:, None] * 0.15
+        wh = np.stack([side, side], axis=1)
+    else:
+        xy = rng.rand(count, 2) * 1000
+        wh = rng.rand(count, 2) * 80 + 12
+    return np.hstack([xy, xy + wh, rng.rand(count, 1)]).astype(np.float32)
+
+
+def bench_nms(args):
+    backends = ['python', 'numpy']
+    if nms_module.nms_sorted is not None:
+        backends.append('cython')
+    else:
+        print('cython backend is not built (make), skipping it')
+
+    print('%10s %6s %6s %7s %10s %10s %6s' % (
+        'layout', 'mode', 'boxes', 'kept', 'backend', 'ms', 'same'))
+    for layout in ('clustered', 'sparse'):
+        for count in args.boxes:
+            dets = nms_boxes(count, layout, seed=count)
+            for mode in ('Union', 'Min'):
+                reference = nms_module.nms(dets, args.thresh, mode, backend='numpy')
+                for backend in backends:
+                    if backend == 'python' and count > args.reference_max:
+                        continue
+                    run = lambda: nms_module.nms(dets, args.thresh, mode, backend)
+                    timed(run, args.warmup)
+                    keep, latencies = timed(run, args.repeats)
+                    print('%10s %6s %6d %7d %10s %10.2f %6s' % (
+                        layout, mode, count, len(reference), backend, np.mean(latencies),
+                        np.array_equal(keep, reference)))
+
+
+def largest_box(result):
+    if result is None or result[0].shape[0] == 0:
+        return None
+    boxes = result[0]
+    area = (boxes[:, 2] - boxes[:, 0] + 1) * (boxes[:, 3] - boxes[:, 1] + 1)
+    return boxes[np.argmax(area)]
+
+
+def iou(a, b):
+    w = max(0.0, min(a[2], b[2]) - max(a[0], b[0]) + 1)
+    h = max(0.0, min(a[3], b[3]) - max(a[1], b[1]) + 1)
+    inter = w * h
+    return inter / ((a[2] - a[0] + 1) * (a[3] - a[1] + 1) + (b[2] - b[0] + 1) * (b[3] - b[1] + 1) - inter)
+
+
+def bench_selfie(args):
+    detector = make_detector(args, minsize=args.minsize, accurate_landmark=True)
+    paths = sorted(glob.glob(args.images))
+    if not paths:
+        raise IOError('no images match %s' % args.images)
+    images = [load_image(path, args.sizes[0]) for path in paths]
+    face_size = tuple(args.face_size)
+
+    height, width = images[0].shape[:2]
+    print('pyramid levels: full %d, face size %.2f-%.2f %d' % (
+        len(detector.pyramid_scales(height, width)), face_size[0], face_size[1],
+        len(detector.pyramid_scales(height, width, face_size))))
+
+    modes = [
+        ('full', lambda img: detector.detect_face(img)),
+        ('levels', lambda img: detector.detect_selfie(img, face_size, largest_only=False)),
+        ('early-exit', lambda img: detector.detect_selfie(img, face_size, exit_score=args.exit_score)),
+    ]
+    print('%12s %10s %8s %8s %8s' % ('mode', 'ms/image', 'speedup', 'found', 'recall'))
+    full_ms = None
+    reference = None
+    for name, detect in modes:
+        run = lambda: [detect(img) for img in images]
+        timed(run, args.warmup)
+        results, latencies = timed(run, args.repeats)
+        ms = np.mean(latencies) / len(images)
+        if reference is None:
+            full_ms, reference = ms, [largest_box(result) for result in results]
+        # a face counts as found when it overlaps the largest face of the full detection
+        expected = [(box, largest_box(result)) for box, result in zip(reference, results) if box is not None]
+        hits = sum(1 for box, found in expected if found is not None and iou(box, found) >= args.iou)
+        print('%12s %10.2f %7.2fx %8d %8.3f' % (
+            name, ms, full_ms / ms, sum(1 for result in results if largest_box(result) is not None),
+            hits / float(len(expected)) if expected else float('nan')))
+
+
+def bench_hints(args):
+    detector = make_detector(args, minsize=args.minsize, accurate_landmark=True)
+    paths = sorted(glob.glob(args.images))
+    if not paths:
+        raise IOError('no images match %s' % args.images)
+    images = [load_image(path, args.sizes[0]) for path in paths]
+
+    full = lambda: [detector.detect_face(img) for img in images]
+    timed(full, args.warmup)
+    reference, full_ms = timed(full, args.repeats)
+    cases = [(img, result[0]) for img, result in zip(images, reference) if result is not None]
+    if not cases:
+        raise ValueError('detect_face finds no face in %s' % args.images)
+
+    hinted = lambda: [detector.detect_face_from_hints(img, boxes, fallback=False) for img, boxes in cases]
+    timed(hinted, args.warmup)
+    results, hint_ms = timed(hinted, args.repeats)
+    faces = sum(boxes.shape[0] for _, boxes in cases)
+    found = 0
+    for (_, boxes), result in zip(cases, results):
+        if result is not None:
+            found += sum(1 for box in boxes if max(iou(box, other) for other in result[0]) >= args.iou)
+
+    full_ms = np.mean(full_ms) / len(images)
+    hint_ms = np.mean(hint_ms) / len(cases)
+    print('%10s %10s %8s %8s %10s' % ('full_ms', 'hints_ms', 'speedup', 'faces', 'refound'))
+    print('%10.2f %10.2f %7.2fx %8d %10.3f' % (full_ms, hint_ms, full_ms / hint_ms, faces, found / float(faces)))
+
+
+def random_landmarks(img, count, seed=0):
+    """
+        the 112x112 template moved, rotated, scaled and jittered inside the image
+    """
+    rng = np.random.RandomState(seed)
+    template = face_preprocess.landmark_template((112, 112)).astype(np.float64) - 56
+    angle = rng.uniform(-0.5, 0.5, count)
+    scale = rng.uniform(0.5, 3.0, count)
+    rot = np.stack([np.stack([np.cos(angle), -np.sin(angle)], 1), np.stack([np.sin(angle), np.cos(angle)], 1)], 1)
+    center = rng.rand(count, 2) * [img.shape[1], img.shape[0]]
+    points = np.einsum('nij,kj->nki', rot * scale[:, None, None], template) + center[:, None, :]
+    return (points + rng.randn(count, 5, 2) * 2 * scale[:, None, None]).astype(np.float32)
+
+
+def bench_align(args):
+    img = load_image(args.image, args.sizes[0])
+    size = (112, 112)
+    template = face_preprocess.landmark_template(size)
+    try:
+        from skimage import transform as trans
+    except ImportError:
+        trans = None
+        print('skimage is not installed, skipping the SimilarityTransform check')
+
+    print('%6s %10s %10s %8s %12s %12s %10s' % (
+        'faces', 'loop_ms', 'batch_ms', 'speedup', 'max_M_diff', 'skimage_diff', 'max_chip'))
+    for count in args.faces:
+        landmarks = random_landmarks(img, count, seed=count)
+
+        def loop():
+            M = face_align.similarity_transform_loop(landmarks, template)
+            return M, [cv2.warpAffine(img, m, (size[1], size[0]), borderValue=0.0) for m in M]
+        out = np.empty((count,) + size + (3,), dtype=np.uint8)
+
+        def batch():
+            M = face_align.similarity_transform(landmarks, template)
+            return M, face_align.warp_faces(img, M, size, out=out)
+        timed(loop, args.warmup)
+        timed(batch, args.warmup)
+        (reference, ref_chips), loop_ms = timed(loop, args.repeats)
+        (M, chips), batch_ms = timed(batch, args.repeats)
+
+        skimage_diff = float('nan')
+        if trans is not None:
+            diffs = []
+            for points, m in zip(landmarks, M):
+                tform = trans.SimilarityTransform()
+                tform.estimate(points, template)
+                diffs.append(np.abs(tform.params[0:2] - m).max())
+            skimage_diff = max(diffs)
+        chip_diff = max(np.abs(a.astype(np.int32) - b).max() for a, b in zip(ref_chips, chips))
+        print('%6d %10.3f %10.3f %7.2fx %12.2e %12.2e %10d' % (
+            count, np.mean(loop_ms), np.mean(batch_ms), np.mean(loop_ms) / np.mean(batch_ms),
+            np.abs(reference - M).max(), skimage_diff, chip_diff))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='MTCNN detector benchmarks')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    first = subparsers.add_parser('firststage', help='first stage latency against worker count')
+    first.add_argument('--model-folder', default='mtcnn-model')
+    first.add_argument('--image', default='sample-images/test1.jpg')
+    first.add_argument('--sizes', default='640,4000', help='longer image side, comma separated')
+    first.add_argument('--workers', default='1,2,4', help='worker counts, comma separated')
+    first.add_argument('--pool', default='thread', help='thread, process or both: thread,process')
+    first.add_argument('--repeats', type=int, default=10)
+    first.add_argument('--warmup', type=int, default=2)
+    first.add_argument('--gpu', type=int, default=-1, help='gpu id, -1 for cpu')
+    first.add_argument('--onnx', action='store_true', help='run the exported ONNX networks')
+    first.set_defaults(func=bench_first_stage)
+
+    pyramid = subparsers.add_parser('pyramid', help='packed pyramid against per-scale forwards')
+    pyramid.add_argument('--model-folder', default='mtcnn-model')
+    pyramid.add_argument('--image', default='sample-images/test1.jpg')
+    pyramid.add_argument('--sizes', default='640,1280,4000', help='longer image side, comma separated')
+    pyramid.add_argument('--repeats', type=int, default=10)
+    pyramid.add_argument('--warmup', type=int, default=2)
+    pyramid.add_argument('--gpu', type=int, default=-1, help='gpu id, -1 for cpu')
+    pyramid.add_argument('--onnx', action='store_true', help='run the exported ONNX networks')
+    pyramid.set_defaults(func=bench_pyramid)
+
+    crop = subparsers.add_parser('crop', help='batched crop-resize against the per-box loop')
+    crop.add_argument('--image', default='sample-images/test1.jpg')
+    crop.add_argument('--sizes', default='640', help='longer image side')
+    crop.add_argument('--boxes', default='10,100,1000', help='box counts, comma separated')
+    crop.add_argument('--repeats', type=int, default=10)
+    crop.add_argument('--warmup', type=int, default=2)
+    crop.set_defaults(func=bench_crop)
+
+    batch = subparsers.add_parser('batch', help='detect_faces against a detect_face loop')
+    batch.add_argument('--model-folder', default='mtcnn-model')
+    batch.add_argument('--images', default='sample-images/*.jpg', help='glob of input images')
+    batch.add_argument('--sizes', default='640', help='longer image side')
+    batch.add_argument('--batch', default='1,8,32', help='images per detect_faces call')
+    batch.add_argument('--minsize', type=int, default=50)
+    batch.add_argument('--repeats', type=int, default=5)
+    batch.add_argument('--warmup', type=int, default=1)
+    batch.add_argument('--gpu', type=int, default=-1, help='gpu id, -1 for cpu')
+    batch.add_argument('--onnx', action='store_true', help='run the exported ONNX networks')
+    batch.set_defaults(func=bench_batch)
+
+    nms = subparsers.add_parser('nms', help='nms backends against each other')
+    nms.add_argument('--boxes', default='100,1000,5000,20000', help='box counts, comma separated')
+    nms.add_argument('--thresh', type=float, default=0.5)
+    nms.add_argument('--reference-max', type=int, default=5000,
+                     help='largest box count for the slow python reference')
+    nms.add_argument('--repeats', type=int, default=5)
+    nms.add_argument('--warmup', type=int, default=1)
+    nms.set_defaults(func=bench_nms)
+
+    selfie = subparsers.add_parser('selfie', help='selfie mode against the full pyramid')
+    selfie.add_argument('--model-folder', default='mtcnn-model')
+    selfie.add_argument('--images', default='sample-images/*.jpg', help='glob of selfie images')
+    selfie.add_argument('--sizes', default='640', help='longer image side')
+    selfie.add_argument('--face-size', default='0.3,0.8',
+                        help='expected face side relative to the shorter image side: min,max')
+    selfie.add_argument('--exit-score', type=float, default=0.95)
+    selfie.add_argument('--iou', type=float, default=0.5, help='overlap of a found face')
+    selfie.add_argument('--minsize', type=int, default=20)
+    selfie.add_argument('--repeats', type=int, default=5)
+    selfie.add_argument('--warmup', type=int, default=1)
+    selfie.add_argument('--gpu', type=int, default=-1, help='gpu id, -1 for cpu')
+    selfie.add_argument('--onnx', action='store_true', help='run the exported ONNX networks')
+    selfie.set_defaults(func=bench_selfie)
+
+    hints = subparsers.add_parser('hints', help='re-detection from cached boxes against detect_face')
+    hints.add_argument('--model-folder', default='mtcnn-model')
+    hints.add_argument('--images', default='sample-images/*.jpg', help='glob of input images')
+    hints.add_argument('--sizes', default='640', help='longer image side')
+    hints.add_argument('--iou', type=float, default=0.5, help='overlap of a face found again')
+    hints.add_argument('--minsize', type=int, default=50)
+    hints.add_argument('--repeats', type=int, default=5)
+    hints.add_argument('--warmup', type=int, default=1)
+    hints.add_argument('--gpu', type=int, default=-1, help='gpu id, -1 for cpu')
+    hints.add_argument('--onnx', action='store_true', help='run the exported ONNX networks')
+    hints.set_defaults(func=bench_hints)
+
+    align = subparsers.add_parser('align', help='batched face alignment against the per-face loop')
+    align.add_argument('--image', default='sample-images/test1.jpg')
+    align.add_argument('--sizes', default='640', help='longer image side')
+    align.add_argument('--faces', default='1,8,64', help='faces per image, comma separated')
+    align.add_argument('--repeats', type=int, default=20)
+    align.add_argument('--warmup', type=int, default=2)
+    align.set_defaults(func=bench_align)
+
+    args = parser.parse_args()
+    if hasattr(args, 'face_size'):
+        args.face_size = [float(v) for v in args.face_size.split(',')]
+    for name in ('sizes', 'workers', 'boxes', 'batch', 'faces'):
+        if hasattr(args, name):
+            setattr(args, name, [int(v) for v in getattr(args, name).split(',') if v])
+    if hasattr(args, 'pool'):
+        args.pool = [v for v in args.pool.split(',') if v]
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+# coding: utf-8
+"""
+    Inference of a checkpoint through executors cached by input shape
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import mxnet as mx
+import numpy as np
+
+
+class CachedPredictor(object):
+    """
+        drop-in replacement of mx.model.FeedForward.predict for inference
+
+        FeedForward re-binds its executor whenever the input shape changes.
+        Here every input shape gets its own executor, bound once and kept in
+        an LRU cache. The parameter NDArrays are loaded once and bound into
+        every executor, and all executors are bound with shared_exec to the
+        first one so that they reuse its memory pool. mxnet executors are not
+        thread-safe, so a forward and the read of its outputs run under one
+        lock: threads calling predict take turns (the first stage process
+        pool runs PNet in parallel, every process has its own predictor).
+        Batch sizes are padded up to a bucket (see bucket), so a few
+        executors serve every batch size.
+    """
+    BUCKET_STEP = 32
+
+    def __init__(self, prefix, epoch=1, ctx=mx.cpu(), max_batch=256, max_executors=64):
+        """
+            Parameters:
+            ----------
+                prefix: string
+                    checkpoint prefix
+                epoch: int number
+                    checkpoint epoch
+                ctx: mx.Context
+                    device
+                max_batch: int number
+                    largest bucket, larger inputs run in chunks of max_batch
+                max_executors: int number
+                    executors kept in the cache
+        """
+        self.symbol, arg_params, aux_params = mx.model.load_checkpoint(prefix, epoch)
+        self.ctx = ctx
+        self.max_batch = max_batch
+        self.max_executors = max_executors
+        # bound into every executor, never written by a forward
+        self.arg_params = {k: v.as_in_context(ctx) for k, v in arg_params.items()}
+        self.aux_params = {k: v.as_in_context(ctx) for k, v in aux_params.items()}
+        self._executors = OrderedDict()
+        self._shared = None
+        self._shared_shape = None
+        # _forward_lock guards the executors, _lock the statistics
+        self._forward_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._stats = {'binds': 0, 'bind_ms': 0.0, 'hits': 0, 'evictions': 0, 'forwards': 0,
+                       'rows': 0, 'padded_rows': 0}
+
+    def bucket(self, batch_size):
+        """
+            batch size of the executor for batch_size rows: the next power of
+            two below BUCKET_STEP, the next multiple of BUCKET_STEP above
+        """
+        size = 1
+        while size < batch_size and size < self.BUCKET_STEP:
+            size *= 2
+        if size < batch_size:
+            size = -(-batch_size // self.BUCKET_STEP) * self.BUCKET_STEP
+        return min(size, self.max_batch)
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self._stats[name] += value
+
+    def _bind(self, shape, shared_exec):
+        arg_shapes, _, aux_shapes = self.symbol.infer_shape(data=shape)
+        args = {}
+        for name, arg_shape in zip(self.symbol.list_arguments(), arg_shapes):
+            # inputs other than data and the parameters (labels) are never read
+            args[name] = self.arg_params.get(name)
+            if args[name] is None:
+                args[name] = mx.nd.zeros(arg_shape, ctx=self.ctx)
+        aux_states = [self.aux_params[name] for name in self.symbol.list_auxiliary_states()]
+        return self.symbol.bind(self.ctx, args=args, aux_states=aux_states, grad_req='null',
+                                shared_exec=shared_exec)
+
+    def _executor(self, shape):
+        # the caller holds self._forward_lock
+        executor = self._executors.get(shape)
+        if executor is not None:
+            self._executors.move_to_end(shape)
+            self._count('hits')
+            return executor
+
+        t0 = time.perf_counter()
+        executor = self._bind(shape, self._shared)
+        if self._shared is None:
+            self._shared = executor
+            self._shared_shape = shape
+        with self._lock:
+            self._stats['binds'] += 1
+            self._stats['bind_ms'] += (time.perf_counter() - t0) * 1000
+
+        self._executors[shape] = executor
+        if len(self._executors) > self.max_executors:
+            # the executor owning the memory pool is never evicted
+            for key in self._executors:
+                if key != self._shared_shape:
+                    del self._executors[key]
+                    self._count('evictions')
+                    break
+        return executor
+
+    def predict(self, data):
+        """
+            forward data through the network
+
+        Parameters:
+        ----------
+            data: numpy array, n x c x h x w
+                input batch
+        Returns:
+        -------
+            list of numpy array
+                network outputs, n rows each
+        """
+        data = np.asarray(data, dtype=np.float32)
+        outputs = []
+        for begin in range(0, data.shape[0], self.max_batch):
+            chunk = data[begin:begin+self.max_batch]
+            count = chunk.shape[0]
+            size = self.bucket(count)
+            if size > count:
+                padded = np.zeros((size,) + chunk.shape[1:], dtype=np.float32)
+                padded[:count] = chunk
+                chunk = padded
+
+            with self._forward_lock:
+                executor = self._executor(chunk.shape)
+                executor.forward(is_train=False, data=mx.nd.array(chunk, ctx=self.ctx))
+                outputs.append([output.asnumpy()[:count] for output in executor.outputs])
+            with self._lock:
+                self._stats['forwards'] += 1
+                self._stats['rows'] += count
+                self._stats['padded_rows'] += size - count
+
+        if len(outputs) == 1:
+            return outputs[0]
+        return [np.concatenate(parts) for parts in zip(*outputs)]
+
+    def get_stats(self):
+        """
+            bind count and time, cache hits and evictions, forwards and padding
+        """
+        with self._lock:
+            return dict(self._stats, executors=len(self._executors))
@@ -0,0 +1,164 @@
+# coding: utf-8
+"""
+    Export the MTCNN networks and the age/gender model to ONNX
+
+    det1 ... det4 are written next to their checkpoints (mtcnn-model/det1.onnx
+    ...), the fc1 output of the age/gender model to prefix-0000-fc1.onnx. Every
+    export is checked against mxnet on random inputs of several shapes, and
+    mtcnn_detector_onnx against mtcnn_detector on the --check-images.
+    mtcnn_detector_onnx and face_model_onnx then run without mxnet.
+
+    python export_onnx.py --mtcnn-folder mtcnn-model --model ./model/m1/model,0
+"""
+import argparse
+import glob
+import json
+import sys
+
+import cv2
+import mxnet as mx
+import numpy as np
+import onnx
+
+from onnx_predictor import OnnxPredictor, onnx_model_path
+
+# name, input shape without the batch (None: any size), shapes of the check
+MTCNN_NETS = [
+    ('det1', (3, None, None), [(1, 3, 12, 12), (1, 3, 37, 53), (2, 3, 120, 160)]),
+    ('det2', (3, 24, 24), [(1, 3, 24, 24), (7, 3, 24, 24)]),
+    ('det3', (3, 48, 48), [(1, 3, 48, 48), (7, 3, 48, 48)]),
+    ('det4', (15, 24, 24), [(1, 15, 24, 24), (7, 15, 24, 24)]),
+]
+
+
+def inference_symbol(sym):
+    """
+        the symbol with SoftmaxOutput and SoftmaxActivation (training layers,
+        the label input is not needed) replaced by softmax over the channel axis
+    """
+    graph = json.loads(sym.tojson())
+    for node in graph['nodes']:
+        if node['op'] in ('SoftmaxOutput', 'SoftmaxActivation'):
+            node['op'] = 'softmax'
+            node['attrs'] = {'axis': '1'}
+            node['inputs'] = node['inputs'][:1]
+    return mx.sym.load_json(json.dumps(graph))
+
+
+def load_symbol(prefix, epoch, layer=None):
+    sym, arg_params, aux_params = mx.model.load_checkpoint(prefix, epoch)
+    if layer is not None:
+        sym = sym.get_internals()[layer + '_output']
+    sym = inference_symbol(sym)
+    names = set(sym.list_arguments()) | set(sym.list_auxiliary_states())
+    params = {k: v for k, v in list(arg_params.items()) + list(aux_params.items()) if k in names}
+    return sym, params
+
+
+def export(sym, params, data_shape, path):
+    """
+        export with a dynamic batch (and image size where data_shape has None)
+    """
+    in_shape = tuple(48 if d is None else d for d in (1,) + data_shape)
+    mx.onnx.export_model(sym, params, in_shapes=[in_shape], in_types=[np.float32],
+                         onnx_file_path=path, dynamic=True,
+                         dynamic_input_shapes=[(None,) + data_shape])
+    onnx.checker.check_model(onnx.load(path))
+
+
+def mxnet_outputs(sym, params, data):
+    module = mx.mod.Module(symbol=sym, data_names=['data'], label_names=None, context=mx.cpu())
+    module.bind(data_shapes=[('data', data.shape)], for_training=False)
+    module.set_params({k: v for k, v in params.items() if k in sym.list_arguments()},
+                      {k: v for k, v in params.items() if k in sym.list_auxiliary_states()})
+    module.forward(mx.io.DataBatch(data=[mx.nd.array(data)]), is_train=False)
+    return [output.asnumpy() for output in module.get_outputs()]
+
+
+def check(name, sym, params, path, shapes, low, high, args):
+    """
+        outputs of the ONNX model against mxnet on random inputs, True when all match
+    """
+    predictor = OnnxPredictor(path)
+    rng = np.random.RandomState(0)
+    ok = True
+    for shape in shapes:
+        data = rng.uniform(low, high, shape).astype(np.float32)
+        reference = mxnet_outputs(sym, params, data)
+        outputs = predictor.predict(data)
+        if len(outputs) != len(reference):
+            print('%6s %-18s %d outputs, mxnet has %d  FAIL' % (name, shape, len(outputs), len(reference)))
+            ok = False
+            continue
+        for k, (a, b) in enumerate(zip(reference, outputs)):
+            diff = np.abs(a - b).max() if a.shape == b.shape else np.inf
+            passed = diff <= args.atol + args.rtol * np.abs(a).max()
+            ok = ok and passed
+            print('%6s %-18s output %d %-16s max diff %.2e  %s' % (
+                name, shape, k, a.shape, diff, 'ok' if passed else 'FAIL'))
+    return ok
+
+
+def check_detector(args):
+    """
+        detect_face of the mxnet and the ONNX Runtime MtcnnDetector on real images
+    """
+    import mtcnn_detector
+    import mtcnn_detector_onnx
+
+    paths = sorted(glob.glob(args.check_images))
+    reference = mtcnn_detector.MtcnnDetector(model_folder=args.mtcnn_folder, accurate_landmark=True)
+    detector = mtcnn_detector_onnx.MtcnnDetector(model_folder=args.mtcnn_folder, accurate_landmark=True)
+    ok = True
+    for path in paths:
+        img = cv2.imread(path)
+        a, b = reference.detect_face(img), detector.detect_face(img)
+        if a is None or b is None:
+            passed = a is None and b is None
+            print('%s: faces mxnet %s onnx %s  %s' % (path, a is not None, b is not None, 'ok' if passed else 'FAIL'))
+        else:
+            passed = a[0].shape == b[0].shape and np.abs(a[0][:, 0:4] - b[0][:, 0:4]).max() <= 1 \
+                and np.abs(a[1] - b[1]).max() <= 1
+            print('%s: faces mxnet %d onnx %d  %s' % (path, a[0].shape[0], b[0].shape[0], 'ok' if passed else 'FAIL'))
+        ok = ok and passed
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='export the MTCNN and age/gender models to ONNX')
+    parser.add_argument('--mtcnn-folder', default='mtcnn-model', help='folder of det1 ... det4')
+    parser.add_argument('--model', default='./model/m1/model,0', help='age/gender model: prefix,epoch')
+    parser.add_argument('--image-size', default='112,112')
+    parser.add_argument('--check-images', default='sample-images/*.jpg',
+                        help='glob of images for the detector check, empty to skip it')
+    parser.add_argument('--atol', type=float, default=1e-4)
+    parser.add_argument('--rtol', type=float, default=1e-4)
+    args = parser.parse_args()
+
+    ok = True
+    for name, data_shape, shapes in MTCNN_NETS:
+        prefix = '%s/%s' % (args.mtcnn_folder, name)
+        sym, params = load_symbol(prefix, 1)
+        export(sym, params, data_shape, prefix + '.onnx')
+        print('exported %s.onnx' % prefix)
+        ok = check(name, sym, params, prefix + '.onnx', shapes, -1.0, 1.0, args) and ok
+
+    if args.model:
+        prefix, epoch = args.model.split(',')
+        height, width = [int(v) for v in args.image_size.split(',')]
+        path = onnx_model_path(args.model, 'fc1')
+        sym, params = load_symbol(prefix, int(epoch), 'fc1')
+        export(sym, params, (3, height, width), path)
+        print('exported %s' % path)
+        # face_model feeds raw 0..255 rgb pixels
+        ok = check('fc1', sym, params, path, [(1, 3, height, width), (4, 3, height, width)], 0.0, 255.0, args) and ok
+
+    if args.check_images:
+        ok = check_detector(args) and ok
+
+    print('all outputs match' if ok else 'MISMATCH, do not use the exported models')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+# coding: utf-8
+"""
+    Similarity alignment of face landmarks, batched over all faces of an image
+"""
+import cv2
+import numpy as np
+
+
+def similarity_transform(src, dst, estimate_scale=True):
+    """
+        least squares similarity transforms from src to dst points (Umeyama)
+        for N faces at once
+
+        In 2-D the rotation of the Umeyama solution has a closed form, so no
+        SVD is needed: with centered points the transform is [[a, -b], [b, a]]
+        where a = sum(src . dst) / var and b = sum(src x dst) / var.
+
+    Parameters:
+    ----------
+        src: numpy array, N x K x 2 or K x 2
+            landmarks of every face
+        dst: numpy array, N x K x 2 or K x 2
+            target points, usually one template for all faces
+        estimate_scale: bool
+            estimate the scale too, a rigid transform otherwise
+    Returns:
+    -------
+        numpy array, N x 2 x 3 (2 x 3 for a single K x 2 src)
+            affine matrices mapping src to dst
+    """
+    src = np.asarray(src, dtype=np.float64)
+    dst = np.asarray(dst, dtype=np.float64)
+    single = src.ndim == 2 and dst.ndim == 2
+    src = src.reshape((-1,) + src.shape[-2:])
+    dst = dst.reshape((-1,) + dst.shape[-2:])
+
+    src_mean = src.mean(axis=1)
+    dst_mean = dst.mean(axis=1)
+    src_c = src - src_mean[:, None, :]
+    dst_c = dst - dst_mean[:, None, :]
+
+    a = (src_c * dst_c).sum(axis=(1, 2))
+    b = (src_c[:, :, 0] * dst_c[:, :, 1] - src_c[:, :, 1] * dst_c[:, :, 0]).sum(axis=1)
+    if estimate_scale:
+        norm = (src_c ** 2).sum(axis=(1, 2))
+    else:
+        norm = np.hypot(a, b)
+    # all points of a face in one place: identity instead of nan
+    degenerate = norm == 0
+    norm[degenerate] = 1.0
+    a = np.where(degenerate, 1.0, a / norm)
+    b = np.where(degenerate, 0.0, b / norm)
+
+    n = a.shape[0]
+    M = np.empty((n, 2, 3), dtype=np.float64)
+    M[:, 0, 0] = a
+    M[:, 0, 1] = -b
+    M[:, 1, 0] = b
+    M[:, 1, 1] = a
+    M[:, :, 2] = dst_mean - np.einsum('nij,nj->ni', M[:, :, 0:2], src_mean)
+    return M[0] if single else M
+
+
+def similarity_transform_loop(src, dst):
+    """
+        reference implementation of similarity_transform: Umeyama with an SVD
+        per face (the former MtcnnDetector.find_tfrom_between_shapes)
+    """
+    src = np.asarray(src, dtype=np.float64).reshape((-1,) + np.shape(src)[-2:])
+    dst = np.broadcast_to(np.asarray(dst, dtype=np.float64), src.shape)
+    M = np.empty((src.shape[0], 2, 3), dtype=np.float64)
+    for i in range(src.shape[0]):
+        mean_from = src[i].mean(axis=0)
+        mean_to = dst[i].mean(axis=0)
+        from_c = src[i] - mean_from
+        to_c = dst[i] - mean_to
+        sigma_from = (from_c ** 2).sum() / src.shape[1]
+        cov = to_c.T.dot(from_c) / src.shape[1]
+
+        s = np.eye(2)
+        u, d, vt = np.linalg.svd(cov)
+        if np.linalg.det(cov) < 0:
+            if d[1] < d[0]:
+                s[1, 1] = -1
+            else:
+                s[0, 0] = -1
+        r = u.dot(s).dot(vt)
+        c = 1.0
+        if sigma_from != 0:
+            c = 1.0 / sigma_from * np.trace(np.diag(d).dot(s))
+        M[i, :, 0:2] = c * r
+        M[i, :, 2] = mean_to - c * r.dot(mean_from)
+    return M
+
+
+def warp_faces(img, transforms, size, out=None, border_value=0.0):
+    """
+        warp the faces of one image into a chip tensor
+
+    Parameters:
+    ----------
+        img: numpy array, h x w x c
+            input image
+        transforms: numpy array, N x 2 x 3
+            affine matrices from the image to the chips
+        size: tuple of int
+            (height, width) of a chip
+        out: numpy array, N x height x width x c, optional
+            preallocated chips, c-contiguous with the dtype of img
+        border_value: float number
+            value outside the image
+    Returns:
+    -------
+        numpy array, N x height x width x c
+            chips
+    """
+    height, width = size
+    if out is None:
+        out = np.empty((len(transforms), height, width) + img.shape[2:], dtype=img.dtype)
+    # warpAffine writes into out[i] itself, no chip is allocated and copied
+    for i in range(len(transforms)):
+        cv2.warpAffine(img, transforms[i], (width, height), dst=out[i], borderValue=border_value)
+    return out
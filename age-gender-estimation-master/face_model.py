@@ -87,13 +87,11 @@ class FaceModel:
 
     #print(bbox)
     #print(points)
-    input_blob = np.zeros((bbox.shape[0], 3, 112, 112))
-    for i in range(bbox.shape[0]):
-      nimg = face_preprocess.preprocess(face_img, bbox[i,:], points[i,:], image_size='112,112')
-      nimg = cv2.cvtColor(nimg, cv2.COLOR_BGR2RGB)
-      aligned = np.transpose(nimg, (2,0,1))
-      # input_blob = np.expand_dims(aligned, axis=0)
-      input_blob[i,:] = aligned
+    # all faces are aligned at once into one chip tensor
+    chips = face_preprocess.preprocess_batch(face_img, points, image_size='112,112')
+    input_blob = np.empty((bbox.shape[0], 3, 112, 112), dtype=np.float32)
+    # bgr to rgb and hwc to chw
+    input_blob[:] = np.transpose(chips[..., ::-1], (0,3,1,2))
     data = mx.nd.array(input_blob)
     db = mx.io.DataBatch(data=(data,))
 
@@ -0,0 +1,72 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+# FaceModel on ONNX Runtime, without mxnet: the fc1 model and MTCNN exported
+# by export_onnx.py. get_input returns the input blob as a numpy array where
+# face_model returns a mx.io.DataBatch, get_ga takes that array.
+
+import os
+import numpy as np
+from mtcnn_detector_onnx import MtcnnDetector
+from onnx_predictor import OnnxPredictor, onnx_model_path
+import face_preprocess
+
+
+def get_model(providers, model_str, layer):
+  path = onnx_model_path(model_str, layer)
+  print('loading', path)
+  return OnnxPredictor(path, providers=providers)
+
+class FaceModel:
+  def __init__(self, args):
+    self.args = args
+    if args.gpu>=0:
+      providers = ['CUDAExecutionProvider', 'CPUExecutionProvider']
+    else:
+      providers = ['CPUExecutionProvider']
+    _vec = args.image_size.split(',')
+    assert len(_vec)==2
+    image_size = (int(_vec[0]), int(_vec[1]))
+    self.model = None
+    if len(args.model)>0:
+      self.model = get_model(providers, args.model, 'fc1')
+
+    self.det_minsize = 50
+    self.det_threshold = [0.6,0.7,0.8]
+    self.image_size = image_size
+    mtcnn_path = os.path.join(os.path.dirname(__file__), 'mtcnn-model')
+    if args.det!=0:
+      raise ValueError('only the MTCNN detector (det=0) has an ONNX version, use face_model for ESSH')
+    self.detector = MtcnnDetector(model_folder=mtcnn_path, num_worker=1, accurate_landmark = True, threshold=self.det_threshold)
+
+
+  def get_input(self, face_img, args):
+    ret = self.detector.detect_face(face_img, det_type = self.args.det)
+    if ret is None:
+      return None
+    bbox, points = ret
+    if bbox.shape[0]==0:
+      return None
+    bbox = bbox[:,0:4]
+    points = points[:,:].reshape((-1,2,5))
+    points = np.transpose(points, (0,2,1))
+
+    # all faces are aligned at once into one chip tensor
+    chips = face_preprocess.preprocess_batch(face_img, points, image_size='112,112')
+    input_blob = np.empty((bbox.shape[0], 3, 112, 112), dtype=np.float32)
+    # bgr to rgb and hwc to chw
+    input_blob[:] = np.transpose(chips[..., ::-1], (0,3,1,2))
+
+    return input_blob, bbox, points
+
+
+  def get_ga(self, data):
+    ret = self.model.predict(data)[0]
+    g = ret[:,0:2]
+    gender = np.argmax(g, axis=1)
+    a = ret[:,2:202].reshape((-1,100,2))
+    a = np.argmax(a, axis=2)
+    age = np.sum(a, axis=1)
+
+    return gender, age
@@ -1,7 +1,7 @@
 
 import cv2
 import numpy as np
-from skimage import transform as trans
+import face_align
 
 def parse_lst_line(line):
   vec = line.strip().split("\t")
@@ -43,12 +43,8 @@ def read_image(img_path, **kwargs):
   return img
 
 
-def preprocess(img, bbox=None, landmark=None, **kwargs):
-  if isinstance(img, str):
-    img = read_image(img, **kwargs)
-  M = None
+def parse_image_size(str_image_size):
   image_size = []
-  str_image_size = kwargs.get('image_size', '')
   if len(str_image_size)>0:
     image_size = [int(x) for x in str_image_size.split(',')]
     if len(image_size)==1:
@@ -56,21 +52,32 @@ def preprocess(img, bbox=None, landmark=None, **kwargs):
     assert len(image_size)==2
     assert image_size[0]==112
     assert image_size[0]==112 or image_size[1]==96
+  return image_size
+
+
+def landmark_template(image_size):
+  src = np.array([
+    [30.2946, 51.6963],
+    [65.5318, 51.5014],
+    [48.0252, 71.7366],
+    [33.5493, 92.3655],
+    [62.7299, 92.2041] ], dtype=np.float32 )
+  if image_size[1]==112:
+    src[:,0] += 8.0
+  return src
+
+
+def preprocess(img, bbox=None, landmark=None, **kwargs):
+  if isinstance(img, str):
+    img = read_image(img, **kwargs)
+  M = None
+  image_size = parse_image_size(kwargs.get('image_size', ''))
   if landmark is not None:
     assert len(image_size)==2
-    src = np.array([
-      [30.2946, 51.6963],
-      [65.5318, 51.5014],
-      [48.0252, 71.7366],
-      [33.5493, 92.3655],
-      [62.7299, 92.2041] ], dtype=np.float32 )
-    if image_size[1]==112:
-      src[:,0] += 8.0
+    src = landmark_template(image_size)
     dst = landmark.astype(np.float32)
 
-    tform = trans.SimilarityTransform()
-    tform.estimate(dst, src)
-    M = tform.params[0:2,:]
+    M = face_align.similarity_transform(dst, src)
     #M = cv2.estimateRigidTransform( dst.reshape(1,5,2), src.reshape(1,5,2), False)
 
   if M is None:
@@ -110,4 +117,11 @@ def preprocess(img, bbox=None, landmark=None, **kwargs):
     #warped = trans.warp(img, tform3, output_shape=_shape)
     return warped
 
-
+def preprocess_batch(img, landmarks, **kwargs):
+  """
+  aligned chips of all faces of one image: landmarks is N x 5 x 2, the chips
+  are N x h x w x c, warped into kwargs['out'] when given
+  """
+  image_size = parse_image_size(kwargs.get('image_size', '112,112'))
+  M = face_align.similarity_transform(np.asarray(landmarks, dtype=np.float32), landmark_template(image_size))
+  return face_align.warp_faces(img, M, image_size, out=kwargs.get('out'))
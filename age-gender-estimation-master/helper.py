@@ -3,6 +3,7 @@
 import math
 import cv2
 import numpy as np
+from rcnn.processing.nms import nms as fast_nms, batched_nms
 
 
 def nms(boxes, overlap_threshold, mode='Union'):
@@ -19,52 +20,9 @@ def nms(boxes, overlap_threshold, mode='Union'):
             how to compute overlap ratio, 'Union' or 'Min'
     Returns:
     -------
-        index array of the selected bbox
+        index array of the selected bbox, by descending score
     """
-    # if there are no boxes, return an empty list
-    if len(boxes) == 0:
-        return []
-
-    # if the bounding boxes integers, convert them to floats
-    if boxes.dtype.kind == "i":
-        boxes = boxes.astype("float")
-
-    # initialize the list of picked indexes
-    pick = []
-
-    # grab the coordinates of the bounding boxes
-    x1, y1, x2, y2, score = [boxes[:, i] for i in range(5)]
-
-    area = (x2 - x1 + 1) * (y2 - y1 + 1)
-    idxs = np.argsort(score)
-
-    # keep looping while some indexes still remain in the indexes list
-    while len(idxs) > 0:
-        # grab the last index in the indexes list and add the index value to the list of picked indexes
-        last = len(idxs) - 1
-        i = idxs[last]
-        pick.append(i)
-
-        xx1 = np.maximum(x1[i], x1[idxs[:last]])
-        yy1 = np.maximum(y1[i], y1[idxs[:last]])
-        xx2 = np.minimum(x2[i], x2[idxs[:last]])
-        yy2 = np.minimum(y2[i], y2[idxs[:last]])
-
-        # compute the width and height of the bounding box
-        w = np.maximum(0, xx2 - xx1 + 1)
-        h = np.maximum(0, yy2 - yy1 + 1)
-
-        inter = w * h
-        if mode == 'Min':
-            overlap = inter / np.minimum(area[i], area[idxs[:last]])
-        else:
-            overlap = inter / (area[i] + area[idxs[:last]] - inter)
-
-        # delete all indexes from the index list that have
-        idxs = np.delete(idxs, np.concatenate(([last],
-                                               np.where(overlap > overlap_threshold)[0])))
-
-    return pick
+    return fast_nms(boxes, overlap_threshold, mode)
 
 def adjust_input(in_data):
     """
@@ -166,3 +124,277 @@ def detect_first_stage(img, net, scale, threshold):
 
 def detect_first_stage_warpper( args ):
     return detect_first_stage(*args)
+
+def detect_first_stage_scales(img, net, scales, threshold):
+    """
+        run PNet for several scales one after another with the same net
+
+    Parameters:
+    ----------
+        img: numpy array, bgr order
+            input image
+        net: PNet
+            network
+        scales: list of float
+            scales handled by this worker
+        threshold: float number
+            detect threshold
+    Returns:
+    -------
+        list of bboxes (or None) in the order of scales
+    """
+    return [detect_first_stage(img, net, scale, threshold) for scale in scales]
+
+# PNet of a first stage worker process, see init_first_stage_worker
+_worker_pnet = None
+
+def init_first_stage_worker(detector_class, model_prefix, device):
+    """
+        load one PNet per worker process (multiprocessing.Pool initializer)
+        with detector_class.load_network, so the mxnet and ONNX Runtime
+        detectors both work
+    """
+    global _worker_pnet
+    _worker_pnet = detector_class.load_network(model_prefix, device)
+
+def detect_first_stage_worker(args):
+    """
+        first stage for a group of scales inside a worker process
+    """
+    img, scales, threshold = args
+    return detect_first_stage_scales(img, _worker_pnet, scales, threshold)
+
+def pack_pyramid(shapes, guard=2):
+    """
+        shelf packing of pyramid levels into one canvas
+
+        Levels are placed left to right in the given order (largest first),
+        a new shelf starts when a level does not fit into the canvas width.
+        Offsets are even so that the PNet output grid (stride 2) of every
+        level lines up with the canvas grid, and every level is followed by
+        at least guard pixels of padding.
+
+    Parameters:
+    ----------
+        shapes: list of (height, width)
+            sizes of the pyramid levels
+        guard: int number
+            padding between levels
+    Returns:
+    -------
+        offsets: list of (y, x)
+            top left corner of every level in the canvas
+        canvas_shape: (height, width)
+    """
+    align = lambda v: v + (v & 1)
+    canvas_w = align(max(w for _, w in shapes) + guard)
+    offsets = []
+    shelf_y, shelf_h, x = 0, 0, 0
+    for h, w in shapes:
+        tile_h, tile_w = align(h + guard), align(w + guard)
+        if x + tile_w > canvas_w:
+            shelf_y += shelf_h
+            shelf_h, x = 0, 0
+        offsets.append((shelf_y, x))
+        x += tile_w
+        shelf_h = max(shelf_h, tile_h)
+    return offsets, (shelf_y + shelf_h, canvas_w)
+
+def pnet_output_size(size):
+    """
+        PNet output size for an input side (conv3, max pool 2/2 'full', conv3, conv3)
+    """
+    return int(math.ceil((size - 4) / 2.0)) - 3
+
+def detect_first_stage_packed(img, net, scales, threshold, guard=2):
+    """
+        run PNet once for all scales tiled into one canvas
+
+        Every level is resized from the original image exactly as in
+        detect_first_stage, so cells that lie inside their level see the
+        same pixels. The only difference is the last cell of a level with an
+        odd side: the per-scale forward pools over a window cut by the image
+        border, here the window reaches into the guard padding.
+
+    Parameters:
+    ----------
+        img: numpy array, bgr order
+            input image
+        net: PNet
+            worker
+        scales: list of float
+            pyramid scales
+        threshold: float number
+            detect threshold
+        guard: int number
+            padding between levels in the canvas
+    Returns:
+    -------
+        list of bboxes (or None) in the order of scales
+    """
+    height, width, _ = img.shape
+    shapes = [(int(math.ceil(height * scale)), int(math.ceil(width * scale))) for scale in scales]
+    offsets, (canvas_h, canvas_w) = pack_pyramid(shapes, guard)
+
+    # zero is mid gray after normalization
+    canvas = np.zeros((1, 3, canvas_h, canvas_w), dtype=np.float32)
+    for (hs, ws), (y, x) in zip(shapes, offsets):
+        canvas[:, :, y:y+hs, x:x+ws] = adjust_input(cv2.resize(img, (ws, hs)))
+
+    output = net.predict(canvas)
+
+    all_boxes, levels = [], []
+    for level, (scale, (hs, ws), (y, x)) in enumerate(zip(scales, shapes, offsets)):
+        oh, ow = pnet_output_size(hs), pnet_output_size(ws)
+        cy, cx = y // 2, x // 2
+        boxes = generate_bbox(output[1][0, 1, cy:cy+oh, cx:cx+ow],
+                              output[0][:, :, cy:cy+oh, cx:cx+ow], scale, threshold)
+        if boxes.size > 0:
+            all_boxes.append(boxes)
+            levels.append(np.full(boxes.shape[0], level))
+
+    # nms per level, all levels in one call
+    total_boxes = [None] * len(scales)
+    if all_boxes:
+        all_boxes, levels = np.vstack(all_boxes), np.concatenate(levels)
+        pick = batched_nms(all_boxes[:, 0:5], levels, 0.5, mode='Union')
+        for level in np.unique(levels[pick]):
+            total_boxes[level] = all_boxes[pick[levels[pick] == level]]
+    return total_boxes
+
+def pad(bboxes, w, h):
+    """
+        pad the the bboxes, alse restrict the size of it
+
+        Note that the coordinates of bboxes are clipped to the image in place.
+
+    Parameters:
+    ----------
+        bboxes: numpy array, n x 5
+            input bboxes
+        w: float number
+            width of the input image
+        h: float number
+            height of the input image
+    Returns :
+    ------s
+        dy, dx : numpy array, n x 1
+            start point of the bbox in target image
+        edy, edx : numpy array, n x 1
+            end point of the bbox in target image
+        y, x : numpy array, n x 1
+            start point of the bbox in original image
+        ex, ex : numpy array, n x 1
+            end point of the bbox in original image
+        tmph, tmpw: numpy array, n x 1
+            height and width of the bbox
+
+    """
+    tmpw, tmph = bboxes[:, 2] - bboxes[:, 0] + 1,  bboxes[:, 3] - bboxes[:, 1] + 1
+    num_box = bboxes.shape[0]
+
+    dx , dy= np.zeros((num_box, )), np.zeros((num_box, ))
+    edx, edy  = tmpw.copy()-1, tmph.copy()-1
+
+    x, y, ex, ey = bboxes[:, 0], bboxes[:, 1], bboxes[:, 2], bboxes[:, 3]
+
+    tmp_index = np.where(ex > w-1)
+    edx[tmp_index] = tmpw[tmp_index] + w - 2 - ex[tmp_index]
+    ex[tmp_index] = w - 1
+
+    tmp_index = np.where(ey > h-1)
+    edy[tmp_index] = tmph[tmp_index] + h - 2 - ey[tmp_index]
+    ey[tmp_index] = h - 1
+
+    tmp_index = np.where(x < 0)
+    dx[tmp_index] = 0 - x[tmp_index]
+    x[tmp_index] = 0
+
+    tmp_index = np.where(y < 0)
+    dy[tmp_index] = 0 - y[tmp_index]
+    y[tmp_index] = 0
+
+    return_list = [dy, edy, dx, edx, y, ey, x, ex, tmpw, tmph]
+    return_list = [item.astype(np.int32) for item in return_list]
+
+    return  return_list
+
+def crop_resize_normalize_loop(img, boxes, size, tmp_dtype=np.float32):
+    """
+        reference for crop_resize_normalize: pad() and one cv2.resize per box
+
+    Parameters:
+    ----------
+        img: numpy array, bgr order
+            input image
+        boxes: numpy array, n x 4 (or more columns)
+            boxes to crop, x1, y1, x2, y2 inclusive, may exceed the image
+        size: int number
+            network input size
+        tmp_dtype: numpy dtype
+            dtype of the padded crop, RNet used uint8, ONet and LNet float32
+    Returns:
+    -------
+        numpy array, n x 3 x size x size
+    """
+    height, width = img.shape[:2]
+    [dy, edy, dx, edx, y, ey, x, ex, tmpw, tmph] = pad(np.array(boxes[:, 0:4], dtype=np.float64),
+                                                       width, height)
+    input_buf = np.zeros((boxes.shape[0], 3, size, size), dtype=np.float32)
+    for i in range(boxes.shape[0]):
+        tmp = np.zeros((tmph[i], tmpw[i], 3), dtype=tmp_dtype)
+        tmp[dy[i]:edy[i]+1, dx[i]:edx[i]+1, :] = img[y[i]:ey[i]+1, x[i]:ex[i]+1, :]
+        input_buf[i, :, :, :] = adjust_input(cv2.resize(tmp, (size, size)))
+    return input_buf
+
+def crop_resize_normalize(img, boxes, size, out=None, tmp_dtype=np.float32):
+    """
+        crop all boxes, resize them to size x size and normalize in one call
+
+        Gives the same values as crop_resize_normalize_loop: every box is
+        resized by cv2.resize from a crop of tmp_dtype. A box inside the
+        image is resized straight from its view of the image, only a box
+        that leaves it is copied into a zero padded crop. The chips are
+        written into one batch that is transposed and normalized at once.
+
+    Parameters:
+    ----------
+        img: numpy array, bgr order
+            input image
+        boxes: numpy array, n x 4 (or more columns)
+            boxes to crop, x1, y1, x2, y2 inclusive, may exceed the image
+        size: int number
+            network input size
+        out: numpy array, n x 3 x size x size
+            preallocated batch to fill (may be a view), allocated if None
+        tmp_dtype: numpy dtype
+            dtype of the crops, RNet used uint8, ONet and LNet float32
+    Returns:
+    -------
+        out
+    """
+    boxes = np.asarray(boxes)[:, 0:4].astype(np.int64)
+    num_box = boxes.shape[0]
+    if out is None:
+        out = np.empty((num_box, 3, size, size), dtype=np.float32)
+    height, width, channels = img.shape
+
+    chips = np.empty((num_box, size, size, channels), dtype=tmp_dtype)
+    for i, (x1, y1, x2, y2) in enumerate(boxes.tolist()):
+        if x1 >= 0 and y1 >= 0 and x2 < width and y2 < height:
+            crop = img[y1:y2+1, x1:x2+1]
+            if crop.dtype != tmp_dtype:
+                crop = crop.astype(tmp_dtype)
+        else:
+            # the part inside the image, zero padded as in pad()
+            crop = np.zeros((y2 - y1 + 1, x2 - x1 + 1, channels), dtype=tmp_dtype)
+            sx, sy, ex, ey = max(x1, 0), max(y1, 0), min(x2, width - 1), min(y2, height - 1)
+            if sx <= ex and sy <= ey:
+                crop[sy-y1:ey-y1+1, sx-x1:ex-x1+1] = img[sy:ey+1, sx:ex+1]
+        cv2.resize(crop, (size, size), dst=chips[i])
+
+    # same arithmetic as adjust_input, in place in the batch
+    out[...] = chips.transpose((0, 3, 1, 2))
+    out -= 127.5
+    out *= 0.0078125
+    return out
@@ -1,19 +1,17 @@
 # coding: utf-8
 import os
-import mxnet as mx
 import numpy as np
-import math
-import cv2
-from multiprocessing import Pool
-from itertools import repeat
-from itertools import izip
-from helper import nms, adjust_input, generate_bbox, detect_first_stage_warpper
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from face_align import similarity_transform, warp_faces
+from helper import nms, detect_first_stage, detect_first_stage_scales, \
+    detect_first_stage_packed, init_first_stage_worker, detect_first_stage_worker, pad, crop_resize_normalize
 
 class MtcnnDetector(object):
     """
         Joint Face Detection and Alignment using Multi-task Cascaded Convolutional Neural Networks
         see https://github.com/kpzhang93/MTCNN_face_detection_alignment
-        this is a mxnet version
+        this is a mxnet version, mtcnn_detector_onnx has the ONNX Runtime one
     """
     def __init__(self,
                  model_folder='.',
@@ -22,7 +20,9 @@ class MtcnnDetector(object):
                  factor = 0.709,
                  num_worker = 1,
                  accurate_landmark = False,
-                 ctx=mx.cpu()):
+                 ctx=None,
+                 pool_type = 'thread',
+                 packed_pyramid = False):
         """
             Initialize the detector
 
@@ -37,34 +37,140 @@ class MtcnnDetector(object):
                 factor: float number
                     scale factor for image pyramid
                 num_worker: int number
-                    number of processes we use for first stage
+                    number of threads or processes we use for first stage
                 accurate_landmark: bool
                     use accurate landmark localization or not
+                ctx: mx.Context
+                    device, mx.cpu() by default
+                pool_type: string
+                    'thread' or 'process', how the first stage workers run
+                packed_pyramid: bool
+                    tile all pyramid levels into one canvas and run PNet once,
+                    the first stage then needs no workers
 
         """
+        assert pool_type in ('thread', 'process')
+        if packed_pyramid:
+            num_worker = 1
         self.num_worker = num_worker
         self.accurate_landmark = accurate_landmark
+        self.pool_type = pool_type
+        self.packed_pyramid = packed_pyramid
 
         # load 4 models from folder
         models = ['det1', 'det2', 'det3','det4']
         models = [ os.path.join(model_folder, f) for f in models]
         
-        self.PNets = []
-        for i in range(num_worker):
-            workner_net = mx.model.FeedForward.load(models[0], 1, ctx=ctx)
-            self.PNets.append(workner_net)
-
-        #self.Pool = Pool(num_worker)
-
-        self.RNet = mx.model.FeedForward.load(models[1], 1, ctx=ctx)
-        self.ONet = mx.model.FeedForward.load(models[2], 1, ctx=ctx)
-        self.LNet = mx.model.FeedForward.load(models[3], 1, ctx=ctx)
+        # (device_type, device_id), picklable for the worker processes
+        device = ('cpu', 0) if ctx is None else (ctx.device_type, ctx.device_id)
+
+        self.PNet = self.load_network(models[0], device)
+        self.Pool = None
+        if pool_type == 'process' and num_worker > 1:
+            # every worker process loads its own PNet
+            self.Pool = multiprocessing.get_context('spawn').Pool(
+                num_worker, initializer=init_first_stage_worker,
+                initargs=(type(self), models[0], device))
+        elif num_worker > 1:
+            self.Pool = ThreadPoolExecutor(max_workers=num_worker)
+
+        self.RNet = self.load_network(models[1], device)
+        self.ONet = self.load_network(models[2], device)
+        self.LNet = self.load_network(models[3], device)
 
         self.minsize   = float(minsize)
         self.factor    = float(factor)
         self.threshold = threshold
 
 
+    @classmethod
+    def load_network(cls, prefix, device):
+        """
+            load one network for inference
+
+            Executors are cached by input shape with one set of parameters per
+            network; a predictor runs one forward at a time, so threads only
+            overlap the resize and box generation of the first stage, use
+            pool_type='process' to run PNet forwards in parallel.
+            mxnet is imported here, not at module level, so that the ONNX
+            Runtime subclass works without it.
+
+        Parameters:
+        ----------
+            prefix: string
+                model path without extension, e.g. mtcnn-model/det1
+            device: tuple
+                (device_type, device_id)
+        Returns:
+        -------
+            network with predict(data) -> list of outputs
+        """
+        import mxnet as mx
+        from executor_cache import CachedPredictor
+        return CachedPredictor(prefix, 1, ctx=mx.Context(*device))
+
+    def close(self):
+        """
+            shut down the first stage worker pool
+        """
+        if self.Pool is None:
+            return
+        if self.pool_type == 'process':
+            self.Pool.terminate()
+        else:
+            self.Pool.shutdown(wait=True)
+        self.Pool = None
+
+    def executor_stats(self):
+        """
+            statistics of every network (executor cache binds, bind time,
+            hits ... or ONNX Runtime runs), PNet of the worker processes not included
+        """
+        return {'PNet': self.PNet.get_stats(), 'RNet': self.RNet.get_stats(),
+                'ONet': self.ONet.get_stats(), 'LNet': self.LNet.get_stats()}
+
+    def detect_first_stage(self, img, scales):
+        """
+            run PNet over all pyramid scales, spread across the workers
+
+            Scales are dealt round-robin so that every worker gets a mix of
+            large (expensive) and small scales. The boxes are merged in scale
+            order, so the result does not depend on num_worker or timing.
+
+        Parameters:
+        ----------
+            img: numpy array, bgr order
+                input image
+            scales: list of float
+                pyramid scales
+        Returns:
+        -------
+            list of bboxes (n x 9) per scale that produced any, in scale order
+        """
+        threshold = self.threshold[0]
+        if self.packed_pyramid and len(scales) > 1:
+            per_scale = detect_first_stage_packed(img, self.PNet, scales, threshold)
+        elif self.Pool is None or len(scales) < 2:
+            per_scale = [detect_first_stage(img, self.PNet, scale, threshold) for scale in scales]
+        else:
+            groups = [list(range(k, len(scales), self.num_worker)) for k in range(self.num_worker)]
+            groups = [group for group in groups if group]
+            if self.pool_type == 'process':
+                results = self.Pool.map(detect_first_stage_worker,
+                                        [(img, [scales[i] for i in group], threshold) for group in groups])
+            else:
+                futures = [self.Pool.submit(detect_first_stage_scales, img, self.PNet,
+                                            [scales[i] for i in group], threshold)
+                           for group in groups]
+                results = [future.result() for future in futures]
+
+            per_scale = [None] * len(scales)
+            for group, group_boxes in zip(groups, results):
+                for i, boxes in zip(group, group_boxes):
+                    per_scale[i] = boxes
+
+        return [boxes for boxes in per_scale if boxes is not None]
+
     def convert_to_square(self, bbox):
         """
             convert bbox to square
@@ -141,34 +247,7 @@ class MtcnnDetector(object):
                 height and width of the bbox
 
         """
-        tmpw, tmph = bboxes[:, 2] - bboxes[:, 0] + 1,  bboxes[:, 3] - bboxes[:, 1] + 1
-        num_box = bboxes.shape[0]
-
-        dx , dy= np.zeros((num_box, )), np.zeros((num_box, ))
-        edx, edy  = tmpw.copy()-1, tmph.copy()-1
-
-        x, y, ex, ey = bboxes[:, 0], bboxes[:, 1], bboxes[:, 2], bboxes[:, 3]
-
-        tmp_index = np.where(ex > w-1)
-        edx[tmp_index] = tmpw[tmp_index] + w - 2 - ex[tmp_index]
-        ex[tmp_index] = w - 1
-
-        tmp_index = np.where(ey > h-1)
-        edy[tmp_index] = tmph[tmp_index] + h - 2 - ey[tmp_index]
-        ey[tmp_index] = h - 1
-
-        tmp_index = np.where(x < 0)
-        dx[tmp_index] = 0 - x[tmp_index]
-        x[tmp_index] = 0
-
-        tmp_index = np.where(y < 0)
-        dy[tmp_index] = 0 - y[tmp_index]
-        y[tmp_index] = 0
-
-        return_list = [dy, edy, dx, edx, y, ey, x, ex, tmpw, tmph]
-        return_list = [item.astype(np.int32) for item in return_list]
-
-        return  return_list
+        return pad(bboxes, w, h)
 
     def slice_index(self, number):
         """
@@ -186,119 +265,274 @@ class MtcnnDetector(object):
         return list(chunks(num_list, self.num_worker))
         
     def detect_face_limited(self, img, det_type=2):
-        height, width, _ = img.shape
-        if det_type>=2:
-          total_boxes = np.array( [ [0.0, 0.0, img.shape[1], img.shape[0], 0.9] ] ,dtype=np.float32)
-          num_box = total_boxes.shape[0]
-
-          # pad the bbox
-          [dy, edy, dx, edx, y, ey, x, ex, tmpw, tmph] = self.pad(total_boxes, width, height)
-          # (3, 24, 24) is the input shape for RNet
-          input_buf = np.zeros((num_box, 3, 24, 24), dtype=np.float32)
-
-          for i in range(num_box):
-              tmp = np.zeros((tmph[i], tmpw[i], 3), dtype=np.uint8)
-              tmp[dy[i]:edy[i]+1, dx[i]:edx[i]+1, :] = img[y[i]:ey[i]+1, x[i]:ex[i]+1, :]
-              input_buf[i, :, :, :] = adjust_input(cv2.resize(tmp, (24, 24)))
-
-          output = self.RNet.predict(input_buf)
-
-          # filter the total_boxes with threshold
-          passed = np.where(output[1][:, 1] > self.threshold[1])
-          total_boxes = total_boxes[passed]
-
-          if total_boxes.size == 0:
-              return None
-
-          total_boxes[:, 4] = output[1][passed, 1].reshape((-1,))
-          reg = output[0][passed]
-
-          # nms
-          pick = nms(total_boxes, 0.7, 'Union')
-          total_boxes = total_boxes[pick]
-          total_boxes = self.calibrate_box(total_boxes, reg[pick])
-          total_boxes = self.convert_to_square(total_boxes)
-          total_boxes[:, 0:4] = np.round(total_boxes[:, 0:4])
-        else:
-          total_boxes = np.array( [ [0.0, 0.0, img.shape[1], img.shape[0], 0.9] ] ,dtype=np.float32)
-        num_box = total_boxes.shape[0]
-        [dy, edy, dx, edx, y, ey, x, ex, tmpw, tmph] = self.pad(total_boxes, width, height)
-        # (3, 48, 48) is the input shape for ONet
-        input_buf = np.zeros((num_box, 3, 48, 48), dtype=np.float32)
+        """
+            later stages only, on the whole image as the single candidate:
+            RNet and ONet for det_type 2, ONet alone for det_type 1
+        """
+        whole = [0.0, 0.0, img.shape[1], img.shape[0]]
+        return self.detect_face_from_hints(img, [whole], fallback=False, square=False,
+                                           stage=2 if det_type>=2 else 3)
 
-        for i in range(num_box):
-            tmp = np.zeros((tmph[i], tmpw[i], 3), dtype=np.float32)
-            tmp[dy[i]:edy[i]+1, dx[i]:edx[i]+1, :] = img[y[i]:ey[i]+1, x[i]:ex[i]+1, :]
-            input_buf[i, :, :, :] = adjust_input(cv2.resize(tmp, (48, 48)))
+    def pyramid_scales(self, height, width, face_size=None):
+        """
+            scales of the image pyramid for the first stage
 
-        output = self.ONet.predict(input_buf)
-        #print(output[2])
+        Parameters:
+        ----------
+            height, width: int number
+                size of the input image
+            face_size: tuple of float, optional
+                (min, max) expected face side relative to the shorter image
+                side, only the levels that can detect such faces are kept
+        Returns:
+        -------
+            list of float, largest scale first
+        """
+        MIN_DET_SIZE = 12
+
+        minl = min( height, width)
+        # a level with scale s finds faces of about MIN_DET_SIZE/s pixels,
+        # one pyramid step of slack on both ends of the expected range
+        if face_size is not None:
+            largest = MIN_DET_SIZE / (face_size[0] * minl * self.factor)
+            smallest = MIN_DET_SIZE * self.factor / (face_size[1] * minl)
+
+        # get all the valid scales
+        scales = []
+        m = MIN_DET_SIZE/self.minsize
+        minl *= m
+        factor_count = 0
+        while minl > MIN_DET_SIZE:
+            scale = m*self.factor**factor_count
+            if face_size is None or smallest <= scale <= largest:
+                scales.append(scale)
+            minl *= self.factor
+            factor_count += 1
+        return scales
+
+    def first_stage_boxes(self, img, scales=None):
+        """
+            candidate boxes of the first stage (PNet over the pyramid)
 
-        # filter the total_boxes with threshold
-        passed = np.where(output[2][:, 1] > self.threshold[2])
-        total_boxes = total_boxes[passed]
+        Parameters:
+        ----------
+            img: numpy array, bgr order of shape (n, m, 3)
+                input image
+            scales: list of float, optional
+                pyramid scales, the full pyramid by default
+        Retures:
+        -------
+            bboxes: numpy array, n x 5, squared and rounded, or None
+        """
+        height, width, _ = img.shape
+        if scales is None:
+            scales = self.pyramid_scales(height, width)
+
+        #############################################
+        # first stage
+        #############################################
+        total_boxes = self.detect_first_stage(img, scales)
+
+        if len(total_boxes) == 0:
+            return None
+        
+        total_boxes = np.vstack(total_boxes)
 
         if total_boxes.size == 0:
             return None
 
-        total_boxes[:, 4] = output[2][passed, 1].reshape((-1,))
-        reg = output[1][passed]
-        points = output[0][passed]
+        # merge the detection from first stage
+        pick = nms(total_boxes[:, 0:5], 0.7, 'Union')
+        total_boxes = total_boxes[pick]
 
-        # compute landmark points
         bbw = total_boxes[:, 2] - total_boxes[:, 0] + 1
         bbh = total_boxes[:, 3] - total_boxes[:, 1] + 1
-        points[:, 0:5] = np.expand_dims(total_boxes[:, 0], 1) + np.expand_dims(bbw, 1) * points[:, 0:5]
-        points[:, 5:10] = np.expand_dims(total_boxes[:, 1], 1) + np.expand_dims(bbh, 1) * points[:, 5:10]
 
-        # nms
-        total_boxes = self.calibrate_box(total_boxes, reg)
-        pick = nms(total_boxes, 0.7, 'Min')
-        total_boxes = total_boxes[pick]
-        points = points[pick]
-        
-        if not self.accurate_landmark:
-            return total_boxes, points
+        # refine the bboxes
+        total_boxes = np.vstack([total_boxes[:, 0]+total_boxes[:, 5] * bbw,
+                                 total_boxes[:, 1]+total_boxes[:, 6] * bbh,
+                                 total_boxes[:, 2]+total_boxes[:, 7] * bbw,
+                                 total_boxes[:, 3]+total_boxes[:, 8] * bbh,
+                                 total_boxes[:, 4]
+                                 ])
 
-        #############################################
-        # extended stage
-        #############################################
-        num_box = total_boxes.shape[0]
-        patchw = np.maximum(total_boxes[:, 2]-total_boxes[:, 0]+1, total_boxes[:, 3]-total_boxes[:, 1]+1)
-        patchw = np.round(patchw*0.25)
+        total_boxes = total_boxes.T
+        total_boxes = self.convert_to_square(total_boxes)
+        total_boxes[:, 0:4] = np.round(total_boxes[:, 0:4])
+        return total_boxes
 
-        # make it even
-        patchw[np.where(np.mod(patchw,2) == 1)] += 1
+    def predict_pooled(self, net, images, boxes_list, size, tmp_dtype=np.float32):
+        """
+            crop the boxes of all images and run net once over the whole batch
 
-        input_buf = np.zeros((num_box, 15, 24, 24), dtype=np.float32)
-        for i in range(5):
-            x, y = points[:, i], points[:, i+5]
-            x, y = np.round(x-0.5*patchw), np.round(y-0.5*patchw)
-            [dy, edy, dx, edx, y, ey, x, ex, tmpw, tmph] = self.pad(np.vstack([x, y, x+patchw-1, y+patchw-1]).T,
-                                                                    width,
-                                                                    height)
-            for j in range(num_box):
-                tmpim = np.zeros((tmpw[j], tmpw[j], 3), dtype=np.float32)
-                tmpim[dy[j]:edy[j]+1, dx[j]:edx[j]+1, :] = img[y[j]:ey[j]+1, x[j]:ex[j]+1, :]
-                input_buf[j, i*3:i*3+3, :, :] = adjust_input(cv2.resize(tmpim, (24, 24)))
+        Parameters:
+        ----------
+            net: RNet or ONet
+                network
+            images: list of numpy array
+                input images
+            boxes_list: list of numpy array
+                boxes per image, clipped to their image in place (see pad)
+            size: int number
+                network input size
+            tmp_dtype: numpy dtype
+                dtype of the crops (see crop_resize_normalize)
+        Returns:
+        -------
+            list of network outputs per image
+        """
+        if len(boxes_list) == 0:
+            return []
+        counts = [boxes.shape[0] for boxes in boxes_list]
+        input_buf = np.empty((sum(counts), 3, size, size), dtype=np.float32)
+        begin = 0
+        for img, boxes, count in zip(images, boxes_list, counts):
+            height, width, _ = img.shape
+            crop_resize_normalize(img, boxes, size, out=input_buf[begin:begin+count], tmp_dtype=tmp_dtype)
+            # pad the bbox, this also clips the boxes to the image
+            self.pad(boxes, width, height)
+            begin += count
+
+        output = net.predict(input_buf)
+
+        per_image = []
+        begin = 0
+        for count in counts:
+            per_image.append([o[begin:begin+count] for o in output])
+            begin += count
+        return per_image
+
+    def refine_boxes(self, images, boxes_list, stage=2):
+        """
+            second, third and landmark stages for candidate boxes
 
-        output = self.LNet.predict(input_buf)
+            Candidates of all images are pooled: every network runs once per
+            stage over the crops of all images, the filtering and nms stay
+            per image.
 
-        pointx = np.zeros((num_box, 5))
-        pointy = np.zeros((num_box, 5))
+        Parameters:
+        ----------
+            images: list of numpy array, bgr order
+                input images
+            boxes_list: list of numpy array, n x 5 or None
+                candidate boxes per image
+            stage: int number
+                first stage to run, 2 (RNet) or 3 (ONet)
+        Retures:
+        -------
+            list with (bboxes, points) or None per image
+        """
+        results = [None] * len(images)
+        active = [i for i, boxes in enumerate(boxes_list) if boxes is not None and boxes.size > 0]
+        total_boxes = {i: boxes_list[i] for i in active}
 
-        for k in range(5):
-            # do not make a large movement
-            tmp_index = np.where(np.abs(output[k]-0.5) > 0.35)
-            output[k][tmp_index[0]] = 0.5
+        #############################################
+        # second stage
+        #############################################
+        outputs = []
+        if stage <= 2:
+            # RNet crops are uint8 as in the original pipeline
+            outputs = self.predict_pooled(self.RNet, [images[i] for i in active],
+                                          [total_boxes[i] for i in active], 24, np.uint8)
+        for i, output in zip(list(active), outputs):
+            # filter the total_boxes with threshold
+            passed = np.where(output[1][:, 1] > self.threshold[1])
+            boxes = total_boxes[i][passed]
+
+            if boxes.size == 0:
+                active.remove(i)
+                continue
+
+            boxes[:, 4] = output[1][passed, 1].reshape((-1,))
+            reg = output[0][passed]
+
+            # nms
+            pick = nms(boxes, 0.7, 'Union')
+            boxes = boxes[pick]
+            boxes = self.calibrate_box(boxes, reg[pick])
+            boxes = self.convert_to_square(boxes)
+            boxes[:, 0:4] = np.round(boxes[:, 0:4])
+            total_boxes[i] = boxes
 
-            pointx[:, k] = np.round(points[:, k] - 0.5*patchw) + output[k][:, 0]*patchw
-            pointy[:, k] = np.round(points[:, k+5] - 0.5*patchw) + output[k][:, 1]*patchw
+        #############################################
+        # third stage
+        #############################################
+        outputs = self.predict_pooled(self.ONet, [images[i] for i in active],
+                                      [total_boxes[i] for i in active], 48)
+        points = {}
+        for i, output in zip(list(active), outputs):
+            # filter the total_boxes with threshold
+            passed = np.where(output[2][:, 1] > self.threshold[2])
+            boxes = total_boxes[i][passed]
+
+            if boxes.size == 0:
+                active.remove(i)
+                continue
+
+            boxes[:, 4] = output[2][passed, 1].reshape((-1,))
+            reg = output[1][passed]
+            landmarks = output[0][passed]
+
+            # compute landmark points
+            bbw = boxes[:, 2] - boxes[:, 0] + 1
+            bbh = boxes[:, 3] - boxes[:, 1] + 1
+            landmarks[:, 0:5] = np.expand_dims(boxes[:, 0], 1) + np.expand_dims(bbw, 1) * landmarks[:, 0:5]
+            landmarks[:, 5:10] = np.expand_dims(boxes[:, 1], 1) + np.expand_dims(bbh, 1) * landmarks[:, 5:10]
+
+            # nms
+            boxes = self.calibrate_box(boxes, reg)
+            pick = nms(boxes, 0.7, 'Min')
+            total_boxes[i] = boxes[pick]
+            points[i] = landmarks[pick]
 
-        points = np.hstack([pointx, pointy])
-        points = points.astype(np.int32)
+        if not self.accurate_landmark:
+            for i in active:
+                results[i] = (total_boxes[i], points[i])
+            return results
 
-        return total_boxes, points
+        #############################################
+        # extended stage
+        #############################################
+        counts = [total_boxes[i].shape[0] for i in active]
+        input_buf = np.empty((sum(counts), 15, 24, 24), dtype=np.float32)
+        patchws = []
+        begin = 0
+        for i, num_box in zip(active, counts):
+            boxes = total_boxes[i]
+            patchw = np.maximum(boxes[:, 2]-boxes[:, 0]+1, boxes[:, 3]-boxes[:, 1]+1)
+            patchw = np.round(patchw*0.25)
+
+            # make it even
+            patchw[np.where(np.mod(patchw,2) == 1)] += 1
+            patchws.append(patchw)
+
+            for k in range(5):
+                x, y = points[i][:, k], points[i][:, k+5]
+                x, y = np.round(x-0.5*patchw), np.round(y-0.5*patchw)
+                crop_resize_normalize(images[i], np.vstack([x, y, x+patchw-1, y+patchw-1]).T, 24,
+                                      out=input_buf[begin:begin+num_box, k*3:k*3+3, :, :])
+            begin += num_box
+
+        output = self.LNet.predict(input_buf) if len(active) > 0 else []
+
+        begin = 0
+        for i, num_box, patchw in zip(active, counts, patchws):
+            pointx = np.zeros((num_box, 5))
+            pointy = np.zeros((num_box, 5))
+
+            for k in range(5):
+                offset = output[k][begin:begin+num_box]
+                # do not make a large movement
+                tmp_index = np.where(np.abs(offset-0.5) > 0.35)
+                offset[tmp_index[0]] = 0.5
+
+                pointx[:, k] = np.round(points[i][:, k] - 0.5*patchw) + offset[:, 0]*patchw
+                pointy[:, k] = np.round(points[i][:, k+5] - 0.5*patchw) + offset[:, 1]*patchw
+
+            results[i] = (total_boxes[i], np.hstack([pointx, pointy]).astype(np.int32))
+            begin += num_box
+
+        return results
 
     def detect_face(self, img, det_type=0):
         """
@@ -314,201 +548,144 @@ class MtcnnDetector(object):
             points: numpy array, n x 10 (x1, x2 ... x5, y1, y2 ..y5)
                 landmarks
         """
+        if img is None:
+            return None
 
-        # check input
-        height, width, _ = img.shape
-        if det_type==0:
-            MIN_DET_SIZE = 12
-
-            if img is None:
-                return None
-
-            # only works for color image
-            if len(img.shape) != 3:
-                return None
-
-            # detected boxes
-            total_boxes = []
-
-            minl = min( height, width)
-
-            # get all the valid scales
-            scales = []
-            m = MIN_DET_SIZE/self.minsize
-            minl *= m
-            factor_count = 0
-            while minl > MIN_DET_SIZE:
-                scales.append(m*self.factor**factor_count)
-                minl *= self.factor
-                factor_count += 1
-
-            #############################################
-            # first stage
-            #############################################
-            #for scale in scales:
-            #    return_boxes = self.detect_first_stage(img, scale, 0)
-            #    if return_boxes is not None:
-            #        total_boxes.append(return_boxes)
-            
-            sliced_index = self.slice_index(len(scales))
-            total_boxes = []
-            for batch in sliced_index:
-                #local_boxes = self.Pool.map( detect_first_stage_warpper, \
-                #        izip(repeat(img), self.PNets[:len(batch)], [scales[i] for i in batch], repeat(self.threshold[0])) )
-                local_boxes = map( detect_first_stage_warpper, \
-                        izip(repeat(img), self.PNets[:len(batch)], [scales[i] for i in batch], repeat(self.threshold[0])) )
-                total_boxes.extend(local_boxes)
-            
-            # remove the Nones 
-            total_boxes = [ i for i in total_boxes if i is not None]
-
-            if len(total_boxes) == 0:
-                return None
-            
-            total_boxes = np.vstack(total_boxes)
-
-            if total_boxes.size == 0:
-                return None
-
-            # merge the detection from first stage
-            pick = nms(total_boxes[:, 0:5], 0.7, 'Union')
-            total_boxes = total_boxes[pick]
-
-            bbw = total_boxes[:, 2] - total_boxes[:, 0] + 1
-            bbh = total_boxes[:, 3] - total_boxes[:, 1] + 1
-
-            # refine the bboxes
-            total_boxes = np.vstack([total_boxes[:, 0]+total_boxes[:, 5] * bbw,
-                                     total_boxes[:, 1]+total_boxes[:, 6] * bbh,
-                                     total_boxes[:, 2]+total_boxes[:, 7] * bbw,
-                                     total_boxes[:, 3]+total_boxes[:, 8] * bbh,
-                                     total_boxes[:, 4]
-                                     ])
-
-            total_boxes = total_boxes.T
-            total_boxes = self.convert_to_square(total_boxes)
-            total_boxes[:, 0:4] = np.round(total_boxes[:, 0:4])
-        else:
-            total_boxes = np.array( [ [0.0, 0.0, img.shape[1], img.shape[0], 0.9] ] ,dtype=np.float32)
-
-        #############################################
-        # second stage
-        #############################################
-        num_box = total_boxes.shape[0]
+        # only works for color image
+        if len(img.shape) != 3:
+            return None
 
-        # pad the bbox
-        [dy, edy, dx, edx, y, ey, x, ex, tmpw, tmph] = self.pad(total_boxes, width, height)
-        # (3, 24, 24) is the input shape for RNet
-        input_buf = np.zeros((num_box, 3, 24, 24), dtype=np.float32)
+        if det_type!=0:
+            whole = [0.0, 0.0, img.shape[1], img.shape[0]]
+            return self.detect_face_from_hints(img, [whole], fallback=False, square=False)
 
-        for i in range(num_box):
-            tmp = np.zeros((tmph[i], tmpw[i], 3), dtype=np.uint8)
-            tmp[dy[i]:edy[i]+1, dx[i]:edx[i]+1, :] = img[y[i]:ey[i]+1, x[i]:ex[i]+1, :]
-            input_buf[i, :, :, :] = adjust_input(cv2.resize(tmp, (24, 24)))
+        return self.refine_boxes([img], [self.first_stage_boxes(img)])[0]
 
-        output = self.RNet.predict(input_buf)
+    def detect_face_from_hints(self, img, hints, fallback=True, square=True, stage=2):
+        """
+            detect faces around known boxes, skipping the pyramid and PNet
 
-        # filter the total_boxes with threshold
-        passed = np.where(output[1][:, 1] > self.threshold[1])
-        total_boxes = total_boxes[passed]
+            The hints (a box from the previous frame, a client-side crop, a
+            cached detection of the same photo ...) are refined by RNet, ONet
+            and LNet like first stage candidates.
 
-        if total_boxes.size == 0:
+        Parameters:
+        ----------
+            img: numpy array, bgr order of shape (n, m, 3)
+                input image
+            hints: numpy array or list, n x 4 (x1,y1,x2,y2) or n x 5
+                boxes expected to hold a face, any score column is ignored
+            fallback: bool
+                run the full detect_face when no hint survives refinement
+            square: bool
+                convert the hints to squares first, as the first stage does
+            stage: int number
+                first stage to run, 2 (RNet) or 3 (ONet)
+        Retures:
+        -------
+            bboxes: numpy array, n x 5 (x1,y2,x2,y2,score)
+                bboxes
+            points: numpy array, n x 10 (x1, x2 ... x5, y1, y2 ..y5)
+                landmarks
+        """
+        if img is None or len(img.shape) != 3:
             return None
 
-        total_boxes[:, 4] = output[1][passed, 1].reshape((-1,))
-        reg = output[0][passed]
-
-        # nms
-        pick = nms(total_boxes, 0.7, 'Union')
-        total_boxes = total_boxes[pick]
-        total_boxes = self.calibrate_box(total_boxes, reg[pick])
-        total_boxes = self.convert_to_square(total_boxes)
-        total_boxes[:, 0:4] = np.round(total_boxes[:, 0:4])
-
-        #############################################
-        # third stage
-        #############################################
-        num_box = total_boxes.shape[0]
-
-        # pad the bbox
-        [dy, edy, dx, edx, y, ey, x, ex, tmpw, tmph] = self.pad(total_boxes, width, height)
-        # (3, 48, 48) is the input shape for ONet
-        input_buf = np.zeros((num_box, 3, 48, 48), dtype=np.float32)
+        hints = np.atleast_2d(np.asarray(hints, dtype=np.float32))
+        if hints.size == 0:
+            return self.detect_face(img) if fallback else None
+        total_boxes = np.empty((hints.shape[0], 5), dtype=np.float32)
+        total_boxes[:, 0:4] = hints[:, 0:4]
+        # the score is set by the first network that runs
+        total_boxes[:, 4] = 0.9
+        if square:
+            total_boxes = self.convert_to_square(total_boxes)
+            total_boxes[:, 0:4] = np.round(total_boxes[:, 0:4])
 
-        for i in range(num_box):
-            tmp = np.zeros((tmph[i], tmpw[i], 3), dtype=np.float32)
-            tmp[dy[i]:edy[i]+1, dx[i]:edx[i]+1, :] = img[y[i]:ey[i]+1, x[i]:ex[i]+1, :]
-            input_buf[i, :, :, :] = adjust_input(cv2.resize(tmp, (48, 48)))
+        ret = self.refine_boxes([img], [total_boxes], stage)[0]
+        if ret is None and fallback:
+            ret = self.detect_face(img)
+        return ret
 
-        output = self.ONet.predict(input_buf)
+    def detect_selfie(self, img, face_size=(0.3, 0.8), largest_only=True, exit_score=0.95):
+        """
+            detect faces of an expected size, e.g. the face of a selfie
 
-        # filter the total_boxes with threshold
-        passed = np.where(output[2][:, 1] > self.threshold[2])
-        total_boxes = total_boxes[passed]
+            Only the pyramid levels matching face_size run. With largest_only
+            the levels run one at a time from the largest faces down, every
+            level goes through the later stages at once, and detection stops
+            at the first level that yields a face scoring at least exit_score.
 
-        if total_boxes.size == 0:
+        Parameters:
+        ----------
+            img: numpy array, bgr order of shape (n, m, 3)
+                input image
+            face_size: tuple of float
+                (min, max) expected face side relative to the shorter image side
+            largest_only: bool
+                return only the largest face, allows the early exit
+            exit_score: float number
+                ONet score of a face that ends the search
+        Retures:
+        -------
+            bboxes: numpy array, n x 5 (x1,y2,x2,y2,score)
+                bboxes, a single one with largest_only
+            points: numpy array, n x 10 (x1, x2 ... x5, y1, y2 ..y5)
+                landmarks
+        """
+        if img is None or len(img.shape) != 3:
             return None
 
-        total_boxes[:, 4] = output[2][passed, 1].reshape((-1,))
-        reg = output[1][passed]
-        points = output[0][passed]
-
-        # compute landmark points
-        bbw = total_boxes[:, 2] - total_boxes[:, 0] + 1
-        bbh = total_boxes[:, 3] - total_boxes[:, 1] + 1
-        points[:, 0:5] = np.expand_dims(total_boxes[:, 0], 1) + np.expand_dims(bbw, 1) * points[:, 0:5]
-        points[:, 5:10] = np.expand_dims(total_boxes[:, 1], 1) + np.expand_dims(bbh, 1) * points[:, 5:10]
-
-        # nms
-        total_boxes = self.calibrate_box(total_boxes, reg)
+        height, width, _ = img.shape
+        scales = self.pyramid_scales(height, width, face_size)
+        if not scales:
+            return None
+        if not largest_only:
+            return self.refine_boxes([img], [self.first_stage_boxes(img, scales)])[0]
+
+        found = []
+        # the smallest scale finds the largest faces
+        for scale in reversed(scales):
+            ret = self.refine_boxes([img], [self.first_stage_boxes(img, [scale])])[0]
+            if ret is None:
+                continue
+            found.append(ret)
+            if ret[0][:, 4].max() >= exit_score:
+                break
+
+        if not found:
+            return None
+        total_boxes = np.vstack([boxes for boxes, _ in found])
+        points = np.vstack([landmarks for _, landmarks in found])
+        # the same face found on neighbouring levels
         pick = nms(total_boxes, 0.7, 'Min')
-        total_boxes = total_boxes[pick]
-        points = points[pick]
-        
-        if not self.accurate_landmark:
-            return total_boxes, points
-
-        #############################################
-        # extended stage
-        #############################################
-        num_box = total_boxes.shape[0]
-        patchw = np.maximum(total_boxes[:, 2]-total_boxes[:, 0]+1, total_boxes[:, 3]-total_boxes[:, 1]+1)
-        patchw = np.round(patchw*0.25)
-
-        # make it even
-        patchw[np.where(np.mod(patchw,2) == 1)] += 1
-
-        input_buf = np.zeros((num_box, 15, 24, 24), dtype=np.float32)
-        for i in range(5):
-            x, y = points[:, i], points[:, i+5]
-            x, y = np.round(x-0.5*patchw), np.round(y-0.5*patchw)
-            [dy, edy, dx, edx, y, ey, x, ex, tmpw, tmph] = self.pad(np.vstack([x, y, x+patchw-1, y+patchw-1]).T,
-                                                                    width,
-                                                                    height)
-            for j in range(num_box):
-                tmpim = np.zeros((tmpw[j], tmpw[j], 3), dtype=np.float32)
-                tmpim[dy[j]:edy[j]+1, dx[j]:edx[j]+1, :] = img[y[j]:ey[j]+1, x[j]:ex[j]+1, :]
-                input_buf[j, i*3:i*3+3, :, :] = adjust_input(cv2.resize(tmpim, (24, 24)))
-
-        output = self.LNet.predict(input_buf)
-
-        pointx = np.zeros((num_box, 5))
-        pointy = np.zeros((num_box, 5))
-
-        for k in range(5):
-            # do not make a large movement
-            tmp_index = np.where(np.abs(output[k]-0.5) > 0.35)
-            output[k][tmp_index[0]] = 0.5
+        total_boxes, points = total_boxes[pick], points[pick]
 
-            pointx[:, k] = np.round(points[:, k] - 0.5*patchw) + output[k][:, 0]*patchw
-            pointy[:, k] = np.round(points[:, k+5] - 0.5*patchw) + output[k][:, 1]*patchw
+        area = (total_boxes[:, 2]-total_boxes[:, 0]+1) * (total_boxes[:, 3]-total_boxes[:, 1]+1)
+        largest = np.argmax(area)
+        return total_boxes[largest:largest+1], points[largest:largest+1]
 
-        points = np.hstack([pointx, pointy])
-        points = points.astype(np.int32)
-
-        return total_boxes, points
+    def detect_faces(self, images):
+        """
+            detect faces over several images
 
+            The first stage runs per image, the later stages run over the
+            candidates of all images at once (see refine_boxes), which gives
+            RNet, ONet and LNet much larger batches than detect_face.
 
+        Parameters:
+        ----------
+            images: list of numpy array, bgr order
+                input images
+        Retures:
+        -------
+            list with the result of detect_face for every image
+        """
+        boxes_list = [None] * len(images)
+        for i, img in enumerate(images):
+            if img is not None and len(img.shape) == 3:
+                boxes_list[i] = self.first_stage_boxes(img)
+        return self.refine_boxes(images, boxes_list)
 
     def list2colmatrix(self, pts_list):
         """
@@ -544,43 +721,9 @@ class MtcnnDetector(object):
         """
         assert from_shape.shape[0] == to_shape.shape[0] and from_shape.shape[0] % 2 == 0
 
-        sigma_from = 0.0
-        sigma_to = 0.0
-        cov = np.matrix([[0.0, 0.0], [0.0, 0.0]])
-
-        # compute the mean and cov
-        from_shape_points = from_shape.reshape(from_shape.shape[0]/2, 2)
-        to_shape_points = to_shape.reshape(to_shape.shape[0]/2, 2)
-        mean_from = from_shape_points.mean(axis=0)
-        mean_to = to_shape_points.mean(axis=0)
-
-        for i in range(from_shape_points.shape[0]):
-            temp_dis = np.linalg.norm(from_shape_points[i] - mean_from)
-            sigma_from += temp_dis * temp_dis
-            temp_dis = np.linalg.norm(to_shape_points[i] - mean_to)
-            sigma_to += temp_dis * temp_dis
-            cov += (to_shape_points[i].transpose() - mean_to.transpose()) * (from_shape_points[i] - mean_from)
-
-        sigma_from = sigma_from / to_shape_points.shape[0]
-        sigma_to = sigma_to / to_shape_points.shape[0]
-        cov = cov / to_shape_points.shape[0]
-
-        # compute the affine matrix
-        s = np.matrix([[1.0, 0.0], [0.0, 1.0]])
-        u, d, vt = np.linalg.svd(cov)
-
-        if np.linalg.det(cov) < 0:
-            if d[1] < d[0]:
-                s[1, 1] = -1
-            else:
-                s[0, 0] = -1
-        r = u * s * vt
-        c = 1.0
-        if sigma_from != 0:
-            c = 1.0 / sigma_from * np.trace(np.diag(d) * s)
-
-        tran_b = mean_to.transpose() - c * r * mean_from.transpose()
-        tran_m = c * r
+        M = similarity_transform(np.asarray(from_shape).reshape(-1, 2), np.asarray(to_shape).reshape(-1, 2))
+        tran_m = M[:, 0:2]
+        tran_b = M[:, 2:3]
 
         return tran_m, tran_b
 
@@ -599,57 +742,24 @@ class MtcnnDetector(object):
             crop_imgs: list, n
                 cropped and aligned faces 
         """
-        crop_imgs = []
-        for p in points:
-            shape  =[]
-            for k in range(len(p)/2):
-                shape.append(p[k])
-                shape.append(p[k+5])
-
-            if padding > 0:
-                padding = padding
-            else:
-                padding = 0
-            # average positions of face points
-            mean_face_shape_x = [0.224152, 0.75610125, 0.490127, 0.254149, 0.726104]
-            mean_face_shape_y = [0.2119465, 0.2119465, 0.628106, 0.780233, 0.780233]
-
-            from_points = []
-            to_points = []
-
-            for i in range(len(shape)/2):
-                x = (padding + mean_face_shape_x[i]) / (2 * padding + 1) * desired_size
-                y = (padding + mean_face_shape_y[i]) / (2 * padding + 1) * desired_size
-                to_points.append([x, y])
-                from_points.append([shape[2*i], shape[2*i+1]])
-
-            # convert the points to Mat
-            from_mat = self.list2colmatrix(from_points)
-            to_mat = self.list2colmatrix(to_points)
-
-            # compute the similar transfrom
-            tran_m, tran_b = self.find_tfrom_between_shapes(from_mat, to_mat)
-
-            probe_vec = np.matrix([1.0, 0.0]).transpose()
-            probe_vec = tran_m * probe_vec
-
-            scale = np.linalg.norm(probe_vec)
-            angle = 180.0 / math.pi * math.atan2(probe_vec[1, 0], probe_vec[0, 0])
-
-            from_center = [(shape[0]+shape[2])/2.0, (shape[1]+shape[3])/2.0]
-            to_center = [0, 0]
-            to_center[1] = desired_size * 0.4
-            to_center[0] = desired_size * 0.5
-
-            ex = to_center[0] - from_center[0]
-            ey = to_center[1] - from_center[1]
-
-            rot_mat = cv2.getRotationMatrix2D((from_center[0], from_center[1]), -1*angle, scale)
-            rot_mat[0][2] += ex
-            rot_mat[1][2] += ey
-
-            chips = cv2.warpAffine(img, rot_mat, (desired_size, desired_size))
-            crop_imgs.append(chips)
-
-        return crop_imgs
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 10)
+        shapes = np.stack([points[:, 0:5], points[:, 5:10]], axis=2)
+
+        padding = max(padding, 0)
+        # average positions of face points
+        mean_face_shape_x = [0.224152, 0.75610125, 0.490127, 0.254149, 0.726104]
+        mean_face_shape_y = [0.2119465, 0.2119465, 0.628106, 0.780233, 0.780233]
+        to_points = (padding + np.stack([mean_face_shape_x, mean_face_shape_y], axis=1)) \
+            / (2 * padding + 1) * desired_size
+
+        # compute the similar transfrom of all faces at once
+        tran = similarity_transform(shapes, to_points)
+
+        # keep the rotation and scale, but move the middle of the eyes to a fixed point
+        from_center = shapes[:, 0:2].mean(axis=1)
+        to_center = np.array([desired_size * 0.5, desired_size * 0.4])
+        tran[:, :, 2] = to_center - np.einsum('nij,nj->ni', tran[:, :, 0:2], from_center)
+
+        chips = warp_faces(img, tran, (desired_size, desired_size))
+        return list(chips)
 
@@ -0,0 +1,26 @@
+# coding: utf-8
+"""
+    MtcnnDetector on ONNX Runtime, without mxnet
+
+    The networks are the det1.onnx ... det4.onnx files that export_onnx.py
+    writes next to the mxnet checkpoints in model_folder. Everything but the
+    network forward is shared with mtcnn_detector.MtcnnDetector.
+"""
+import mtcnn_detector
+from onnx_predictor import OnnxPredictor
+
+
+class MtcnnDetector(mtcnn_detector.MtcnnDetector):
+    """
+        mtcnn_detector.MtcnnDetector with the same parameters and methods,
+        the networks run on ONNX Runtime (ctx is ignored, the CPU is used)
+    """
+    # intra-op threads of every session, 0 lets ONNX Runtime decide
+    num_threads = 0
+
+    @classmethod
+    def load_network(cls, prefix, device):
+        """
+            load prefix.onnx, see mtcnn_detector.MtcnnDetector.load_network
+        """
+        return OnnxPredictor(prefix + '.onnx', num_threads=cls.num_threads)
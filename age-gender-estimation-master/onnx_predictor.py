@@ -0,0 +1,73 @@
+# coding: utf-8
+"""
+    ONNX Runtime inference of the networks exported by export_onnx.py
+"""
+import threading
+
+import numpy as np
+
+
+def onnx_model_path(model_str, layer='fc1'):
+    """
+        file of the ONNX export of a checkpoint given as 'prefix,epoch'
+        (the format of --model): prefix-0000-fc1.onnx
+    """
+    prefix, epoch = model_str.split(',')
+    return '%s-%04d-%s.onnx' % (prefix, int(epoch), layer)
+
+
+class OnnxPredictor(object):
+    """
+        predict() of an ONNX model with the interface of CachedPredictor
+
+        An InferenceSession takes any batch size (and any image size for the
+        fully convolutional PNet) without re-binding, and run() may be called
+        from several threads at once.
+    """
+    def __init__(self, path, num_threads=0, providers=None):
+        """
+            Parameters:
+            ----------
+                path: string
+                    .onnx file
+                num_threads: int number
+                    intra-op threads, 0 lets ONNX Runtime decide
+                providers: list of string
+                    execution providers, CPU by default
+        """
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(path, sess_options=options,
+                                            providers=providers or ['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self._lock = threading.Lock()
+        self._stats = {'runs': 0, 'rows': 0}
+
+    def predict(self, data):
+        """
+            run the network
+
+        Parameters:
+        ----------
+            data: numpy array, n x c x h x w
+                input batch
+        Returns:
+        -------
+            list of numpy array
+                network outputs, in the order of the mxnet symbol heads
+        """
+        data = np.ascontiguousarray(data, dtype=np.float32)
+        outputs = self.session.run(None, {self.input_name: data})
+        with self._lock:
+            self._stats['runs'] += 1
+            self._stats['rows'] += data.shape[0]
+        return outputs
+
+    def get_stats(self):
+        """
+            run and row counts (an ONNX session never re-binds)
+        """
+        with self._lock:
+            return dict(self._stats)
@@ -4,65 +4,72 @@
 # Licensed under The MIT License [see LICENSE for details]
 # Written by Ross Girshick
 # --------------------------------------------------------
+# cython: boundscheck=False, wraparound=False, cdivision=True
 
 import numpy as np
 cimport numpy as np
 
-cdef inline np.float32_t max(np.float32_t a, np.float32_t b):
+cdef inline double dmax(double a, double b) nogil:
     return a if a >= b else b
 
-cdef inline np.float32_t min(np.float32_t a, np.float32_t b):
+cdef inline double dmin(double a, double b) nogil:
     return a if a <= b else b
 
-def cpu_nms(np.ndarray[np.float32_t, ndim=2] dets, np.float thresh):
-    cdef np.ndarray[np.float32_t, ndim=1] x1 = dets[:, 0]
-    cdef np.ndarray[np.float32_t, ndim=1] y1 = dets[:, 1]
-    cdef np.ndarray[np.float32_t, ndim=1] x2 = dets[:, 2]
-    cdef np.ndarray[np.float32_t, ndim=1] y2 = dets[:, 3]
-    cdef np.ndarray[np.float32_t, ndim=1] scores = dets[:, 4]
+cdef inline double overlap(double ix1, double iy1, double ix2, double iy2, double iarea,
+                           double[:, ::1] boxes, double[::1] areas, Py_ssize_t j,
+                           bint min_mode) nogil:
+    cdef double w = dmin(ix2, boxes[j, 2]) - dmax(ix1, boxes[j, 0]) + 1
+    if w <= 0:
+        # most pairs do not intersect, skip the division
+        return 0.0
+    cdef double h = dmax(0.0, dmin(iy2, boxes[j, 3]) - dmax(iy1, boxes[j, 1]) + 1)
+    cdef double inter = w * h
+    if min_mode:
+        return inter / dmin(iarea, areas[j])
+    return inter / (iarea + areas[j] - inter)
 
-    cdef np.ndarray[np.float32_t, ndim=1] areas = (x2 - x1 + 1) * (y2 - y1 + 1)
-    cdef np.ndarray[np.int_t, ndim=1] order = scores.argsort()[::-1]
+def nms_sorted(double[:, ::1] boxes, double thresh, bint min_mode=False):
+    """
+    greedy nms over boxes [[x1, y1, x2, y2]] already sorted by descending score
+    :param min_mode: overlap over the smaller box instead of the union
+    :return: positions (in the sorted order) of the kept boxes
+    """
+    cdef Py_ssize_t n = boxes.shape[0]
+    cdef Py_ssize_t i, j, t, nalive = n, nkeep = 0, write
+    cdef double ix1, iy1, ix2, iy2, iarea
 
-    cdef int ndets = dets.shape[0]
-    cdef np.ndarray[np.int_t, ndim=1] suppressed = \
-            np.zeros((ndets), dtype=np.int)
+    areas_arr = np.empty(n, dtype=np.float64)
+    alive_arr = np.arange(n, dtype=np.intp)
+    keep_arr = np.empty(n, dtype=np.intp)
+    cdef double[::1] areas = areas_arr
+    cdef Py_ssize_t[::1] alive = alive_arr
+    cdef Py_ssize_t[::1] keep = keep_arr
 
-    # nominal indices
-    cdef int _i, _j
-    # sorted indices
-    cdef int i, j
-    # temp variables for box i's (the box currently under consideration)
-    cdef np.float32_t ix1, iy1, ix2, iy2, iarea
-    # variables for computing overlap with box j (lower scoring box)
-    cdef np.float32_t xx1, yy1, xx2, yy2
-    cdef np.float32_t w, h
-    cdef np.float32_t inter, ovr
+    with nogil:
+        for i in range(n):
+            areas[i] = (boxes[i, 2] - boxes[i, 0] + 1) * (boxes[i, 3] - boxes[i, 1] + 1)
 
-    keep = []
-    for _i in range(ndets):
-        i = order[_i]
-        if suppressed[i] == 1:
-            continue
-        keep.append(i)
-        ix1 = x1[i]
-        iy1 = y1[i]
-        ix2 = x2[i]
-        iy2 = y2[i]
-        iarea = areas[i]
-        for _j in range(_i + 1, ndets):
-            j = order[_j]
-            if suppressed[j] == 1:
-                continue
-            xx1 = max(ix1, x1[j])
-            yy1 = max(iy1, y1[j])
-            xx2 = min(ix2, x2[j])
-            yy2 = min(iy2, y2[j])
-            w = max(0.0, xx2 - xx1 + 1)
-            h = max(0.0, yy2 - yy1 + 1)
-            inter = w * h
-            ovr = inter / (iarea + areas[j] - inter)
-            if ovr >= thresh:
-                suppressed[j] = 1
+        # alive holds the not yet suppressed boxes in score order, compacted after every kept box
+        while nalive > 0:
+            i = alive[0]
+            keep[nkeep] = i
+            nkeep = nkeep + 1
+            ix1 = boxes[i, 0]
+            iy1 = boxes[i, 1]
+            ix2 = boxes[i, 2]
+            iy2 = boxes[i, 3]
+            iarea = areas[i]
+            write = 0
+            for t in range(1, nalive):
+                j = alive[t]
+                if not overlap(ix1, iy1, ix2, iy2, iarea, boxes, areas, j, min_mode) > thresh:
+                    alive[write] = j
+                    write = write + 1
+            nalive = write
 
-    return keep
+    return keep_arr[:nkeep]
+
+def cpu_nms(np.ndarray dets, double thresh):
+    order = np.argsort(-dets[:, 4], kind='stable')
+    keep = nms_sorted(np.ascontiguousarray(dets[order, 0:4], dtype=np.float64), thresh)
+    return list(order[keep])
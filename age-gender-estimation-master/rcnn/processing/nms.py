@@ -1,20 +1,23 @@
 import numpy as np
-from ..cython.cpu_nms import cpu_nms
+try:
+    from ..cython.cpu_nms import nms_sorted
+except ImportError:
+    nms_sorted = None
 try:
     from ..cython.gpu_nms import gpu_nms
 except ImportError:
     gpu_nms = None
 
 
-def py_nms_wrapper(thresh):
+def py_nms_wrapper(thresh, mode='Union'):
     def _nms(dets):
-        return nms(dets, thresh)
+        return nms(dets, thresh, mode, backend='numpy')
     return _nms
 
 
-def cpu_nms_wrapper(thresh):
+def cpu_nms_wrapper(thresh, mode='Union'):
     def _nms(dets):
-        return cpu_nms(dets, thresh)
+        return nms(dets, thresh, mode)
     return _nms
 
 
@@ -27,38 +30,127 @@ def gpu_nms_wrapper(thresh, device_id):
         return cpu_nms_wrapper(thresh)
 
 
-def nms(dets, thresh):
+def nms_wrapper(thresh, mode='Union', device_id=None):
     """
-    greedily select boxes with high confidence and overlap with current maximum <= thresh
-    rule out overlap >= thresh
-    :param dets: [[x1, y1, x2, y2 score]]
-    :param thresh: retain overlap < thresh
-    :return: indexes to keep
+    nms function for a detector: gpu_nms when built and a gpu is used, else the best cpu backend
     """
-    x1 = dets[:, 0]
-    y1 = dets[:, 1]
-    x2 = dets[:, 2]
-    y2 = dets[:, 3]
-    scores = dets[:, 4]
+    if device_id is not None and mode == 'Union' and gpu_nms is not None:
+        return gpu_nms_wrapper(thresh, device_id)
+    return cpu_nms_wrapper(thresh, mode)
+
+
+def _sorted_boxes(dets):
+    """
+    order by descending score (stable, so every backend breaks ties alike) and the sorted boxes
+    """
+    order = np.argsort(-np.asarray(dets[:, 4]), kind='stable')
+    return order, np.ascontiguousarray(dets[order, 0:4], dtype=np.float64)
+
 
+def _nms_numpy(boxes, thresh, mode):
+    """
+    greedy nms over sorted boxes: coordinates and areas are computed once and
+    the remaining boxes are compacted with a mask after every kept box
+    """
+    x1, y1, x2, y2 = [boxes[:, k].copy() for k in range(4)]
     areas = (x2 - x1 + 1) * (y2 - y1 + 1)
-    order = scores.argsort()[::-1]
+    index = np.arange(boxes.shape[0])
 
     keep = []
-    while order.size > 0:
-        i = order[0]
-        keep.append(i)
-        xx1 = np.maximum(x1[i], x1[order[1:]])
-        yy1 = np.maximum(y1[i], y1[order[1:]])
-        xx2 = np.minimum(x2[i], x2[order[1:]])
-        yy2 = np.minimum(y2[i], y2[order[1:]])
-
-        w = np.maximum(0.0, xx2 - xx1 + 1)
-        h = np.maximum(0.0, yy2 - yy1 + 1)
+    while index.size > 0:
+        keep.append(index[0])
+        w = np.maximum(0.0, np.minimum(x2[0], x2[1:]) - np.maximum(x1[0], x1[1:]) + 1)
+        h = np.maximum(0.0, np.minimum(y2[0], y2[1:]) - np.maximum(y1[0], y1[1:]) + 1)
         inter = w * h
-        ovr = inter / (areas[i] + areas[order[1:]] - inter)
+        if mode == 'Min':
+            ovr = inter / np.minimum(areas[0], areas[1:])
+        else:
+            ovr = inter / (areas[0] + areas[1:] - inter)
+
+        mask = ~(ovr > thresh)
+        x1, y1, x2, y2, areas, index = [a[1:][mask] for a in (x1, y1, x2, y2, areas, index)]
+    return np.array(keep, dtype=np.intp)
+
+
+def py_nms(dets, thresh, mode='Union'):
+    """
+    reference greedy nms (the former helper.nms), one box at a time
+    :param dets: [[x1, y1, x2, y2 score]]
+    :param thresh: retain overlap <= thresh
+    :param mode: 'Union' or 'Min'
+    :return: indexes to keep
+    """
+    order, boxes = _sorted_boxes(dets)
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    area = (x2 - x1 + 1) * (y2 - y1 + 1)
+    # ascending, the best box is the last one
+    idxs = np.arange(boxes.shape[0])[::-1]
 
-        inds = np.where(ovr <= thresh)[0]
-        order = order[inds + 1]
+    pick = []
+    while len(idxs) > 0:
+        last = len(idxs) - 1
+        i = idxs[last]
+        pick.append(i)
 
-    return keep
+        xx1 = np.maximum(x1[i], x1[idxs[:last]])
+        yy1 = np.maximum(y1[i], y1[idxs[:last]])
+        xx2 = np.minimum(x2[i], x2[idxs[:last]])
+        yy2 = np.minimum(y2[i], y2[idxs[:last]])
+
+        w = np.maximum(0, xx2 - xx1 + 1)
+        h = np.maximum(0, yy2 - yy1 + 1)
+
+        inter = w * h
+        if mode == 'Min':
+            overlap = inter / np.minimum(area[i], area[idxs[:last]])
+        else:
+            overlap = inter / (area[i] + area[idxs[:last]] - inter)
+
+        idxs = np.delete(idxs, np.concatenate(([last],
+                                               np.where(overlap > thresh)[0])))
+
+    return order[np.array(pick, dtype=np.intp)]
+
+
+def nms(dets, thresh, mode='Union', backend='auto'):
+    """
+    greedily select boxes with high confidence and overlap with current maximum <= thresh
+    rule out overlap > thresh
+    :param dets: [[x1, y1, x2, y2 score]]
+    :param thresh: retain overlap <= thresh
+    :param mode: 'Union' (intersection over union) or 'Min' (intersection over the smaller box)
+    :param backend: 'auto' (cython if built, else numpy), 'cython', 'numpy' or 'python'
+    :return: indexes to keep, by descending score
+    """
+    if len(dets) == 0:
+        return np.zeros(0, dtype=np.intp)
+    if backend == 'python':
+        return py_nms(dets, thresh, mode)
+    if backend == 'auto':
+        backend = 'numpy' if nms_sorted is None else 'cython'
+
+    order, boxes = _sorted_boxes(dets)
+    if backend == 'cython':
+        if nms_sorted is None:
+            raise ImportError('rcnn.cython.cpu_nms is not built, run make')
+        keep = nms_sorted(boxes, thresh, mode == 'Min')
+    else:
+        keep = _nms_numpy(boxes, thresh, mode)
+    return order[keep]
+
+
+def batched_nms(dets, groups, thresh, mode='Union', backend='auto'):
+    """
+    nms within every group (image, pyramid level, ...) in one call, boxes of different groups never suppress each other
+    :param dets: [[x1, y1, x2, y2 score]]
+    :param groups: group id of every box
+    :return: indexes to keep, by group and then by descending score
+    """
+    groups = np.asarray(groups)
+    if len(dets) == 0:
+        return np.zeros(0, dtype=np.intp)
+    by_group = np.argsort(groups, kind='stable')
+    bounds = np.flatnonzero(np.diff(groups[by_group])) + 1
+    keep = [segment[nms(dets[segment], thresh, mode, backend)]
+            for segment in np.split(by_group, bounds)]
+    return np.concatenate(keep)
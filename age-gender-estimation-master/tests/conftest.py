@@ -0,0 +1,6 @@
+# coding: utf-8
+import os
+import sys
+
+# the modules of this repository are imported from its root, as the scripts do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
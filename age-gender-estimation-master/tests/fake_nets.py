@@ -0,0 +1,80 @@
+# coding: utf-8
+"""
+    numpy stand-ins for the MTCNN networks, so that the detector runs
+    without mxnet or ONNX Runtime
+
+    Every output is a fixed function of the input window (PNet) or of the
+    mean of each quadrant of the crop (RNet, ONet, LNet), so two code paths
+    that feed the networks the same pixels give the same boxes, and any
+    difference in the crops shows up in the results.
+"""
+import os
+
+import numpy as np
+
+from helper import pnet_output_size
+from mtcnn_detector import MtcnnDetector
+
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+class FakePNet(object):
+    """
+        stride 2 and a 12x12 receptive field like PNet, zero padded where the
+        last window of an odd side passes the border
+    """
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, data):
+        self.calls += 1
+        n, c, h, w = data.shape
+        oh, ow = pnet_output_size(h), pnet_output_size(w)
+        padded = np.zeros((n, c, max(h, 2 * (oh - 1) + 12), max(w, 2 * (ow - 1) + 12)), dtype=np.float64)
+        padded[:, :, :h, :w] = data
+        integral = np.zeros((n, c, padded.shape[2] + 1, padded.shape[3] + 1))
+        integral[:, :, 1:, 1:] = padded.cumsum(axis=2).cumsum(axis=3)
+        ys, xs = np.arange(oh) * 2, np.arange(ow) * 2
+        window = (integral[:, :, ys[:, None] + 12, xs[None, :] + 12] - integral[:, :, ys[:, None], xs[None, :] + 12]
+                  - integral[:, :, ys[:, None] + 12, xs[None, :]] + integral[:, :, ys[:, None], xs[None, :]]) / 144
+        score = sigmoid(8 * window[:, 0] + 4 * window[:, 1])
+        reg = np.stack([window[:, 1], window[:, 2], -window[:, 1], -window[:, 2]], axis=1) * 0.1
+        return [reg.astype(np.float32), np.stack([1 - score, score], axis=1).astype(np.float32)]
+
+
+class FakeStageNet(object):
+    """
+        RNet ('det2'), ONet ('det3') or LNet ('det4') outputs from the means
+        of the four quadrants of every channel of the crop
+    """
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+
+    def predict(self, data):
+        self.calls += 1
+        n, c, h, w = data.shape
+        features = data.astype(np.float64).reshape(n, c, 2, h // 2, 2, w // 2).mean(axis=(3, 5)).reshape(n, -1)
+        if self.name == 'det4':
+            # 5 landmarks x 3 channels, one (x, y) offset per landmark
+            return [(0.5 + 0.3 * np.tanh(features[:, 3 * k:3 * k + 2] * 4)).astype(np.float32)
+                    for k in range(5)]
+        score = sigmoid(2 + 6 * features[:, 0:4].mean(axis=1) - 6 * features[:, 8:12].mean(axis=1))
+        prob = np.stack([1 - score, score], axis=1).astype(np.float32)
+        reg = (0.05 * np.tanh(features[:, 0:4] * 4)).astype(np.float32)
+        if self.name == 'det2':
+            return [reg, prob]
+        landmarks = (0.5 + 0.3 * np.tanh(np.tile(features[:, 4:9], 2) * 4)).astype(np.float32)
+        return [landmarks, reg, prob]
+
+
+class FakeDetector(MtcnnDetector):
+    """
+        MtcnnDetector on the fake networks, model_folder is not read
+    """
+    @classmethod
+    def load_network(cls, prefix, device):
+        name = os.path.basename(prefix)
+        return FakePNet() if name == 'det1' else FakeStageNet(name)
@@ -0,0 +1,64 @@
+# coding: utf-8
+"""
+    batched crop_resize_normalize against the pad()/cv2.resize loop, on the
+    crops alone and on the boxes and landmarks of the whole cascade
+"""
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+import mtcnn_detector
+from helper import crop_resize_normalize, crop_resize_normalize_loop
+from fake_nets import FakeDetector
+
+IMAGE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sample-images', 'test1.jpg')
+
+
+def random_boxes(img, count, seed=0):
+    """
+        square boxes of 2 px to 1/2 image side, some of them partly or
+        entirely outside the image
+    """
+    rng = np.random.RandomState(seed)
+    height, width = img.shape[:2]
+    side = rng.randint(2, min(height, width) // 2, count)
+    x1 = rng.randint(-side, width + 2)
+    y1 = rng.randint(-side, height + 2)
+    return np.stack([x1, y1, x1 + side - 1, y1 + side - 1], axis=1).astype(np.float32)
+
+
+def crop_loop(img, boxes, size, out=None, tmp_dtype=np.float32):
+    chips = crop_resize_normalize_loop(img, np.asarray(boxes), size, tmp_dtype=tmp_dtype)
+    if out is None:
+        return chips
+    out[...] = chips
+    return out
+
+
+@pytest.mark.parametrize('size,tmp_dtype', [(24, np.uint8), (24, np.float32), (48, np.float32)])
+def test_crop_matches_loop(size, tmp_dtype):
+    img = cv2.imread(IMAGE)
+    boxes = random_boxes(img, 300)
+    expected = crop_resize_normalize_loop(img, boxes, size, tmp_dtype=tmp_dtype)
+
+    assert np.array_equal(crop_resize_normalize(img, boxes, size, tmp_dtype=tmp_dtype), expected)
+
+    # LNet fills 3 of its 15 channels per landmark
+    out = np.zeros((len(boxes), 15, size, size), dtype=np.float32)
+    crop_resize_normalize(img, boxes, size, out=out[:, 3:6], tmp_dtype=tmp_dtype)
+    assert np.array_equal(out[:, 3:6], expected)
+    assert not out[:, :3].any() and not out[:, 6:].any()
+
+
+def test_detect_face_matches_loop(monkeypatch):
+    img = cv2.resize(cv2.imread(IMAGE), (320, 240))
+    detector = FakeDetector(accurate_landmark=True)
+    boxes, points = detector.detect_face(img)
+    assert len(boxes) > 0
+
+    monkeypatch.setattr(mtcnn_detector, 'crop_resize_normalize', crop_loop)
+    expected_boxes, expected_points = detector.detect_face(img)
+    assert np.array_equal(boxes, expected_boxes)
+    assert np.array_equal(points, expected_points)
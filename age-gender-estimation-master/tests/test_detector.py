@@ -0,0 +1,38 @@
+# coding: utf-8
+"""
+    MtcnnDetector on numpy stand-in networks (fake_nets): the first stage
+    worker threads and the batched detect_faces give the results of a plain
+    detect_face
+"""
+import os
+
+import cv2
+import numpy as np
+
+from fake_nets import FakeDetector
+
+IMAGE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sample-images', 'test1.jpg')
+
+
+def assert_same(result, expected):
+    assert (result is None) == (expected is None)
+    if expected is not None:
+        assert np.array_equal(result[0], expected[0])
+        assert np.array_equal(result[1], expected[1])
+
+
+def test_first_stage_threads_match_serial():
+    images = [cv2.resize(cv2.imread(IMAGE), size) for size in [(320, 240), (200, 260), (400, 300)]]
+    serial = FakeDetector(accurate_landmark=True)
+    expected = [serial.detect_face(img) for img in images]
+    assert all(result is not None and len(result[0]) > 0 for result in expected)
+
+    threaded = FakeDetector(accurate_landmark=True, num_worker=4)
+    try:
+        for _ in range(3):
+            for img, reference in zip(images, expected):
+                assert_same(threaded.detect_face(img), reference)
+        for result, reference in zip(threaded.detect_faces(images), expected):
+            assert_same(result, reference)
+    finally:
+        threaded.close()
@@ -0,0 +1,61 @@
+# coding: utf-8
+"""
+    CachedPredictor called from several threads against serial calls, on a
+    small fully convolutional network shaped like PNet (needs mxnet)
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+mx = pytest.importorskip('mxnet')
+
+from executor_cache import CachedPredictor
+
+
+def save_pnet_like(prefix, seed=0):
+    data = mx.sym.Variable('data')
+    body = mx.sym.Activation(mx.sym.Convolution(data, num_filter=8, kernel=(3, 3), stride=(2, 2), name='conv1'),
+                             act_type='relu')
+    body = mx.sym.Activation(mx.sym.Convolution(body, num_filter=8, kernel=(5, 5), name='conv2'), act_type='relu')
+    reg = mx.sym.Convolution(body, num_filter=4, kernel=(1, 1), name='conv4_2')
+    # SoftmaxOutput brings a label argument like the MTCNN checkpoints
+    prob = mx.sym.SoftmaxOutput(mx.sym.Convolution(body, num_filter=2, kernel=(1, 1), name='conv4_1'),
+                                multi_output=True, name='prob1')
+    symbol = mx.sym.Group([reg, prob])
+
+    rng = np.random.RandomState(seed)
+    arg_shapes, _, _ = symbol.infer_shape(data=(1, 3, 12, 12))
+    arg_params = {name: mx.nd.array(rng.randn(*shape) * 0.3)
+                  for name, shape in zip(symbol.list_arguments(), arg_shapes)
+                  if name != 'data' and not name.endswith('label')}
+    mx.model.save_checkpoint(prefix, 1, symbol, arg_params, {})
+
+
+def test_concurrent_predict_matches_serial(tmp_path):
+    prefix = os.path.join(str(tmp_path), 'pnet')
+    save_pnet_like(prefix)
+
+    rng = np.random.RandomState(1)
+    # pyramid-like shapes and batch sizes, more shapes than executors kept
+    inputs = [rng.rand(n, 3, h, w).astype(np.float32) * 2 - 1
+              for n, h, w in [(1, 12, 12), (1, 57, 43), (3, 24, 24), (20, 24, 24), (1, 120, 90), (40, 24, 24)]]
+
+    serial = CachedPredictor(prefix, 1, max_batch=16, max_executors=4)
+    expected = [serial.predict(x) for x in inputs]
+
+    predictor = CachedPredictor(prefix, 1, max_batch=16, max_executors=4)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(predictor.predict, inputs * 8))
+
+    for i, outputs in enumerate(results):
+        reference = expected[i % len(inputs)]
+        assert len(outputs) == 2
+        for output, ref in zip(outputs, reference):
+            assert output.shape[0] == inputs[i % len(inputs)].shape[0]
+            assert np.array_equal(output, ref)
+
+    stats = predictor.get_stats()
+    assert stats['forwards'] == 8 * serial.get_stats()['forwards']
+    assert stats['executors'] <= 4
@@ -0,0 +1,83 @@
+# coding: utf-8
+"""
+    face_align against transforms and chips known in advance
+"""
+import numpy as np
+
+from face_align import similarity_transform, warp_faces
+
+# 5 point template of the 112 x 96 chips (face_preprocess.landmark_template)
+TEMPLATE = np.array([
+    [30.2946, 51.6963],
+    [65.5318, 51.5014],
+    [48.0252, 71.7366],
+    [33.5493, 92.3655],
+    [62.7299, 92.2041]])
+
+# scale 2, rotation 30 degrees, translation (10, -5)
+FORWARD = np.array([
+    [1.7320508075688772, -1.0, 10.0],
+    [1.0, 1.7320508075688772, -5.0]])
+# its inverse: scale 0.5, rotation -30 degrees
+INVERSE = np.array([
+    [0.4330127018922193, 0.25, -3.0801270189221932],
+    [-0.25, 0.4330127018922193, 4.665063509461097]])
+
+
+def apply(M, points):
+    return points.dot(M[:, 0:2].T) + M[:, 2]
+
+
+def test_known_transform():
+    landmarks = apply(FORWARD, TEMPLATE)
+    assert np.allclose(landmarks[0], [10.775, 114.835], atol=1e-3)
+
+    assert np.allclose(similarity_transform(TEMPLATE, landmarks), FORWARD, atol=1e-9)
+    assert np.allclose(similarity_transform(landmarks, TEMPLATE), INVERSE, atol=1e-9)
+
+
+def test_batch_of_faces():
+    # face 0 as above, face 1 only shifted, face 2 halved and turned by 90 degrees
+    expected = np.array([
+        INVERSE,
+        [[1.0, 0.0, -7.0], [0.0, 1.0, 3.0]],
+        [[0.0, 2.0, 4.0], [-2.0, 0.0, 100.0]]])
+    shift = TEMPLATE + [7.0, -3.0]
+    turned = np.stack([(100.0 - TEMPLATE[:, 1]) / 2, (TEMPLATE[:, 0] - 4.0) / 2], axis=1)
+    landmarks = np.stack([apply(FORWARD, TEMPLATE), shift, turned])
+
+    M = similarity_transform(landmarks, TEMPLATE)
+    assert M.shape == (3, 2, 3)
+    assert np.allclose(M, expected, atol=1e-9)
+
+
+def test_rigid_and_degenerate():
+    # without scale the rotation of FORWARD is found, the scale of 2 is not
+    M = similarity_transform(TEMPLATE, apply(FORWARD, TEMPLATE), estimate_scale=False)
+    assert np.allclose(M[:, 0:2], FORWARD[:, 0:2] / 2, atol=1e-9)
+
+    # all landmarks in one place: a translation onto the template center
+    M = similarity_transform(np.full((5, 2), 20.0), TEMPLATE)
+    assert np.allclose(M, [[1.0, 0.0, 28.02616], [0.0, 1.0, 51.90078]], atol=1e-9)
+
+
+def test_warp_faces():
+    img = np.zeros((40, 60, 3), dtype=np.uint8)
+    img[10, 20] = (255, 128, 1)
+    img[30, 50] = (9, 9, 9)
+    transforms = np.array([
+        [[1.0, 0.0, -15.0], [0.0, 1.0, -5.0]],
+        [[0.0, 1.0, -5.0], [1.0, 0.0, -18.0]]])
+
+    out = np.full((2, 8, 8, 3), 77, dtype=np.uint8)
+    chips = warp_faces(img, transforms, (8, 8), out=out, border_value=0.0)
+    assert chips is out
+
+    # a shift by (-15, -5) moves (20, 10) to (5, 5)
+    expected = np.zeros((8, 8, 3), dtype=np.uint8)
+    expected[5, 5] = (255, 128, 1)
+    assert np.array_equal(chips[0], expected)
+    # x' = y - 5, y' = x - 18 (transposed) moves (20, 10) to (5, 2), (50, 30) leaves the chip
+    expected = np.zeros((8, 8, 3), dtype=np.uint8)
+    expected[2, 5] = (255, 128, 1)
+    assert np.array_equal(chips[1], expected)
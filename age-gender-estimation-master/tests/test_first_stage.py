@@ -0,0 +1,45 @@
+# coding: utf-8
+"""
+    packed pyramid (one PNet forward over a canvas) against per-scale forwards
+
+    FakePNet (fake_nets) stands in for the mxnet/ONNX network: like PNet it
+    has a stride of 2 and a 12x12 receptive field, and it pads the input with
+    zeros (mid gray, the guard padding of the canvas) where the last window
+    of an odd side passes the border. Every cell is a fixed function of its
+    window, so both paths have to give the same boxes at every level.
+"""
+import os
+import types
+
+import cv2
+import numpy as np
+import pytest
+
+from helper import detect_first_stage_packed, detect_first_stage_scales
+from mtcnn_detector import MtcnnDetector
+from fake_nets import FakePNet
+
+IMAGE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sample-images', 'test1.jpg')
+
+
+def pyramid(height, width, minsize=20):
+    return MtcnnDetector.pyramid_scales(types.SimpleNamespace(minsize=minsize, factor=0.709), height, width)
+
+
+@pytest.mark.parametrize('size', [(120, 160), (133, 200), (161, 121), (240, 317)])
+def test_packed_pyramid_matches_per_scale(size):
+    img = cv2.resize(cv2.imread(IMAGE), (size[1], size[0]))
+    scales = pyramid(*size)
+    assert len(scales) > 3
+
+    net = FakePNet()
+    reference = detect_first_stage_scales(img, net, scales, 0.6)
+    packed = detect_first_stage_packed(img, net, scales, 0.6)
+
+    assert net.calls == len(scales) + 1
+    assert sum(boxes is not None for boxes in reference) > 1
+    for expected, boxes in zip(reference, packed):
+        if expected is None:
+            assert boxes is None
+        else:
+            assert boxes is not None and np.array_equal(expected, boxes)
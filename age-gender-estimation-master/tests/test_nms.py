@@ -0,0 +1,69 @@
+# coding: utf-8
+"""
+    rcnn.processing.nms backends against the python reference (the former
+    helper.nms), the cython backend only when it is built (make)
+"""
+import numpy as np
+import pytest
+
+from rcnn.processing import nms as nms_module
+
+BACKENDS = ['numpy'] + ([] if nms_module.nms_sorted is None else ['cython'])
+
+
+def random_dets(count, layout, seed=0):
+    """
+        clustered: jittered boxes around a few faces, like PNet candidates
+        sparse: boxes spread over the image, most of them are kept
+    """
+    rng = np.random.RandomState(seed)
+    if layout == 'clustered':
+        centers = rng.rand(max(1, count // 50), 2) * 500
+        side = rng.rand(count) * 100 + 12
+        xy = centers[rng.randint(0, len(centers), count)] + rng.randn(count, 2) * side[:, None] * 0.15
+        wh = np.stack([side, side], axis=1)
+    else:
+        xy = rng.rand(count, 2) * 1000
+        wh = rng.rand(count, 2) * 80 + 12
+    # rounded scores so that there are ties
+    score = np.round(rng.rand(count, 1), 2)
+    return np.hstack([xy, xy + wh, score]).astype(np.float32)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('mode', ['Union', 'Min'])
+@pytest.mark.parametrize('layout', ['clustered', 'sparse'])
+def test_backends_match_reference(backend, mode, layout):
+    for count, seed in [(1, 0), (2, 1), (40, 2), (500, 3)]:
+        dets = random_dets(count, layout, seed)
+        for thresh in (0.3, 0.5, 0.7):
+            expected = nms_module.nms(dets, thresh, mode, backend='python')
+            keep = nms_module.nms(dets, thresh, mode, backend=backend)
+            assert keep.dtype == np.intp
+            assert np.array_equal(keep, expected)
+
+
+def test_known_picks():
+    dets = np.array([
+        [0, 0, 9, 9, 0.9],
+        [1, 1, 10, 10, 0.8],     # IoU 0.68 with box 0
+        [0, 0, 4, 9, 0.7],       # inside box 0: IoU 0.5, Min 1.0
+        [20, 20, 29, 29, 0.95],
+        [0, 0, 9, 9, 0.9]])      # tie with box 0, kept after it
+    for backend in ['python'] + BACKENDS:
+        assert nms_module.nms(dets, 0.5, 'Union', backend).tolist() == [3, 0, 2]
+        assert nms_module.nms(dets, 0.5, 'Min', backend).tolist() == [3, 0]
+        assert nms_module.nms(dets, 0.7, 'Union', backend).tolist() == [3, 0, 1, 2]
+        assert nms_module.nms(np.zeros((0, 5)), 0.5, 'Union', backend).size == 0
+
+
+def test_batched_nms():
+    dets = random_dets(300, 'clustered', seed=4)
+    groups = np.random.RandomState(5).randint(0, 4, len(dets))
+    keep = nms_module.batched_nms(dets, groups, 0.5)
+
+    expected = []
+    for group in range(4):
+        index = np.flatnonzero(groups == group)
+        expected.extend(index[nms_module.nms(dets[index], 0.5, backend='python')])
+    assert np.array_equal(keep, expected)